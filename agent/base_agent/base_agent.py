@@ -8,9 +8,10 @@ import json
 import os
 # Import project tools
 import sys
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
 from langchain.agents import create_agent
@@ -95,9 +96,20 @@ class DeepSeekChatOpenAI(ChatOpenAI):
 
 
 from prompts.agent_prompt import STOP_SIGNAL, get_agent_system_prompt
+from tools.agent_context import agent_context, apply_context_headers
+from tools.context_budget import ContextBudget
 from tools.general_tools import (extract_conversation, extract_tool_messages,
                                  get_config_value, write_config_value)
+from tools.llm_cache import REPLAY_API_KEY, is_llm_replay, wrap_llm_cache
+from tools.local_tools import split_mcp_config
+from tools.mcp_client import create_mcp_client
+from tools.mock_llm import create_mock_chat_model, is_mock_model
+from tools.position_ledger import (get_last_ledger_date, get_ledger_backend,
+                                   ledger_exists, read_ledger_records,
+                                   write_initial_position)
 from tools.price_tools import add_no_trade_record
+from tools.prompt_context import precompute_prompt_context
+from tools.tool_concurrency import limit_tool_concurrency, load_server_tools
 
 # Load environment variables
 load_dotenv()
@@ -235,7 +247,15 @@ class BaseAgent:
         initial_cash: float = 10000.0,
         init_date: str = "2025-10-13",
         market: str = "us",
-        verbose: bool = False
+        verbose: bool = False,
+        mcp_session_mode: str = "per_call",
+        in_process_tools: Union[bool, List[str]] = False,
+        compact_prompt: bool = False,
+        prompt_top_k: Optional[int] = None,
+        context_budget: Optional[int] = None,
+        keep_recent_steps: int = 2,
+        llm_cache: Optional[Dict[str, Any]] = None,
+        tool_concurrency: Union[int, Dict[str, int], None] = None,
     ):
         """
         Initialize BaseAgent
@@ -255,6 +275,18 @@ class BaseAgent:
             init_date: Initialization date
             market: Market type, "us" for US stocks or "cn" for A-shares
             verbose: Enable verbose output for LangChain agent
+            mcp_session_mode: "per_call" (new MCP session per tool call) or "persistent" (long-lived, reused sessions)
+            in_process_tools: Call the local tool servers (math, prices, indicators, trade) in process
+                instead of over MCP; True for all of them or a list of MCP server names
+            compact_prompt: Render the system prompt with non-zero holdings and one price table
+            prompt_top_k: With compact_prompt, keep only the K largest movers (plus holdings) in the table
+            context_budget: Token budget for the system prompt plus session history sent per step;
+                older tool results are deduplicated, truncated or summarized beyond it (None: no limit)
+            keep_recent_steps: Most recent tool results always sent verbatim under context_budget
+            llm_cache: Record/replay cache for the chat model, e.g. {"mode": "record", "path": ...};
+                None disables it (see tools/llm_cache.py)
+            tool_concurrency: Maximum concurrent tool calls per MCP server, a number or {server: limit};
+                trade tools always run one at a time (see tools/tool_concurrency.py)
         """
         self.signature = signature
         self.basemodel = basemodel
@@ -282,6 +314,14 @@ class BaseAgent:
 
         # Set MCP configuration
         self.mcp_config = mcp_config or self._get_default_mcp_config()
+        self.mcp_session_mode = mcp_session_mode
+        self.in_process_tools = in_process_tools
+        self.compact_prompt = compact_prompt
+        self.prompt_top_k = prompt_top_k
+        self.context_budget = context_budget
+        self.keep_recent_steps = keep_recent_steps
+        self.llm_cache = llm_cache
+        self.tool_concurrency = tool_concurrency
 
         # Set log path
         self.base_log_path = log_path or "./data/agent_data"
@@ -302,6 +342,14 @@ class BaseAgent:
         self.model: Optional[ChatOpenAI] = None
         self.agent: Optional[Any] = None
 
+        # Per-session system prompt and invocation config for the agent graph built in initialize()
+        self.system_prompt: Optional[str] = None
+        self.session_config: Dict[str, Any] = {}
+
+        # Caps concurrent agent steps (LLM round trips) across agents sharing one event loop;
+        # set by the in-process multi-agent runner in main_parrallel.py
+        self.llm_semaphore: Optional[asyncio.Semaphore] = None
+
         # Data paths
         self.data_path = os.path.join(self.base_log_path, self.signature)
         self.position_file = os.path.join(self.data_path, "position", "position.jsonl")
@@ -321,12 +369,26 @@ class BaseAgent:
                 "transport": "streamable_http",
                 "url": f"http://localhost:{os.getenv('SEARCH_HTTP_PORT', '8004')}/mcp",
             },
+            "indicators": {
+                "transport": "streamable_http",
+                "url": f"http://localhost:{os.getenv('INDICATOR_HTTP_PORT', '8006')}/mcp",
+            },
             "trade": {
                 "transport": "streamable_http",
                 "url": f"http://localhost:{os.getenv('TRADE_HTTP_PORT', '8002')}/mcp",
             },
         }
 
+    def _agent_context(self, today_date: Optional[str] = None) -> Dict[str, Any]:
+        """Context sent to the MCP tool servers with every request (see tools/agent_context.py)"""
+        return {
+            "SIGNATURE": self.signature,
+            "TODAY_DATE": today_date,
+            "LOG_PATH": self.base_log_path,
+            "MARKET": self.market,
+            "LEDGER_BACKEND": get_ledger_backend(),
+        }
+
     async def initialize(self) -> None:
         """Initialize MCP client and AI model"""
         print(f"🚀 Initializing agent: {self.signature}")
@@ -342,7 +404,8 @@ class BaseAgent:
             print("🔍 LangChain verbose mode enabled (with debug)")
 
         # Validate OpenAI configuration
-        if not self.openai_api_key:
+        # Replayed runs and the mock model never reach the provider, so they need no API key
+        if not self.openai_api_key and not is_llm_replay(self.llm_cache) and not is_mock_model(self.basemodel):
             raise ValueError(
                 "❌ OpenAI API key not set. Please configure OPENAI_API_KEY in environment or config file."
             )
@@ -350,11 +413,22 @@ class BaseAgent:
             print("⚠️  OpenAI base URL not set, using default")
 
         try:
-            # Create MCP client
-            self.client = MultiServerMCPClient(self.mcp_config)
-
-            # Get tools
-            self.tools = await self.client.get_tools()
+            if self.client is None:
+                # Create MCP client
+                apply_context_headers(self.mcp_config, self._agent_context())
+                remote_config, local_servers = split_mcp_config(self.mcp_config, self.in_process_tools)
+                self.client = create_mcp_client(remote_config, self.mcp_session_mode)
+
+                # Get tools (MCP tools, plus local tool modules bound in process), with read-only calls
+                # capped per server and trade calls serialized
+                self.tools = limit_tool_concurrency(
+                    await load_server_tools(self.client, local_servers), self.signature, self.tool_concurrency
+                )
+            elif self.tools is None:
+                # Shared client attached by the in-process multi-agent runner
+                self.tools = limit_tool_concurrency(
+                    await load_server_tools(self.client), self.signature, self.tool_concurrency
+                )
             if not self.tools:
                 print("⚠️  Warning: No MCP tools loaded. MCP services may not be running.")
                 print(f"   MCP configuration: {self.mcp_config}")
@@ -379,11 +453,14 @@ class BaseAgent:
         try:
             # Create AI model - use custom DeepSeekChatOpenAI for DeepSeek models
             # to handle tool_calls.args format differences (JSON string vs dict)
-            if "deepseek" in self.basemodel.lower():
+            if is_mock_model(self.basemodel):
+                # Scripted trades, for benchmarking the agent loop without a provider
+                self.model = create_mock_chat_model(self.basemodel, self.stock_symbols, self.market)
+            elif "deepseek" in self.basemodel.lower():
                 self.model = DeepSeekChatOpenAI(
                     model=self.basemodel,
                     base_url=self.openai_base_url,
-                    api_key=self.openai_api_key,
+                    api_key=self.openai_api_key or REPLAY_API_KEY,
                     max_retries=3,
                     timeout=30,
                 )
@@ -391,15 +468,19 @@ class BaseAgent:
                 self.model = ChatOpenAI(
                     model=self.basemodel,
                     base_url=self.openai_base_url,
-                    api_key=self.openai_api_key,
+                    api_key=self.openai_api_key or REPLAY_API_KEY,
                     max_retries=3,
                     timeout=30,
                 )
         except Exception as e:
             raise RuntimeError(f"❌ Failed to initialize AI model: {e}")
 
-        # Note: agent will be created in run_trading_session() based on specific date
-        # because system_prompt needs the current date and price information
+        # Record/replay LLM cache, if configured
+        self.model = wrap_llm_cache(self.model, self.llm_cache, self.basemodel)
+
+        # Build the agent graph once; run_trading_session only swaps the system prompt, which is
+        # sent as the first message of every invocation
+        self.agent = create_agent(self.model, tools=self.tools)
 
         print(f"✅ Agent {self.signature} initialization completed")
 
@@ -420,13 +501,22 @@ class BaseAgent:
         with open(log_file, "a", encoding="utf-8") as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
 
+    def _with_system_prompt(self, message: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Prepend the current session's system prompt to the conversation"""
+        if not self.system_prompt:
+            return message
+        return [{"role": "system", "content": self.system_prompt}, *message]
+
     async def _ainvoke_with_retry(self, message: List[Dict[str, str]]) -> Any:
         """Agent invocation with retry"""
         for attempt in range(1, self.max_retries + 1):
             try:
                 if self.verbose:
                     print(f"🤖 Calling LLM API ({self.basemodel})...")
-                return await self.agent.ainvoke({"messages": message}, {"recursion_limit": 100})
+                async with self.llm_semaphore or nullcontext():
+                    return await self.agent.ainvoke(
+                        {"messages": self._with_system_prompt(message)}, {"recursion_limit": 100, **self.session_config}
+                    )
             except Exception as e:
                 if attempt == self.max_retries:
                     raise e
@@ -447,20 +537,18 @@ class BaseAgent:
         log_file = self._setup_logging(today_date)
         write_config_value("LOG_FILE", log_file)
         # Update system prompt
-        self.agent = create_agent(
-            self.model,
-            tools=self.tools,
-            system_prompt=get_agent_system_prompt(today_date, self.signature, self.market, self.stock_symbols),
+        self.system_prompt = get_agent_system_prompt(
+            today_date, self.signature, self.market, self.stock_symbols, compact=self.compact_prompt, top_k=self.prompt_top_k
         )
-        # If verbose, try to attach console callbacks to the agent itself
+        # If verbose, attach console callbacks to this session's invocations
         if self.verbose and _ConsoleHandler is not None:
             try:
                 handler = _ConsoleHandler()
-                self.agent = self.agent.with_config({
+                self.session_config = {
                     "callbacks": [handler],
                     "tags": [self.signature, today_date],
                     "run_name": f"{self.signature}-session"
-                })
+                }
             except Exception:
                 pass
         elif self.verbose and _ConsoleHandler is None:
@@ -469,6 +557,8 @@ class BaseAgent:
         # Initial user query
         user_query = [{"role": "user", "content": f"Please analyze and update today's ({today_date}) positions."}]
         message = user_query.copy()
+        # Older tool results are compacted beyond the context budget; the log keeps them in full
+        budget = ContextBudget(self.context_budget, self.keep_recent_steps, self.system_prompt)
 
         # Log initial message
         self._log_message(log_file, user_query)
@@ -481,7 +571,7 @@ class BaseAgent:
 
             try:
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(budget.fit(message))
 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
@@ -535,9 +625,9 @@ class BaseAgent:
 
     def register_agent(self) -> None:
         """Register new agent, create initial positions"""
-        # Check if position.jsonl file already exists
-        if os.path.exists(self.position_file):
-            print(f"⚠️ Position file {self.position_file} already exists, skipping registration")
+        # Check if the agent already has a position ledger
+        if ledger_exists(self.signature, self.base_log_path):
+            print(f"⚠️ Position ledger for {self.signature} already exists, skipping registration")
             return
 
         # Ensure directory structure exists
@@ -550,11 +640,12 @@ class BaseAgent:
         init_position = {symbol: 0 for symbol in self.stock_symbols}
         init_position["CASH"] = self.initial_cash
 
-        with open(self.position_file, "w") as f:  # Use "w" mode to ensure creating new file
-            f.write(json.dumps({"date": self.init_date, "id": 0, "positions": init_position}) + "\n")
+        ledger_location = write_initial_position(
+            self.signature, {"date": self.init_date, "id": 0, "positions": init_position}, self.base_log_path
+        )
 
         print(f"✅ Agent {self.signature} registration completed")
-        print(f"📁 Position file: {self.position_file}")
+        print(f"📁 Position ledger: {ledger_location}")
         currency_symbol = "¥" if self.market == "cn" else "$"
         print(f"💰 Initial cash: {currency_symbol}{self.initial_cash:,.2f}")
         print(f"📊 Number of stocks: {len(self.stock_symbols)}")
@@ -570,27 +661,16 @@ class BaseAgent:
         Returns:
             List of trading dates (excluding weekends and holidays)
         """
-        from tools.price_tools import is_trading_day
+        from tools.price_tools import get_trading_calendar
 
-        dates = []
         max_date = None
 
-        if not os.path.exists(self.position_file):
+        if not ledger_exists(self.signature, self.base_log_path):
             self.register_agent()
             max_date = init_date
         else:
-            # Read existing position file, find latest date
-            with open(self.position_file, "r") as f:
-                for line in f:
-                    doc = json.loads(line)
-                    current_date = doc["date"]
-                    if max_date is None:
-                        max_date = current_date
-                    else:
-                        current_date_obj = datetime.strptime(current_date, "%Y-%m-%d")
-                        max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
-                        if current_date_obj > max_date_obj:
-                            max_date = current_date
+            # Latest date already recorded in the position ledger
+            max_date = get_last_ledger_date(self.signature, self.base_log_path) or init_date
 
         # Check if new dates need to be processed
         max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
@@ -599,16 +679,9 @@ class BaseAgent:
         if end_date_obj <= max_date_obj:
             return []
 
-        # Generate trading date list, filtered by actual trading days
-        trading_dates = []
-        current_date = max_date_obj + timedelta(days=1)
-
-        while current_date <= end_date_obj:
-            date_str = current_date.strftime("%Y-%m-%d")
-            # Check if this is an actual trading day in merged.jsonl
-            if is_trading_day(date_str, market=self.market):
-                trading_dates.append(date_str)
-            current_date += timedelta(days=1)
+        # Trading days after the last processed date, up to and including end_date
+        trading_calendar = get_trading_calendar(market=self.market, granularity="daily")
+        trading_dates = trading_calendar.range(max_date, end_date, include_start=False)
 
         return trading_dates
 
@@ -648,6 +721,11 @@ class BaseAgent:
             return
 
         print(f"📊 Trading days to process: {trading_dates}")
+        # Prompt prices of the whole range in one pass; sessions then only look them up
+        try:
+            precompute_prompt_context(trading_dates, self.market)
+        except Exception as e:
+            print(f"⚠️  Could not precompute prompt prices: {e}")
 
         # Process each trading day
         for date in trading_dates:
@@ -657,8 +735,13 @@ class BaseAgent:
             write_config_value("TODAY_DATE", date)
             write_config_value("SIGNATURE", self.signature)
 
+            # Per-request context for the tool servers; the runtime env file above is the fallback
+            context = self._agent_context(date)
+            apply_context_headers(self.mcp_config, context)
+
             try:
-                await self.run_with_retry(date)
+                with agent_context(**context):
+                    await self.run_with_retry(date)
             except Exception as e:
                 print(f"❌ Error processing {self.signature} - Date: {date}")
                 print(e)
@@ -668,13 +751,10 @@ class BaseAgent:
 
     def get_position_summary(self) -> Dict[str, Any]:
         """Get position summary"""
-        if not os.path.exists(self.position_file):
+        if not ledger_exists(self.signature, self.base_log_path):
             return {"error": "Position file does not exist"}
 
-        positions = []
-        with open(self.position_file, "r") as f:
-            for line in f:
-                positions.append(json.loads(line))
+        positions = read_ledger_records(self.signature, self.base_log_path)
 
         if not positions:
             return {"error": "No position records"}
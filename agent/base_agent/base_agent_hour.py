@@ -12,7 +12,6 @@ from pathlib import Path
 
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain_openai import ChatOpenAI
-from langchain.agents import create_agent
 from dotenv import load_dotenv
 
 # Import project tools
@@ -20,8 +19,11 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 
+from tools.agent_context import agent_context, apply_context_headers
+from tools.context_budget import ContextBudget
 from tools.general_tools import extract_conversation, extract_tool_messages, get_config_value, write_config_value
 from tools.price_tools import add_no_trade_record
+from tools.prompt_context import precompute_prompt_context
 from prompts.agent_prompt import get_agent_system_prompt, STOP_SIGNAL
 
 # Load environment variables
@@ -53,23 +55,20 @@ class BaseAgent_Hour(BaseAgent):
         write_config_value("LOG_FILE", log_file)
         
         # Update system prompt
-        from langchain.agents import create_agent
-        self.agent = create_agent(
-            self.model,
-            tools=self.tools,
-            system_prompt=get_agent_system_prompt(today_date, self.signature),
+        self.system_prompt = get_agent_system_prompt(
+            today_date, self.signature, compact=self.compact_prompt, top_k=self.prompt_top_k
         )
-        # If verbose, try to attach console callbacks to the agent itself
+        # If verbose, attach console callbacks to this session's invocations
         if getattr(self, "verbose", False):
             try:
                 from agent.base_agent.base_agent import _ConsoleHandler  # reuse resolved handler
                 if _ConsoleHandler is not None:
                     handler = _ConsoleHandler()
-                    self.agent = self.agent.with_config({
+                    self.session_config = {
                         "callbacks": [handler],
                         "tags": [self.signature, today_date],
                         "run_name": f"{self.signature}-session"
-                    })
+                    }
                 else:
                     print("⚠️ Verbose requested but no StdOut/Console callback handler found in current LangChain version.")
             except Exception:
@@ -78,6 +77,8 @@ class BaseAgent_Hour(BaseAgent):
         # Initial user query
         user_query = [{"role": "user", "content": f"Please analyze and update today's ({today_date}) positions."}]
         message = user_query.copy()
+        # Older tool results are compacted beyond the context budget; the log keeps them in full
+        budget = ContextBudget(self.context_budget, self.keep_recent_steps, self.system_prompt)
         
         # Log initial message
         self._log_message(log_file, user_query)
@@ -90,7 +91,7 @@ class BaseAgent_Hour(BaseAgent):
             
             try:
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(budget.fit(message))
                 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
@@ -150,58 +151,21 @@ class BaseAgent_Hour(BaseAgent):
         else:
             raise ValueError("Only support hour-level trading. Please use YYYY-MM-DD HH:MM:SS format.")
         
-        # Get merged.jsonl path
-        base_dir = Path(__file__).resolve().parents[2]
-        merged_file = base_dir / "data" / "merged.jsonl"
-        
-        if not merged_file.exists():
-            return []
-        
-        # Collect all timestamps from merged.jsonl
-        all_timestamps = set()
-        
-        with merged_file.open("r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                try:
-                    doc = json.loads(line)
-                    # Find all keys starting with "Time Series"
-                    for key, value in doc.items():
-                        if key.startswith("Time Series"):
-                            if isinstance(value, dict):
-                                all_timestamps.update(value.keys())
-                            break
-                except Exception:
-                    continue
-        
-        if not all_timestamps:
+        from tools.position_ledger import get_last_ledger_date, ledger_exists
+        from tools.price_tools import get_trading_calendar
+
+        # Sorted intraday timestamps of the market's price file
+        trading_calendar = get_trading_calendar(market="us", granularity="hourly")
+
+        if not trading_calendar:
             return []
         # Determine min_datetime based on init_date and last processed date in position file
         min_datetime = init_dt
         
         last_processed_dt = None
-        if os.path.exists(self.position_file):
-            max_date = None
-            with open(self.position_file, "r") as f:
-                for line in f:
-                    doc = json.loads(line)
-                    current_date = doc['date']
-                    if max_date is None:
-                        max_date = current_date
-                    else:
-                        if ' ' in current_date:
-                            current_date_obj = datetime.strptime(current_date, "%Y-%m-%d %H:%M:%S")
-                        else:
-                            current_date_obj = datetime.strptime(current_date, "%Y-%m-%d")
-                        
-                        if ' ' in max_date:
-                            max_date_obj = datetime.strptime(max_date, "%Y-%m-%d %H:%M:%S")
-                        else:
-                            max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
-                        
-                        if current_date_obj > max_date_obj:
-                            max_date = current_date
+        if ledger_exists(self.signature, self.base_log_path):
+            # Latest timestamp already recorded in the position ledger
+            max_date = get_last_ledger_date(self.signature, self.base_log_path)
             
             if max_date:
                 if has_time:
@@ -220,34 +184,12 @@ class BaseAgent_Hour(BaseAgent):
             if not has_time:
                 last_processed_dt = last_processed_dt.date()
         
-        # Filter timestamps within the range
-        trading_times = []
-        if not has_time:
-            min_datetime = min_datetime.date()
-            end_dt = end_dt.date()
-    
-        for ts_str in all_timestamps:
-            try:
-                if has_time:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                else:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d").date()
-                # Check if timestamp is in range with boundary rules
-                in_lower = False
-                if last_processed_dt is None:
-                    in_lower = ts_dt >= min_datetime
-                else:
-                    in_lower = ts_dt > min_datetime
-                if in_lower and ts_dt <= end_dt:
-                    trading_times.append(ts_str)
-                    
-            except Exception as e:
-                print(f"❌ Error processing timestamp: {ts_str}")
-                print(e)
-                continue
-        
-        # Sort and remove duplicates
-        trading_times = sorted(list(set(trading_times)))
+        # Filter timestamps within the range: strictly after the last processed time, up to end_dt
+        trading_times = trading_calendar.range(
+            min_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+            end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            include_start=last_processed_dt is None,
+        )
         if REGISTER:
             print("REGISTER date will not be considered")
             trading_times = trading_times[1:]
@@ -270,6 +212,11 @@ class BaseAgent_Hour(BaseAgent):
             return
         
         print(f"📊 Trading days to process: {trading_dates}")
+        # Prompt prices of the whole range in one pass; sessions then only look them up
+        try:
+            precompute_prompt_context(trading_dates, self.market)
+        except Exception as e:
+            print(f"⚠️  Could not precompute prompt prices: {e}")
         
         # Process each trading day
         for date in trading_dates:
@@ -279,8 +226,13 @@ class BaseAgent_Hour(BaseAgent):
             write_config_value("TODAY_DATE", date)
             write_config_value("SIGNATURE", self.signature)
             
+            # Per-request context for the tool servers; the runtime env file above is the fallback
+            context = self._agent_context(date)
+            apply_context_headers(self.mcp_config, context)
+
             try:
-                await self.run_with_retry(date)
+                with agent_context(**context):
+                    await self.run_with_retry(date)
             except Exception as e:
                 print(f"❌ Error processing {self.signature} - Date: {date}")
                 print(e)
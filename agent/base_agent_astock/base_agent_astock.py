@@ -11,7 +11,7 @@ import os
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
 from langchain.agents import create_agent
@@ -84,9 +84,20 @@ class DeepSeekChatOpenAI(ChatOpenAI):
 
 from prompts.agent_prompt_astock import (STOP_SIGNAL,
                                          get_agent_system_prompt_astock)
+from tools.agent_context import agent_context, apply_context_headers
+from tools.context_budget import ContextBudget
 from tools.general_tools import (extract_conversation, extract_tool_messages,
                                  get_config_value, write_config_value)
+from tools.llm_cache import REPLAY_API_KEY, is_llm_replay, wrap_llm_cache
+from tools.local_tools import split_mcp_config
+from tools.mcp_client import create_mcp_client
+from tools.mock_llm import create_mock_chat_model, is_mock_model
+from tools.position_ledger import (get_last_ledger_date, get_ledger_backend,
+                                   ledger_exists, read_ledger_records,
+                                   write_initial_position)
 from tools.price_tools import add_no_trade_record
+from tools.prompt_context import precompute_prompt_context
+from tools.tool_concurrency import limit_tool_concurrency, load_server_tools
 
 # Load environment variables
 load_dotenv()
@@ -174,6 +185,14 @@ class BaseAgentAStock:
         initial_cash: float = 100000.0,  # Default 100k RMB
         init_date: str = "2025-10-09",
         market: str = "cn",  # Accepts but ignores this parameter, always uses "cn"
+        mcp_session_mode: str = "per_call",
+        in_process_tools: Union[bool, List[str]] = False,
+        compact_prompt: bool = False,
+        prompt_top_k: Optional[int] = None,
+        context_budget: Optional[int] = None,
+        keep_recent_steps: int = 2,
+        llm_cache: Optional[Dict[str, Any]] = None,
+        tool_concurrency: Union[int, Dict[str, int], None] = None,
     ):
         """
         Initialize BaseAgentAStock
@@ -192,6 +211,18 @@ class BaseAgentAStock:
             initial_cash: Initial cash amount (default: 100000.0 RMB)
             init_date: Initialization date
             market: Market type (accepted for compatibility, but always uses "cn")
+            mcp_session_mode: "per_call" (new MCP session per tool call) or "persistent" (long-lived, reused sessions)
+            in_process_tools: Call the local tool servers (math, prices, indicators, trade) in process
+                instead of over MCP; True for all of them or a list of MCP server names
+            compact_prompt: Render the system prompt with non-zero holdings and one price table
+            prompt_top_k: With compact_prompt, keep only the K largest movers (plus holdings) in the table
+            context_budget: Token budget for the system prompt plus session history sent per step;
+                older tool results are deduplicated, truncated or summarized beyond it (None: no limit)
+            keep_recent_steps: Most recent tool results always sent verbatim under context_budget
+            llm_cache: Record/replay cache for the chat model, e.g. {"mode": "record", "path": ...};
+                None disables it (see tools/llm_cache.py)
+            tool_concurrency: Maximum concurrent tool calls per MCP server, a number or {server: limit};
+                trade tools always run one at a time (see tools/tool_concurrency.py)
         """
         self.signature = signature
         self.basemodel = basemodel
@@ -211,6 +242,14 @@ class BaseAgentAStock:
 
         # Set MCP configuration
         self.mcp_config = mcp_config or self._get_default_mcp_config()
+        self.mcp_session_mode = mcp_session_mode
+        self.in_process_tools = in_process_tools
+        self.compact_prompt = compact_prompt
+        self.prompt_top_k = prompt_top_k
+        self.context_budget = context_budget
+        self.keep_recent_steps = keep_recent_steps
+        self.llm_cache = llm_cache
+        self.tool_concurrency = tool_concurrency
 
         # Set log path - A-shares specific path
         self.base_log_path = log_path or "./data/agent_data_astock"
@@ -231,6 +270,10 @@ class BaseAgentAStock:
         self.model: Optional[ChatOpenAI] = None
         self.agent: Optional[Any] = None
 
+        # Per-session system prompt and invocation config for the agent graph built in initialize()
+        self.system_prompt: Optional[str] = None
+        self.session_config: Dict[str, Any] = {}
+
         # Data paths
         self.data_path = os.path.join(self.base_log_path, self.signature)
         self.position_file = os.path.join(self.data_path, "position", "position.jsonl")
@@ -250,18 +293,33 @@ class BaseAgentAStock:
                 "transport": "streamable_http",
                 "url": f"http://localhost:{os.getenv('SEARCH_HTTP_PORT', '8004')}/mcp",
             },
+            "indicators": {
+                "transport": "streamable_http",
+                "url": f"http://localhost:{os.getenv('INDICATOR_HTTP_PORT', '8006')}/mcp",
+            },
             "trade": {
                 "transport": "streamable_http",
                 "url": f"http://localhost:{os.getenv('TRADE_HTTP_PORT', '8002')}/mcp",
             },
         }
 
+    def _agent_context(self, today_date: Optional[str] = None) -> Dict[str, Any]:
+        """Context sent to the MCP tool servers with every request (see tools/agent_context.py)"""
+        return {
+            "SIGNATURE": self.signature,
+            "TODAY_DATE": today_date,
+            "LOG_PATH": self.base_log_path,
+            "MARKET": self.market,
+            "LEDGER_BACKEND": get_ledger_backend(),
+        }
+
     async def initialize(self) -> None:
         """Initialize MCP client and AI model"""
         print(f"🚀 Initializing A-shares agent: {self.signature}")
 
         # Validate OpenAI configuration
-        if not self.openai_api_key:
+        # Replayed runs and the mock model never reach the provider, so they need no API key
+        if not self.openai_api_key and not is_llm_replay(self.llm_cache) and not is_mock_model(self.basemodel):
             raise ValueError(
                 "❌ OpenAI API key not set. Please configure OPENAI_API_KEY in environment or config file."
             )
@@ -270,10 +328,15 @@ class BaseAgentAStock:
 
         try:
             # Create MCP client
-            self.client = MultiServerMCPClient(self.mcp_config)
-
-            # Get tools
-            self.tools = await self.client.get_tools()
+            apply_context_headers(self.mcp_config, self._agent_context())
+            remote_config, local_servers = split_mcp_config(self.mcp_config, self.in_process_tools)
+            self.client = create_mcp_client(remote_config, self.mcp_session_mode)
+
+            # Get tools (MCP tools, plus local tool modules bound in process), with read-only calls
+            # capped per server and trade calls serialized
+            self.tools = limit_tool_concurrency(
+                await load_server_tools(self.client, local_servers), self.signature, self.tool_concurrency
+            )
             if not self.tools:
                 print("⚠️  Warning: No MCP tools loaded. MCP services may not be running.")
                 print(f"   MCP configuration: {self.mcp_config}")
@@ -289,11 +352,14 @@ class BaseAgentAStock:
         try:
             # Create AI model - use custom DeepSeekChatOpenAI for DeepSeek models
             # to handle tool_calls.args format differences (JSON string vs dict)
-            if "deepseek" in self.basemodel.lower():
+            if is_mock_model(self.basemodel):
+                # Scripted trades, for benchmarking the agent loop without a provider
+                self.model = create_mock_chat_model(self.basemodel, self.stock_symbols, self.market)
+            elif "deepseek" in self.basemodel.lower():
                 self.model = DeepSeekChatOpenAI(
                     model=self.basemodel,
                     base_url=self.openai_base_url,
-                    api_key=self.openai_api_key,
+                    api_key=self.openai_api_key or REPLAY_API_KEY,
                     max_retries=3,
                     timeout=30,
                 )
@@ -301,15 +367,19 @@ class BaseAgentAStock:
                 self.model = ChatOpenAI(
                     model=self.basemodel,
                     base_url=self.openai_base_url,
-                    api_key=self.openai_api_key,
+                    api_key=self.openai_api_key or REPLAY_API_KEY,
                     max_retries=3,
                     timeout=30,
                 )
         except Exception as e:
             raise RuntimeError(f"❌ Failed to initialize AI model: {e}")
 
-        # Note: agent will be created in run_trading_session() based on specific date
-        # because system_prompt needs the current date and price information
+        # Record/replay LLM cache, if configured
+        self.model = wrap_llm_cache(self.model, self.llm_cache, self.basemodel)
+
+        # Build the agent graph once; run_trading_session only swaps the system prompt, which is
+        # sent as the first message of every invocation
+        self.agent = create_agent(self.model, tools=self.tools)
 
         print(f"✅ A-shares agent {self.signature} initialization completed")
 
@@ -326,11 +396,19 @@ class BaseAgentAStock:
         with open(log_file, "a", encoding="utf-8") as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
 
+    def _with_system_prompt(self, message: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Prepend the current session's system prompt to the conversation"""
+        if not self.system_prompt:
+            return message
+        return [{"role": "system", "content": self.system_prompt}, *message]
+
     async def _ainvoke_with_retry(self, message: List[Dict[str, str]]) -> Any:
         """Agent invocation with retry"""
         for attempt in range(1, self.max_retries + 1):
             try:
-                return await self.agent.ainvoke({"messages": message}, {"recursion_limit": 100})
+                return await self.agent.ainvoke(
+                    {"messages": self._with_system_prompt(message)}, {"recursion_limit": 100, **self.session_config}
+                )
             except Exception as e:
                 if attempt == self.max_retries:
                     raise e
@@ -351,15 +429,15 @@ class BaseAgentAStock:
         log_file = self._setup_logging(today_date)
 
         # Update system prompt - Use A-shares specific prompt
-        self.agent = create_agent(
-            self.model,
-            tools=self.tools,
-            system_prompt=get_agent_system_prompt_astock(today_date, self.signature, self.stock_symbols),
+        self.system_prompt = get_agent_system_prompt_astock(
+            today_date, self.signature, self.stock_symbols, compact=self.compact_prompt, top_k=self.prompt_top_k
         )
 
         # Initial user query
         user_query = [{"role": "user", "content": f"Please analyze and update today's ({today_date}) positions."}]
         message = user_query.copy()
+        # Older tool results are compacted beyond the context budget; the log keeps them in full
+        budget = ContextBudget(self.context_budget, self.keep_recent_steps, self.system_prompt)
 
         # Log initial message
         self._log_message(log_file, user_query)
@@ -372,7 +450,7 @@ class BaseAgentAStock:
 
             try:
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(budget.fit(message))
 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
@@ -426,9 +504,9 @@ class BaseAgentAStock:
 
     def register_agent(self) -> None:
         """Register new agent, create initial positions"""
-        # Check if position.jsonl file already exists
-        if os.path.exists(self.position_file):
-            print(f"⚠️ Position file {self.position_file} already exists, skipping registration")
+        # Check if the agent already has a position ledger
+        if ledger_exists(self.signature, self.base_log_path):
+            print(f"⚠️ Position ledger for {self.signature} already exists, skipping registration")
             return
 
         # Ensure directory structure exists
@@ -455,11 +533,12 @@ class BaseAgentAStock:
                     # Fallback: keep original if unexpected
                     pass
 
-        with open(self.position_file, "w") as f:  # Use "w" mode to ensure creating new file
-            f.write(json.dumps({"date": init_date_str, "id": 0, "positions": init_position}) + "\n")
+        ledger_location = write_initial_position(
+            self.signature, {"date": init_date_str, "id": 0, "positions": init_position}, self.base_log_path
+        )
 
         print(f"✅ A-shares agent {self.signature} registration completed")
-        print(f"📁 Position file: {self.position_file}")
+        print(f"📁 Position ledger: {ledger_location}")
         print(f"💰 Initial cash: ¥{self.initial_cash:,.2f}")
         print(f"📊 Number of stocks: {len(self.stock_symbols)}")
 
@@ -474,27 +553,16 @@ class BaseAgentAStock:
         Returns:
             List of trading dates (excluding weekends and holidays)
         """
-        from tools.price_tools import is_trading_day
+        from tools.price_tools import get_trading_calendar
 
-        dates = []
         max_date = None
 
-        if not os.path.exists(self.position_file):
+        if not ledger_exists(self.signature, self.base_log_path):
             self.register_agent()
             max_date = init_date
         else:
-            # Read existing position file, find latest date
-            with open(self.position_file, "r") as f:
-                for line in f:
-                    doc = json.loads(line)
-                    current_date = doc["date"]
-                    if max_date is None:
-                        max_date = current_date
-                    else:
-                        current_date_obj = datetime.strptime(current_date, "%Y-%m-%d")
-                        max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
-                        if current_date_obj > max_date_obj:
-                            max_date = current_date
+            # Latest date already recorded in the position ledger
+            max_date = get_last_ledger_date(self.signature, self.base_log_path) or init_date
 
         # Check if new dates need to be processed
         max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
@@ -503,16 +571,9 @@ class BaseAgentAStock:
         if end_date_obj <= max_date_obj:
             return []
 
-        # Generate trading date list, filtered by actual trading days (A-shares market)
-        trading_dates = []
-        current_date = max_date_obj + timedelta(days=1)
-
-        while current_date <= end_date_obj:
-            date_str = current_date.strftime("%Y-%m-%d")
-            # Check if this is an actual trading day in A-shares market
-            if is_trading_day(date_str, market="cn"):
-                trading_dates.append(date_str)
-            current_date += timedelta(days=1)
+        # Trading days after the last processed date, up to and including end_date
+        trading_calendar = get_trading_calendar(market="cn", granularity="daily")
+        trading_dates = trading_calendar.range(max_date, end_date, include_start=False)
 
         return trading_dates
 
@@ -552,6 +613,11 @@ class BaseAgentAStock:
             return
 
         print(f"📊 Trading days to process: {trading_dates}")
+        # Prompt prices of the whole range in one pass; sessions then only look them up
+        try:
+            precompute_prompt_context(trading_dates, self.market)
+        except Exception as e:
+            print(f"⚠️  Could not precompute prompt prices: {e}")
 
         # Process each trading day
         for date in trading_dates:
@@ -561,8 +627,13 @@ class BaseAgentAStock:
             write_config_value("TODAY_DATE", date)
             write_config_value("SIGNATURE", self.signature)
 
+            # Per-request context for the tool servers; the runtime env file above is the fallback
+            context = self._agent_context(date)
+            apply_context_headers(self.mcp_config, context)
+
             try:
-                await self.run_with_retry(date)
+                with agent_context(**context):
+                    await self.run_with_retry(date)
             except Exception as e:
                 print(f"❌ Error processing {self.signature} - Date: {date}")
                 print(e)
@@ -572,13 +643,10 @@ class BaseAgentAStock:
 
     def get_position_summary(self) -> Dict[str, Any]:
         """Get position summary"""
-        if not os.path.exists(self.position_file):
+        if not ledger_exists(self.signature, self.base_log_path):
             return {"error": "Position file does not exist"}
 
-        positions = []
-        with open(self.position_file, "r") as f:
-            for line in f:
-                positions.append(json.loads(line))
+        positions = read_ledger_records(self.signature, self.base_log_path)
 
         if not positions:
             return {"error": "No position records"}
@@ -23,7 +23,6 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
-from langchain.agents import create_agent
 
 # Import project tools
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -31,6 +30,7 @@ sys.path.insert(0, project_root)
 
 from agent.base_agent_astock.base_agent_astock import BaseAgentAStock
 from prompts.agent_prompt_astock import STOP_SIGNAL, get_agent_system_prompt_astock
+from tools.context_budget import ContextBudget
 from tools.general_tools import (extract_conversation, extract_tool_messages,
                                  get_config_value, write_config_value)
 from tools.price_tools import add_no_trade_record
@@ -149,58 +149,21 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
         else:
             raise ValueError("Only support hour-level trading. Please use YYYY-MM-DD HH:MM:SS format.")
 
-        # Get merged_hourly.jsonl path (A-shares specific)
-        base_dir = Path(__file__).resolve().parents[2]
-        merged_file = base_dir / "data" / "A_stock" / "merged_hourly.jsonl"
+        from tools.position_ledger import get_last_ledger_date, ledger_exists
+        from tools.price_tools import get_trading_calendar
 
-        if not merged_file.exists():
-            return []
+        # Sorted intraday timestamps of the market's price file
+        trading_calendar = get_trading_calendar(market="cn", granularity="hourly")
 
-        # Collect all timestamps from merged_hourly.jsonl
-        all_timestamps = set()
-
-        with merged_file.open("r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                try:
-                    doc = json.loads(line)
-                    # Find all keys starting with "Time Series"
-                    for key, value in doc.items():
-                        if key.startswith("Time Series"):
-                            if isinstance(value, dict):
-                                all_timestamps.update(value.keys())
-                            break
-                except Exception:
-                    continue
-
-        if not all_timestamps:
+        if not trading_calendar:
             return []
         # Determine min_datetime based on init_date and last processed date in position file
         min_datetime = init_dt
 
         last_processed_dt = None
-        if os.path.exists(self.position_file):
-            max_date = None
-            with open(self.position_file, "r") as f:
-                for line in f:
-                    doc = json.loads(line)
-                    current_date = doc['date']
-                    if max_date is None:
-                        max_date = current_date
-                    else:
-                        if ' ' in current_date:
-                            current_date_obj = datetime.strptime(current_date, "%Y-%m-%d %H:%M:%S")
-                        else:
-                            current_date_obj = datetime.strptime(current_date, "%Y-%m-%d")
-
-                        if ' ' in max_date:
-                            max_date_obj = datetime.strptime(max_date, "%Y-%m-%d %H:%M:%S")
-                        else:
-                            max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
-
-                        if current_date_obj > max_date_obj:
-                            max_date = current_date
+        if ledger_exists(self.signature, self.base_log_path):
+            # Latest timestamp already recorded in the position ledger
+            max_date = get_last_ledger_date(self.signature, self.base_log_path)
 
             if max_date:
                 if has_time:
@@ -219,34 +182,12 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
             if not has_time:
                 last_processed_dt = last_processed_dt.date()
 
-        # Filter timestamps within the range
-        trading_times = []
-        if not has_time:
-            min_datetime = min_datetime.date()
-            end_dt = end_dt.date()
-
-        for ts_str in all_timestamps:
-            try:
-                if has_time:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                else:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d").date()
-                # Check if timestamp is in range with boundary rules
-                in_lower = False
-                if last_processed_dt is None:
-                    in_lower = ts_dt >= min_datetime
-                else:
-                    in_lower = ts_dt > min_datetime
-                if in_lower and ts_dt <= end_dt:
-                    trading_times.append(ts_str)
-
-            except Exception as e:
-                print(f"❌ Error processing timestamp: {ts_str}")
-                print(e)
-                continue
-
-        # Sort and remove duplicates
-        trading_times = sorted(list(set(trading_times)))
+        # Filter timestamps within the range: strictly after the last processed time, up to end_dt
+        trading_times = trading_calendar.range(
+            min_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+            end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            include_start=last_processed_dt is None,
+        )
         if REGISTER:
             # Only skip the very first timestamp if it exactly equals init_date to avoid double-processing
             if trading_times and trading_times[0] == init_date:
@@ -268,15 +209,15 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
         write_config_value("LOG_FILE", log_file)
 
         # Update system prompt - use A-shares specific prompt
-        self.agent = create_agent(
-            self.model,
-            tools=self.tools,
-            system_prompt=get_agent_system_prompt_astock(today_date, self.signature, self.stock_symbols),
+        self.system_prompt = get_agent_system_prompt_astock(
+            today_date, self.signature, self.stock_symbols, compact=self.compact_prompt, top_k=self.prompt_top_k
         )
 
         # Initial user query in Chinese
         user_query = [{"role": "user", "content": f"Please analyze and update today's ({today_date}) positions."}]
         message = user_query.copy()
+        # Older tool results are compacted beyond the context budget; the log keeps them in full
+        budget = ContextBudget(self.context_budget, self.keep_recent_steps, self.system_prompt)
 
         # Log initial message
         self._log_message(log_file, user_query)
@@ -289,7 +230,7 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
 
             try:
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(budget.fit(message))
 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
@@ -12,6 +12,7 @@ import sys
 from datetime import datetime, timedelta
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.agent_context import with_agent_context
 from tools.general_tools import get_config_value
 
 logger = logging.getLogger(__name__)
@@ -220,6 +221,7 @@ mcp = FastMCP("Search")
 
 
 @mcp.tool()
+@with_agent_context
 def get_market_news(
     query: str,
     tickers: Optional[str] = None,
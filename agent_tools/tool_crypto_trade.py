@@ -5,14 +5,15 @@ from typing import Any, Dict, List, Optional
 from fastmcp import FastMCP
 
 from typing import Dict, List, Optional, Any
-import fcntl
 from pathlib import Path
 # Add project root directory to Python path
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 import json
 
+from tools.agent_context import with_agent_context
 from tools.general_tools import get_config_value, write_config_value
+from tools.position_ledger import append_ledger_record, ledger_transaction
 from tools.price_tools import (get_latest_position, get_open_prices,
                                get_yesterday_date,
                                get_yesterday_open_and_close_price,
@@ -20,28 +21,8 @@ from tools.price_tools import (get_latest_position, get_open_prices,
 
 mcp = FastMCP("CryptoTradeTools")
 
-def _position_lock(signature: str):
-    """Context manager for file-based lock to serialize position updates per signature."""
-    class _Lock:
-        def __init__(self, name: str):
-            base_dir = Path(project_root) / "data" / "agent_data" / name
-            base_dir.mkdir(parents=True, exist_ok=True)
-            self.lock_path = base_dir / ".position.lock"
-            # Ensure lock file exists
-            self._fh = open(self.lock_path, "a+")
-        def __enter__(self):
-            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
-            return self
-        def __exit__(self, exc_type, exc, tb):
-            try:
-                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
-            finally:
-                self._fh.close()
-    return _Lock(signature)
-
-
-
 @mcp.tool()
+@with_agent_context
 def buy_crypto(symbol: str, amount: float) -> Dict[str, Any]:
     """
     Buy cryptocurrency function
@@ -103,7 +84,7 @@ def buy_crypto(symbol: str, amount: float) -> Dict[str, Any]:
     # get_latest_position returns two values: position dictionary and current maximum operation ID
     # This ID is used to ensure each operation has a unique identifier
     # Acquire lock for atomic read-modify-write on positions
-    with _position_lock(signature):
+    with ledger_transaction(signature):
         try:
             current_position, current_action_id = get_latest_position(today_date, signature)
         except Exception as e:
@@ -152,29 +133,16 @@ def buy_crypto(symbol: str, amount: float) -> Dict[str, Any]:
             new_position[symbol] = round(new_position[symbol] + amount, 4)
 
             # Step 6: Record transaction to position.jsonl file
-            # Build file path: {project_root}/data/{log_path}/{signature}/position/position.jsonl
-            # Use append mode ("a") to write new transaction record
+            # Append to the signature's ledger (position.jsonl or the SQLite ledger, per LEDGER_BACKEND)
             # Each operation ID increments by 1, ensuring uniqueness of operation sequence
-            log_path = get_config_value("LOG_PATH", "./data/agent_data")
-            if log_path.startswith("./data/"):
-                log_path = log_path[7:]  # Remove "./data/" prefix
-            position_file_path = os.path.join(project_root, "data", log_path, signature, "position", "position.jsonl")
-            with open(position_file_path, "a") as f:
-                # Write JSON format transaction record, containing date, operation ID, transaction details and updated position
-                print(
-                    f"Writing to position.jsonl: {json.dumps({'date': today_date, 'id': current_action_id + 1, 'this_action':{'action':'buy_crypto','symbol':symbol,'amount':amount},'positions': new_position})}"
-                )
-                f.write(
-                    json.dumps(
-                        {
-                            "date": today_date,
-                            "id": current_action_id + 1,
-                            "this_action": {"action": "buy_crypto", "symbol": symbol, "amount": amount},
-                            "positions": new_position,
-                        }
-                    )
-                    + "\n"
-                )
+            record = {
+                "date": today_date,
+                "id": current_action_id + 1,
+                "this_action": {"action": "buy_crypto", "symbol": symbol, "amount": amount},
+                "positions": new_position,
+            }
+            print(f"Writing to position.jsonl: {json.dumps(record)}")
+            append_ledger_record(signature, record, price=this_symbol_price)
             # Step 7: Return updated position
             write_config_value("IF_TRADE", True)
             print("IF_TRADE", get_config_value("IF_TRADE"))
@@ -183,6 +151,7 @@ def buy_crypto(symbol: str, amount: float) -> Dict[str, Any]:
 
 
 @mcp.tool()
+@with_agent_context
 def sell_crypto(symbol: str, amount: float) -> Dict[str, Any]:
     """
     Sell cryptocurrency function
@@ -243,7 +212,7 @@ def sell_crypto(symbol: str, amount: float) -> Dict[str, Any]:
     # Step 2: Get current latest position and operation ID
     # get_latest_position returns two values: position dictionary and current maximum operation ID
     # This ID is used to ensure each operation has a unique identifier
-    with _position_lock(signature):
+    with ledger_transaction(signature):
         try:
             current_position, current_action_id = get_latest_position(today_date, signature)
         except Exception as e:
@@ -296,29 +265,16 @@ def sell_crypto(symbol: str, amount: float) -> Dict[str, Any]:
         new_position["CASH"] = round(new_position.get("CASH", 0) + this_symbol_price * amount, 4)
 
         # Step 6: Record transaction to position.jsonl file
-        # Build file path: {project_root}/data/{log_path}/{signature}/position/position.jsonl
-        # Use append mode ("a") to write new transaction record
+        # Append to the signature's ledger (position.jsonl or the SQLite ledger, per LEDGER_BACKEND)
         # Each operation ID increments by 1, ensuring uniqueness of operation sequence
-        log_path = get_config_value("LOG_PATH", "./data/agent_data")
-        if log_path.startswith("./data/"):
-            log_path = log_path[7:]  # Remove "./data/" prefix
-        position_file_path = os.path.join(project_root, "data", log_path, signature, "position", "position.jsonl")
-        with open(position_file_path, "a") as f:
-            # Write JSON format transaction record, containing date, operation ID and updated position
-            print(
-                f"Writing to position.jsonl: {json.dumps({'date': today_date, 'id': current_action_id + 1, 'this_action':{'action':'sell_crypto','symbol':symbol,'amount':amount},'positions': new_position})}"
-            )
-            f.write(
-                json.dumps(
-                    {
-                        "date": today_date,
-                        "id": current_action_id + 1,
-                        "this_action": {"action": "sell_crypto", "symbol": symbol, "amount": amount},
-                        "positions": new_position,
-                    }
-                )
-                + "\n"
-            )
+        record = {
+            "date": today_date,
+            "id": current_action_id + 1,
+            "this_action": {"action": "sell_crypto", "symbol": symbol, "amount": amount},
+            "positions": new_position,
+        }
+        print(f"Writing to position.jsonl: {json.dumps(record)}")
+        append_ledger_record(signature, record, price=this_symbol_price)
 
         # Step 7: Return updated position
         write_config_value("IF_TRADE", True)
@@ -1,9 +1,10 @@
 import json
 import os
 import sys
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from fastmcp import FastMCP
@@ -20,7 +21,9 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
+from tools.agent_context import with_agent_context
 from tools.general_tools import get_config_value
+from tools.merged_index import read_symbol_doc
 
 
 def _workspace_data_path(filename: str, symbol: Optional[str] = None) -> Path:
@@ -62,7 +65,92 @@ def _validate_date_hourly(date_str: str) -> None:
     except ValueError as exc:
         raise ValueError("date must be in YYYY-MM-DD HH:MM:SS format") from exc
 
+# What an agent may see of the bar at TODAY_DATE: the open is known, the rest is in the future
+_TODAY_MASK = {
+    "high": "You can not get the current high price",
+    "low": "You can not get the current low price",
+    "close": "You can not get the next close price",
+    "volume": "You can not get the current volume",
+}
+
+# Upper bound on symbols x dates per batch request, and on bars per history request
+MAX_BATCH_ROWS = 1000
+
+# (data path, symbol, series key) -> ((size, mtime_ns), sorted timestamps, bars in the same order)
+_SORTED_SERIES_CACHE: Dict[Tuple[str, str, str], Tuple[Tuple[int, int], List[str], List[Dict[str, Any]]]] = {}
+
+
+def _ohlcv_from_bar(day: Dict[str, Any], masked: bool) -> Dict[str, Any]:
+    """Map a merged.jsonl bar to the ohlcv dict returned by the tools, masking today's bar."""
+    if masked:
+        return {"open": day.get("1. buy price"), **_TODAY_MASK}
+    return {
+        "open": day.get("1. buy price"),
+        "high": day.get("2. high"),
+        "low": day.get("3. low"),
+        "close": day.get("4. sell price"),
+        "volume": day.get("5. volume"),
+    }
+
+
+def _symbol_series_location(symbol: str, hourly: bool) -> Tuple[Path, str]:
+    """Data file and series key holding a symbol's daily or 60min bars."""
+    if hourly:
+        is_cn = symbol.endswith(".SH") or symbol.endswith(".SZ")
+        data_path = _workspace_data_path("merged_hourly.jsonl" if is_cn else "merged.jsonl", symbol)
+        return data_path, "Time Series (60min)"
+    return _workspace_data_path("merged.jsonl", symbol), "Time Series (Daily)"
+
+
+def _load_symbol_series(symbol: str, hourly: bool) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Read one symbol's time series via the merged.idx sidecar.
+
+    Args:
+        symbol: Stock symbol
+        hourly: Whether to read the 60min series (A-shares: merged_hourly.jsonl) instead of daily
+
+    Returns:
+        (series, error): series is {timestamp: bar}; error is a message when the symbol is unavailable
+    """
+    data_path, series_key = _symbol_series_location(symbol, hourly)
+    if not data_path.exists():
+        return None, f"Data file not found: {data_path}"
+    doc = read_symbol_doc(data_path, symbol)
+    if doc is None:
+        return None, f"No records found for stock {symbol} in local data"
+    return doc.get(series_key, {}), None
+
+
+def _load_sorted_series(
+    symbol: str, hourly: bool
+) -> Tuple[Optional[List[str]], Optional[List[Dict[str, Any]]], Optional[str]]:
+    """Symbol's bars as parallel arrays sorted by timestamp, cached until the data file changes.
+
+    Returns:
+        (timestamps, bars, error)
+    """
+    data_path, series_key = _symbol_series_location(symbol, hourly)
+    if not data_path.exists():
+        return None, None, f"Data file not found: {data_path}"
+    stat = os.stat(data_path)
+    stat_key = (stat.st_size, stat.st_mtime_ns)
+    cache_key = (str(data_path), symbol, series_key)
+
+    cached = _SORTED_SERIES_CACHE.get(cache_key)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1], cached[2], None
+
+    series, error = _load_symbol_series(symbol, hourly)
+    if error is not None:
+        return None, None, error
+    timestamps = sorted(series.keys())
+    bars = [series[ts] for ts in timestamps]
+    _SORTED_SERIES_CACHE[cache_key] = (stat_key, timestamps, bars)
+    return timestamps, bars, None
+
+
 @mcp.tool()
+@with_agent_context
 def get_price_local(symbol: str, date: str) -> Dict[str, Any]:
     """Read OHLCV data for specified stock and date. Get historical information for specified stock.
     
@@ -100,6 +188,151 @@ def get_price_local(symbol: str, date: str) -> Dict[str, Any]:
 
 
 
+@mcp.tool()
+@with_agent_context
+def get_prices_batch(symbols: List[str], dates: List[str]) -> Dict[str, Any]:
+    """Read OHLCV data for several stocks and dates in one call, returned as a compact table.
+
+    Use this instead of calling get_price_local repeatedly. All dates must share one format:
+    - Daily data: YYYY-MM-DD format (e.g., '2025-10-30')
+    - Hourly data: YYYY-MM-DD HH:MM:SS format (e.g., '2025-10-30 14:30:00')
+
+    Args:
+        symbols: Stock symbols, e.g. ['AAPL', 'NVDA'] or ['600519.SH'].
+        dates: Dates in 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' format. Based on your current time format.
+
+    Returns:
+        Dictionary with "columns", one row per (symbol, date) found in "rows", and "errors" listing
+        the (symbol, date) pairs that could not be served.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    dates = list(dict.fromkeys(dates))
+    if not symbols or not dates:
+        return {"error": "symbols and dates must both be non-empty lists", "symbols": symbols, "dates": dates}
+    if len(symbols) * len(dates) > MAX_BATCH_ROWS:
+        return {
+            "error": f"Too many rows requested ({len(symbols)} symbols x {len(dates)} dates); the limit is {MAX_BATCH_ROWS}",
+            "symbols": symbols,
+            "dates": dates,
+        }
+
+    hourly = any(" " in date or "T" in date for date in dates)
+    validate = _validate_date_hourly if hourly else _validate_date_daily
+    for date in dates:
+        try:
+            validate(date)
+        except ValueError as e:
+            return {"error": f"{e} (all dates in one batch must share a format)", "symbols": symbols, "dates": dates}
+
+    today_date = get_config_value("TODAY_DATE")
+    rows: List[List[Any]] = []
+    errors: List[Dict[str, str]] = []
+
+    for symbol in symbols:
+        series, error = _load_symbol_series(symbol, hourly)
+        if error is not None:
+            errors.append({"symbol": symbol, "error": error})
+            continue
+        for date in dates:
+            day = series.get(date)
+            if day is None:
+                errors.append({"symbol": symbol, "date": date, "error": "Data not found for date"})
+                continue
+            ohlcv = _ohlcv_from_bar(day, masked=date == today_date)
+            rows.append([symbol, date, ohlcv["open"], ohlcv["high"], ohlcv["low"], ohlcv["close"], ohlcv["volume"]])
+
+    return {
+        "columns": ["symbol", "date", "open", "high", "low", "close", "volume"],
+        "rows": rows,
+        "errors": errors,
+    }
+
+
+@mcp.tool()
+@with_agent_context
+def get_price_history(
+    symbol: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    lookback_n: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Read a window of OHLCV bars for one stock, e.g. the last 30 bars, in a single call.
+
+    Give either start (optionally with end) or lookback_n. The window never extends past the
+    current trading date; today's bar only shows its open price.
+    - Daily data: YYYY-MM-DD format (e.g., '2025-10-30')
+    - Hourly data: YYYY-MM-DD HH:MM:SS format (e.g., '2025-10-30 14:30:00')
+
+    Args:
+        symbol: Stock symbol, e.g. 'IBM' or '600243.SHH'.
+        start: First date of the window, inclusive.
+        end: Last date of the window, inclusive. Defaults to the current trading date.
+        lookback_n: Number of most recent bars up to end, used when start is not given.
+
+    Returns:
+        Dictionary with symbol, the effective start/end, "columns" and one row per bar in "rows".
+    """
+    if start is None and lookback_n is None:
+        return {"error": "Provide either start or lookback_n", "symbol": symbol}
+    if lookback_n is not None and lookback_n <= 0:
+        return {"error": "lookback_n must be a positive integer", "symbol": symbol}
+
+    today_date = get_config_value("TODAY_DATE")
+    bounds = [b for b in (start, end) if b]
+    hourly = any(" " in b for b in bounds) if bounds else bool(today_date and " " in today_date)
+    for bound in bounds:
+        try:
+            if " " in bound:
+                _validate_date_hourly(bound)
+            else:
+                _validate_date_daily(bound)
+        except ValueError as e:
+            return {"error": str(e), "symbol": symbol, "start": start, "end": end}
+
+    effective_end = end or today_date
+    if hourly and effective_end and " " not in effective_end:
+        # A date-only upper bound covers every intraday bar of that date
+        effective_end = f"{effective_end} 23:59:59"
+    # Clip at the current trading date so the window never contains future bars
+    if today_date and (effective_end is None or effective_end > today_date):
+        effective_end = today_date
+
+    timestamps, bars, error = _load_sorted_series(symbol, hourly)
+    if error is not None:
+        return {"error": error, "symbol": symbol, "start": start, "end": end}
+
+    hi = bisect_right(timestamps, effective_end) if effective_end else len(timestamps)
+    if start is not None:
+        lo = bisect_left(timestamps, start)
+        if lookback_n is not None:
+            lo = max(lo, hi - lookback_n)
+    else:
+        lo = max(0, hi - lookback_n)
+    lo = max(lo, hi - MAX_BATCH_ROWS)
+
+    rows: List[List[Any]] = []
+    for ts, day in zip(timestamps[lo:hi], bars[lo:hi]):
+        ohlcv = _ohlcv_from_bar(day, masked=ts == today_date)
+        rows.append([ts, ohlcv["open"], ohlcv["high"], ohlcv["low"], ohlcv["close"], ohlcv["volume"]])
+
+    if not rows:
+        sample_dates = timestamps[-5:][::-1]
+        return {
+            "error": f"No data in the requested window. Sample available dates: {sample_dates}",
+            "symbol": symbol,
+            "start": start,
+            "end": effective_end,
+        }
+
+    return {
+        "symbol": symbol,
+        "start": rows[0][0],
+        "end": rows[-1][0],
+        "columns": ["date", "open", "high", "low", "close", "volume"],
+        "rows": rows,
+    }
+
+
 def get_price_local_daily(symbol: str, date: str) -> Dict[str, Any]:
     """Read OHLCV data for specified stock and date. Get historical information for specified stock.
 
@@ -120,50 +353,25 @@ def get_price_local_daily(symbol: str, date: str) -> Dict[str, Any]:
     if not data_path.exists():
         return {"error": f"Data file not found: {data_path}", "symbol": symbol, "date": date}
 
-    with data_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            doc = json.loads(line)
-            meta = doc.get("Meta Data", {})
-            if meta.get("2. Symbol") != symbol:
-                continue
-            series = doc.get("Time Series (Daily)", {})
-            day = series.get(date)
-            if day is None:
-                sample_dates = sorted(series.keys(), reverse=True)[:5]
-                return {
-                    "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
-                    "symbol": symbol,
-                    "date": date,
-                }
-            if date == get_config_value("TODAY_DATE"):
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": "You can not get the current high price",
-                        "low": "You can not get the current low price", 
-                        "close": "You can not get the next close price",
-                        "volume": "You can not get the current volume",
-                    },
-                }
-            else:
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": day.get("2. high"),
-                        "low": day.get("3. low"), 
-                        "close": day.get("4. sell price"),
-                        "volume": day.get("5. volume"),
-                    },
-                }
-
-
-    return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+    # Seek straight to the symbol's line via the merged.idx sidecar
+    doc = read_symbol_doc(data_path, symbol)
+    if doc is None:
+        return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+
+    series = doc.get("Time Series (Daily)", {})
+    day = series.get(date)
+    if day is None:
+        sample_dates = sorted(series.keys(), reverse=True)[:5]
+        return {
+            "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
+            "symbol": symbol,
+            "date": date,
+        }
+    return {
+        "symbol": symbol,
+        "date": date,
+        "ohlcv": _ohlcv_from_bar(day, masked=date == get_config_value("TODAY_DATE")),
+    }
 
 
 def get_price_local_hourly(symbol: str, date: str) -> Dict[str, Any]:
@@ -186,49 +394,25 @@ def get_price_local_hourly(symbol: str, date: str) -> Dict[str, Any]:
     if not data_path.exists():
         return {"error": f"Data file not found: {data_path}", "symbol": symbol, "date": date}
 
-    with data_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            doc = json.loads(line)
-            meta = doc.get("Meta Data", {})
-            if meta.get("2. Symbol") != symbol:
-                continue
-            series = doc.get("Time Series (60min)", {})
-            day = series.get(date)
-            if day is None:
-                sample_dates = sorted(series.keys(), reverse=True)[:5]
-                return {
-                    "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
-                    "symbol": symbol,
-                    "date": date
-                }
-            if date == get_config_value("TODAY_DATE"):
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": "You can not get the current high price",
-                        "low": "You can not get the current low price", 
-                        "close": "You can not get the next close price",
-                        "volume": "You can not get the current volume",
-                    },
-                }
-            else:
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": day.get("2. high"),
-                        "low": day.get("3. low"), 
-                        "close": day.get("4. sell price"),
-                        "volume": day.get("5. volume"),
-                    },
-                }
-
-    return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+    # Seek straight to the symbol's line via the merged.idx sidecar
+    doc = read_symbol_doc(data_path, symbol)
+    if doc is None:
+        return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+
+    series = doc.get("Time Series (60min)", {})
+    day = series.get(date)
+    if day is None:
+        sample_dates = sorted(series.keys(), reverse=True)[:5]
+        return {
+            "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
+            "symbol": symbol,
+            "date": date
+        }
+    return {
+        "symbol": symbol,
+        "date": date,
+        "ohlcv": _ohlcv_from_bar(day, masked=date == get_config_value("TODAY_DATE")),
+    }
 
 
 def get_price_local_function(symbol: str, date: str, filename: str = "merged.jsonl") -> Dict[str, Any]:
@@ -0,0 +1,308 @@
+import os
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from fastmcp import FastMCP
+
+# Ensure project root is on sys.path for absolute imports like `tools.*`
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from tools.columnar_prices import _pad_timestamp, load_columnar_prices
+from tools.agent_context import with_agent_context
+from tools.general_tools import get_config_value
+from tools.price_tools import _resolve_merged_file_path_for_date, get_market_type
+
+load_dotenv()
+
+mcp = FastMCP("Indicators")
+
+# indicator -> default parameters
+INDICATOR_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "sma": {"period": 20},
+    "ema": {"period": 20},
+    "rsi": {"period": 14},
+    "macd": {"fast": 12, "slow": 26, "signal": 9},
+    "atr": {"period": 14},
+    "bollinger": {"period": 20, "num_std": 2.0},
+    "volatility": {"period": 20},
+}
+
+# Recursive indicators (EMA, RSI, MACD, ATR) are warmed up over this many bars per period
+WARMUP_FACTOR = 10
+
+# (data dir, data version, symbol, indicator, params, as_of) -> value
+CACHE_MAX_ENTRIES = 50000
+_INDICATOR_CACHE: "OrderedDict[Tuple[Any, ...], Any]" = OrderedDict()
+
+
+def _cache_get(key: Tuple[Any, ...]) -> Tuple[bool, Any]:
+    if key in _INDICATOR_CACHE:
+        _INDICATOR_CACHE.move_to_end(key)
+        return True, _INDICATOR_CACHE[key]
+    return False, None
+
+
+def _cache_put(key: Tuple[Any, ...], value: Any) -> None:
+    _INDICATOR_CACHE[key] = value
+    _INDICATOR_CACHE.move_to_end(key)
+    while len(_INDICATOR_CACHE) > CACHE_MAX_ENTRIES:
+        _INDICATOR_CACHE.popitem(last=False)
+
+
+def _detect_market(symbols: Optional[List[str]]) -> str:
+    """Market of the requested symbols, falling back to the runtime market."""
+    for symbol in symbols or []:
+        if symbol.endswith(".SH") or symbol.endswith(".SZ"):
+            return "cn"
+        if symbol.endswith("-USDT"):
+            return "crypto"
+        return "us"
+    return get_market_type()
+
+
+def _forward_fill(x: np.ndarray) -> np.ndarray:
+    """Carry the last valid value forward along the time axis (leading gaps stay NaN)."""
+    if x.size == 0:
+        return x
+    idx = np.where(np.isnan(x), 0, np.arange(x.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return x[np.arange(x.shape[0])[:, None], idx]
+
+
+def _ema_series(x: np.ndarray, period: int, wilder: bool = False) -> np.ndarray:
+    """Exponential moving average over the time axis, seeded with the SMA of the first `period` valid bars.
+
+    Rows are independent series; the loop runs over time and is vectorized across symbols.
+    """
+    n_rows, n_cols = x.shape
+    out = np.full(x.shape, np.nan)
+    alpha = 1.0 / period if wilder else 2.0 / (period + 1)
+
+    valid = ~np.isnan(x)
+    count = np.zeros(n_rows)
+    running_sum = np.zeros(n_rows)
+    state = np.full(n_rows, np.nan)
+    for t in range(n_cols):
+        col = x[:, t]
+        ok = valid[:, t]
+        seeded = ~np.isnan(state)
+
+        # Warm-up: accumulate a simple average until `period` values were seen
+        warming = ok & ~seeded
+        count[warming] += 1
+        running_sum[warming] += col[warming]
+        ready = warming & (count >= period)
+        state[ready] = running_sum[ready] / period
+
+        update = ok & seeded
+        state[update] = alpha * col[update] + (1 - alpha) * state[update]
+        out[:, t] = state
+    return out
+
+
+def _rolling_window(x: np.ndarray, period: int) -> np.ndarray:
+    """Last `period` columns, or an all-NaN block when there is not enough history."""
+    if x.shape[1] < period:
+        return np.full((x.shape[0], period), np.nan)
+    return x[:, -period:]
+
+
+def _compute_indicator(
+    indicator: str, params: Dict[str, Any], close: np.ndarray, high: np.ndarray, low: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Compute an indicator for every row (symbol) as of the last column.
+
+    Args:
+        indicator: Indicator name (see INDICATOR_DEFAULTS)
+        params: Indicator parameters
+        close, high, low: (symbols x bars) forward-filled matrices, oldest bar first
+
+    Returns:
+        Mapping of output name -> (symbols,) array; NaN where history is insufficient
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if indicator == "sma":
+            window = _rolling_window(close, params["period"])
+            return {"value": np.mean(window, axis=1)}
+
+        if indicator == "ema":
+            return {"value": _ema_series(close, params["period"])[:, -1]}
+
+        if indicator == "rsi":
+            period = params["period"]
+            delta = np.diff(close, axis=1)
+            if delta.shape[1] == 0:
+                return {"value": np.full(close.shape[0], np.nan)}
+            avg_gain = _ema_series(np.clip(delta, 0, None), period, wilder=True)[:, -1]
+            avg_loss = _ema_series(np.clip(-delta, 0, None), period, wilder=True)[:, -1]
+            rsi = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), 100.0 - 100.0 * avg_loss / (avg_loss + avg_gain))
+            return {"value": np.where(np.isnan(avg_gain) | np.isnan(avg_loss), np.nan, rsi)}
+
+        if indicator == "macd":
+            macd_line = _ema_series(close, params["fast"]) - _ema_series(close, params["slow"])
+            signal_line = _ema_series(macd_line, params["signal"])
+            return {
+                "macd": macd_line[:, -1],
+                "signal": signal_line[:, -1],
+                "histogram": macd_line[:, -1] - signal_line[:, -1],
+            }
+
+        if indicator == "atr":
+            prev_close = close[:, :-1]
+            true_range = np.fmax(
+                high[:, 1:] - low[:, 1:],
+                np.fmax(np.abs(high[:, 1:] - prev_close), np.abs(low[:, 1:] - prev_close)),
+            )
+            if true_range.shape[1] == 0:
+                return {"value": np.full(close.shape[0], np.nan)}
+            return {"value": _ema_series(true_range, params["period"], wilder=True)[:, -1]}
+
+        if indicator == "bollinger":
+            window = _rolling_window(close, params["period"])
+            middle = np.mean(window, axis=1)
+            width = params["num_std"] * np.std(window, axis=1)
+            return {
+                "middle": middle,
+                "upper": middle + width,
+                "lower": middle - width,
+                "percent_b": (window[:, -1] - (middle - width)) / (2 * width),
+            }
+
+        if indicator == "volatility":
+            returns = np.diff(np.log(close), axis=1)
+            window = _rolling_window(returns, params["period"])
+            return {"value": np.std(window, axis=1, ddof=1)}
+
+    raise ValueError(f"Unknown indicator: {indicator}")
+
+
+def _history_bars(indicator: str, params: Dict[str, Any]) -> int:
+    """Number of trailing bars needed for a stable value."""
+    if indicator in ("sma", "bollinger"):
+        return params["period"]
+    if indicator == "volatility":
+        return params["period"] + 1
+    if indicator == "macd":
+        return (params["slow"] + params["signal"]) * WARMUP_FACTOR
+    return params["period"] * WARMUP_FACTOR + 1
+
+
+def _to_json_value(values: Dict[str, np.ndarray], row: int) -> Any:
+    """Round one symbol's outputs; a single-output indicator becomes a bare number."""
+    out = {}
+    for name, array in values.items():
+        value = float(array[row])
+        out[name] = None if np.isnan(value) else round(value, 4)
+    if list(out.keys()) == ["value"]:
+        return out["value"]
+    return None if all(v is None for v in out.values()) else out
+
+
+@mcp.tool()
+@with_agent_context
+def get_indicator(
+    indicator: str,
+    symbols: Optional[List[str]] = None,
+    period: Optional[int] = None,
+    fast: Optional[int] = None,
+    slow: Optional[int] = None,
+    signal: Optional[int] = None,
+    num_std: Optional[float] = None,
+    as_of: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Compute a technical indicator for many stocks in one call.
+
+    Supported indicators and default parameters:
+    - sma / ema: period=20 (moving average of close)
+    - rsi: period=14
+    - macd: fast=12, slow=26, signal=9 (returns macd, signal, histogram)
+    - atr: period=14 (average true range)
+    - bollinger: period=20, num_std=2 (returns middle, upper, lower, percent_b)
+    - volatility: period=20 (standard deviation of log returns per bar)
+
+    Values only use bars strictly before as_of, so the current bar (whose close is not known yet)
+    never leaks into the result.
+
+    Args:
+        indicator: One of sma, ema, rsi, macd, atr, bollinger, volatility.
+        symbols: Stock symbols, e.g. ['AAPL', 'NVDA']. Omit to get every symbol in the market.
+        period: Lookback period (sma, ema, rsi, atr, bollinger, volatility).
+        fast: Fast EMA period (macd).
+        slow: Slow EMA period (macd).
+        signal: Signal EMA period (macd).
+        num_std: Band width in standard deviations (bollinger).
+        as_of: Date in 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' format. Defaults to the current trading date.
+
+    Returns:
+        Dictionary with indicator, params, as_of, "values" keyed by symbol, and symbols without data in "missing".
+    """
+    indicator = indicator.lower().strip()
+    if indicator not in INDICATOR_DEFAULTS:
+        return {"error": f"Unknown indicator '{indicator}'. Supported: {sorted(INDICATOR_DEFAULTS)}"}
+
+    supplied = {"period": period, "fast": fast, "slow": slow, "signal": signal, "num_std": num_std}
+    params = dict(INDICATOR_DEFAULTS[indicator])
+    for name in params:
+        if supplied.get(name) is not None:
+            params[name] = supplied[name]
+    for name, value in params.items():
+        if value <= 0 or (name != "num_std" and int(value) != value):
+            return {"error": f"{name} must be a positive integer" if name != "num_std" else "num_std must be positive"}
+        params[name] = float(value) if name == "num_std" else int(value)
+
+    as_of = as_of or get_config_value("TODAY_DATE")
+    market = _detect_market(symbols)
+    merged_file = _resolve_merged_file_path_for_date(as_of, market)
+    prices = load_columnar_prices(merged_file)
+    if prices is None:
+        return {"error": f"Price data not found: {merged_file}", "indicator": indicator}
+
+    wanted = list(dict.fromkeys(symbols)) if symbols else list(prices.symbols)
+    params_key = tuple(sorted(params.items()))
+    version = prices.meta.get("source_mtime_ns")
+
+    values: Dict[str, Any] = {}
+    pending = set()
+    for symbol in wanted:
+        hit, value = _cache_get((str(merged_file), version, symbol, indicator, params_key, as_of))
+        if hit:
+            values[symbol] = value
+        else:
+            pending.add(symbol)
+
+    if pending:
+        # Bars strictly before as_of; compute for the whole universe at once and cache every symbol
+        if as_of:
+            hi = int(np.searchsorted(prices.timestamps, _pad_timestamp(as_of), side="left"))
+        else:
+            hi = len(prices.timestamps)
+        lo = max(0, hi - _history_bars(indicator, params))
+        close = _forward_fill(np.asarray(prices.field("close")[:, lo:hi], dtype=np.float64))
+        high = _forward_fill(np.asarray(prices.field("high")[:, lo:hi], dtype=np.float64))
+        low = _forward_fill(np.asarray(prices.field("low")[:, lo:hi], dtype=np.float64))
+        computed = _compute_indicator(indicator, params, close, high, low)
+
+        for row, symbol in enumerate(prices.symbols):
+            value = _to_json_value(computed, row)
+            _cache_put((str(merged_file), version, symbol, indicator, params_key, as_of), value)
+            if symbol in pending:
+                values[symbol] = value
+
+    missing = [symbol for symbol in wanted if values.get(symbol) is None]
+    return {
+        "indicator": indicator,
+        "params": params,
+        "as_of": as_of,
+        "values": {symbol: values[symbol] for symbol in wanted if values.get(symbol) is not None},
+        "missing": missing,
+    }
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("INDICATOR_HTTP_PORT", "8006"))
+    mcp.run(transport="streamable-http", port=port)
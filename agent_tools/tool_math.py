@@ -1,11 +1,17 @@
+import ast
+import math
+import operator
 import os
+from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
 from fastmcp import FastMCP
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.agent_context import with_agent_context
 from tools.general_tools import get_config_value
+from tools.price_tools import get_latest_position, get_open_prices
 load_dotenv()
 
 mcp = FastMCP("Math")
@@ -39,6 +45,302 @@ def multiply(a: float, b: float) -> float:
     return float(a) * float(b)
 
 
+# ---------------------------------------------------------------------------
+# Safe arithmetic expressions
+# ---------------------------------------------------------------------------
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_FUNCTIONS = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "sqrt": math.sqrt,
+    "log": math.log,
+    "exp": math.exp,
+}
+
+# Guard against expressions like 9**9**9 or ((9**99)**99)**99 that would hang the server: every
+# operand and intermediate result must stay within _MAX_MAGNITUDE, and an integer power is
+# rejected before it is computed if its result would need more than _MAX_INT_BITS bits
+_MAX_EXPONENT = 100
+_MAX_MAGNITUDE = 1e100
+_MAX_INT_BITS = 333  # ~1e100
+_MAX_EXPRESSION_LENGTH = 500
+
+
+def _check_magnitude(value: Any) -> Any:
+    if isinstance(value, int) and not isinstance(value, bool):
+        if value.bit_length() > _MAX_INT_BITS:
+            raise ValueError(f"Number too large: more than {_MAX_INT_BITS} bits")
+    elif isinstance(value, float) and abs(value) > _MAX_MAGNITUDE:
+        raise ValueError(f"Number too large: {value:.3g}")
+    return value
+
+
+def _eval_node(node: ast.AST, variables: Dict[str, float]) -> float:
+    return _check_magnitude(_eval_unchecked(node, variables))
+
+
+def _eval_unchecked(node: ast.AST, variables: Dict[str, float]) -> float:
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, variables)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            return variables[node.id]
+        raise ValueError(f"Unknown variable: {node.id}")
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        left = _eval_node(node.left, variables)
+        right = _eval_node(node.right, variables)
+        if isinstance(node.op, ast.Pow):
+            if abs(right) > _MAX_EXPONENT:
+                raise ValueError(f"Exponent too large: {right}")
+            if isinstance(left, int) and isinstance(right, int) and right > 0:
+                if (left.bit_length() - 1) * right > _MAX_INT_BITS:
+                    raise ValueError(f"Result too large: {left.bit_length()}-bit number ** {right}")
+        return _BINARY_OPS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_eval_node(node.operand, variables))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS and not node.keywords:
+        args = [_eval_node(arg, variables) for arg in node.args]
+        return _FUNCTIONS[node.func.id](*args)
+    raise ValueError(f"Unsupported expression element: {type(node).__name__}")
+
+
+def safe_eval(expression: str, variables: Optional[Dict[str, float]] = None) -> float:
+    """Evaluate an arithmetic expression without exec/eval.
+
+    Only numbers, + - * / // % **, parentheses, the functions in _FUNCTIONS and the given
+    variables are allowed.
+
+    Args:
+        expression: Expression such as "(10000 - 3 * 185.5) / 2"
+        variables: Optional names usable inside the expression
+
+    Returns:
+        The numeric result
+
+    Raises:
+        ValueError: If the expression is malformed or uses anything outside the allowed subset
+    """
+    if len(expression) > _MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression longer than {_MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {e.msg}")
+    return _eval_node(tree, variables or {})
+
+
+def _evaluate_all(expressions: List[str], variables: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    results = []
+    for expression in expressions:
+        try:
+            value = safe_eval(expression, variables)
+            results.append({"expression": expression, "result": float(value)})
+        except (ValueError, TypeError, ZeroDivisionError, OverflowError) as e:
+            results.append({"expression": expression, "error": str(e)})
+    return results
+
+
+@mcp.tool()
+def calculate(expressions: List[str]) -> List[Dict[str, Any]]:
+    """Evaluate several arithmetic expressions in one call.
+
+    Supports numbers, + - * / // % **, parentheses and abs/min/max/round/floor/ceil/sqrt/log/exp.
+    Use this instead of chaining many add/multiply calls.
+
+    Args:
+        expressions: Expressions such as ["10000 - 25 * 182.4", "floor(5000 / 37.2)"]
+
+    Returns:
+        One {"expression", "result"} or {"expression", "error"} entry per expression, in order
+    """
+    return _evaluate_all(expressions)
+
+
+# ---------------------------------------------------------------------------
+# Portfolio calculator
+# ---------------------------------------------------------------------------
+
+
+def _symbol_market(symbol: str) -> str:
+    """Market of a symbol, following the symbol conventions of the trade tools."""
+    if symbol.endswith((".SH", ".SZ")):
+        return "cn"
+    if symbol.endswith("-USDT"):
+        return "crypto"
+    return "us"
+
+
+def _max_affordable(cash: float, price: float, market: str) -> float:
+    """Largest quantity the cash buys at price (100-share lots for A-shares, 4 decimals for crypto)."""
+    if price <= 0 or cash <= 0:
+        return 0
+    if market == "cn":
+        return int(cash // (price * 100)) * 100
+    if market == "crypto":
+        return math.floor(cash / price * 10000) / 10000
+    return int(cash // price)
+
+
+@mcp.tool()
+@with_agent_context
+def portfolio_calculator(
+    orders: Optional[List[Dict[str, Any]]] = None,
+    positions: Optional[Dict[str, float]] = None,
+    expressions: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Value the portfolio and simulate a list of orders at today's buy prices in one call.
+
+    Orders are applied in the given order with the same checks as the trade tools (positive amount,
+    100-share lots for A-shares, enough cash, enough shares). Invalid orders are reported and skipped.
+    The A-share T+1 rule is not checked here; the sell tool still enforces it.
+
+    Args:
+        orders: Proposed orders, e.g. [{"symbol": "AAPL", "action": "buy", "amount": 10},
+                {"symbol": "MSFT", "action": "sell", "amount": 5}]
+        positions: Holdings including "CASH", e.g. {"CASH": 10000, "AAPL": 5}.
+                   Defaults to the current position of this agent.
+        expressions: Optional arithmetic expressions evaluated after the orders. They may use the
+                     variables cash, nav, cash_after and nav_after, e.g. ["cash_after * 0.1"].
+
+    Returns:
+        Dictionary with:
+          - prices: today's buy price per symbol
+          - holdings: per symbol quantity, market value and weight before and after the orders
+          - cash, nav, cash_after, nav_after
+          - max_affordable: shares each symbol's price allows with cash_after
+          - orders: per-order status ("ok" or an error message)
+          - expressions: results of the expressions, if any
+    """
+    today_date = get_config_value("TODAY_DATE")
+    orders = orders or []
+
+    if positions is None:
+        signature = get_config_value("SIGNATURE")
+        if signature is None:
+            return {"error": "positions not provided and SIGNATURE is not set", "date": today_date}
+        try:
+            positions, _ = get_latest_position(today_date, signature)
+        except Exception as e:
+            return {"error": f"Failed to load latest position: {e}", "date": today_date}
+
+    before = {symbol: float(qty) for symbol, qty in positions.items() if symbol != "CASH"}
+    cash = float(positions.get("CASH", 0))
+
+    # One price lookup per market for every symbol held or ordered
+    symbols = list(dict.fromkeys(list(before) + [str(order.get("symbol", "")) for order in orders if order.get("symbol")]))
+    by_market: Dict[str, List[str]] = {}
+    for symbol in symbols:
+        by_market.setdefault(_symbol_market(symbol), []).append(symbol)
+    prices: Dict[str, Optional[float]] = {}
+    for market, market_symbols in by_market.items():
+        found = get_open_prices(today_date, market_symbols, market=market)
+        for symbol in market_symbols:
+            prices[symbol] = found.get(f"{symbol}_price")
+
+    after = dict(before)
+    cash_after = cash
+    order_results = []
+    for order in orders:
+        symbol = str(order.get("symbol", ""))
+        action = str(order.get("action", "")).lower()
+        market = _symbol_market(symbol)
+        result: Dict[str, Any] = {"symbol": symbol, "action": action, "amount": order.get("amount")}
+        order_results.append(result)
+
+        price = prices.get(symbol)
+        try:
+            amount = float(order.get("amount")) if market == "crypto" else int(order.get("amount"))
+        except (TypeError, ValueError):
+            result["status"] = f"Invalid amount: {order.get('amount')}"
+            continue
+        if action not in ("buy", "sell"):
+            result["status"] = f"Unknown action '{action}', expected 'buy' or 'sell'"
+        elif amount <= 0:
+            result["status"] = "Amount must be positive"
+        elif market == "cn" and amount % 100 != 0:
+            result["status"] = "Chinese A-shares must be traded in multiples of 100 shares"
+        elif price is None:
+            result["status"] = f"Price data not available for {symbol} at {today_date}"
+        elif action == "buy" and price * amount > cash_after:
+            result["status"] = "Insufficient cash"
+            result["required_cash"] = round(price * amount, 4)
+        elif action == "sell" and after.get(symbol, 0) < amount:
+            result["status"] = "Insufficient shares"
+            result["shares_available"] = after.get(symbol, 0)
+        else:
+            sign = 1 if action == "buy" else -1
+            after[symbol] = after.get(symbol, 0) + sign * amount
+            cash_after -= sign * price * amount
+            result["status"] = "ok"
+            result["value"] = round(price * amount, 4)
+
+    def _value(holdings: Dict[str, float]) -> Dict[str, float]:
+        return {symbol: qty * prices[symbol] for symbol, qty in holdings.items() if qty and prices.get(symbol) is not None}
+
+    values_before = _value(before)
+    values_after = _value(after)
+    nav = cash + sum(values_before.values())
+    nav_after = cash_after + sum(values_after.values())
+
+    holdings = {}
+    for symbol in symbols:
+        if not before.get(symbol) and not after.get(symbol):
+            continue
+        holdings[symbol] = {
+            "quantity": before.get(symbol, 0),
+            "market_value": round(values_before.get(symbol, 0.0), 4),
+            "weight": round(values_before.get(symbol, 0.0) / nav, 4) if nav else None,
+            "quantity_after": after.get(symbol, 0),
+            "market_value_after": round(values_after.get(symbol, 0.0), 4),
+            "weight_after": round(values_after.get(symbol, 0.0) / nav_after, 4) if nav_after else None,
+        }
+    unpriced = [symbol for symbol in symbols if prices.get(symbol) is None]
+
+    result = {
+        "date": today_date,
+        "prices": {symbol: price for symbol, price in prices.items() if price is not None},
+        "holdings": holdings,
+        "cash": round(cash, 4),
+        "nav": round(nav, 4),
+        "cash_after": round(cash_after, 4),
+        "nav_after": round(nav_after, 4),
+        "cash_weight_after": round(cash_after / nav_after, 4) if nav_after else None,
+        "max_affordable": {
+            symbol: _max_affordable(cash_after, price, _symbol_market(symbol))
+            for symbol, price in prices.items()
+            if price is not None
+        },
+        "orders": order_results,
+    }
+    if unpriced:
+        result["unpriced_symbols"] = unpriced
+    if expressions:
+        variables = {"cash": cash, "nav": nav, "cash_after": cash_after, "nav_after": nav_after}
+        result["expressions"] = _evaluate_all(expressions, variables)
+    return result
+
+
 if __name__ == "__main__":
     port = int(os.getenv("MATH_HTTP_PORT", "8000"))
     mcp.run(transport="streamable-http", port=port)
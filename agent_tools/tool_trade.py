@@ -5,14 +5,16 @@ from typing import Any, Dict, List, Optional
 from fastmcp import FastMCP
 
 from typing import Dict, List, Optional, Any
-import fcntl
 from pathlib import Path
 # Add project root directory to Python path
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 import json
 
+from tools.agent_context import with_agent_context
 from tools.general_tools import get_config_value, write_config_value
+from tools.position_ledger import (append_ledger_record, append_ledger_records,
+                                   get_today_buy_amount, ledger_transaction)
 from tools.price_tools import (get_latest_position, get_open_prices,
                                get_yesterday_date,
                                get_yesterday_open_and_close_price,
@@ -20,40 +22,8 @@ from tools.price_tools import (get_latest_position, get_open_prices,
 
 mcp = FastMCP("TradeTools")
 
-def _position_lock(signature: str):
-    """Context manager for file-based lock to serialize position updates per signature."""
-    class _Lock:
-        def __init__(self, name: str):
-            # Prefer LOG_PATH so the lock file lives alongside the positions file
-            log_path = get_config_value("LOG_PATH", "./data/agent_data")
-            # Resolve base dir for this signature under the configured log path
-            if os.path.isabs(log_path):
-                # Absolute path (e.g., temp directory)
-                base_dir = Path(log_path) / name
-            else:
-                # Relative path: treat "./data/xxx" specially to keep compatibility
-                if log_path.startswith("./data/"):
-                    log_rel = log_path[7:]  # strip "./data/"
-                else:
-                    log_rel = log_path
-                base_dir = Path(project_root) / "data" / log_rel / name
-            base_dir.mkdir(parents=True, exist_ok=True)
-            self.lock_path = base_dir / ".position.lock"
-            # Ensure lock file exists
-            self._fh = open(self.lock_path, "a+")
-        def __enter__(self):
-            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
-            return self
-        def __exit__(self, exc_type, exc, tb):
-            try:
-                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
-            finally:
-                self._fh.close()
-    return _Lock(signature)
-
-
-
 @mcp.tool()
+@with_agent_context
 def buy(symbol: str, amount: int) -> Dict[str, Any]:
     """
     Buy stock function
@@ -131,98 +101,85 @@ def buy(symbol: str, amount: int) -> Dict[str, Any]:
     # get_latest_position returns two values: position dictionary and current maximum operation ID
     # This ID is used to ensure each operation has a unique identifier
     # Acquire lock for atomic read-modify-write on positions
-    with _position_lock(signature):
+    with ledger_transaction(signature):
         try:
             current_position, current_action_id = get_latest_position(today_date, signature)
         except Exception as e:
             print(e)
             print(today_date, signature)
             return {"error": f"Failed to load latest position: {e}", "symbol": symbol, "date": today_date}
-    # Step 3: Get stock opening price for the day
-    # Use get_open_prices function to get the opening price of specified stock for the day
-    # If stock symbol does not exist or price data is missing, KeyError exception will be raised
-    try:
-        this_symbol_price = get_open_prices(today_date, [symbol], market=market)[f"{symbol}_price"]
-    except KeyError:
-        # Stock symbol does not exist or price data is missing, return error message
-        return {
-            "error": f"Symbol {symbol} not found! This action will not be allowed.",
-            "symbol": symbol,
-            "date": today_date,
-        }
-    # Validate price availability (e.g., timestamp not present in dataset yet)
-    if this_symbol_price is None:
-        return {
-            "error": f"Price data not available for {symbol} at {today_date}.",
-            "symbol": symbol,
-            "date": today_date,
-            "market": market,
-        }
-
-    # Step 4: Validate buy conditions
-    # Calculate cash required for purchase: stock price × buy quantity
-    try:
-        cash_left = current_position["CASH"] - this_symbol_price * amount
-    except Exception as e:
-        # Defensive: if any unexpected structure, surface a clear error
-        return {
-            "error": f"Failed to compute cash after purchase: {e}",
-            "symbol": symbol,
-            "date": today_date,
-            "price": this_symbol_price,
-            "amount": amount,
-            "position_keys": list(current_position.keys()),
-        }
-
-    # Check if cash balance is sufficient for purchase
-    if cash_left < 0:
-        # Insufficient cash, return error message
-        return {
-            "error": "Insufficient cash! This action will not be allowed.",
-            "required_cash": this_symbol_price * amount,
-            "cash_available": current_position.get("CASH", 0),
-            "symbol": symbol,
-            "date": today_date,
-        }
-    else:
-        # Step 5: Execute buy operation, update position
-        # Create a copy of current position to avoid directly modifying original data
-        new_position = current_position.copy()
-
-        # Decrease cash balance
-        new_position["CASH"] = cash_left
-
-        # Increase stock position quantity
-        new_position[symbol] = new_position.get(symbol, 0) + amount
-
-        # Step 6: Record transaction to position.jsonl file
-        # Build file path: {project_root}/data/{log_path}/{signature}/position/position.jsonl
-        # Use append mode ("a") to write new transaction record
-        # Each operation ID increments by 1, ensuring uniqueness of operation sequence
-        log_path = get_config_value("LOG_PATH", "./data/agent_data")
-        if log_path.startswith("./data/"):
-            log_path = log_path[7:]  # Remove "./data/" prefix
-        position_file_path = os.path.join(project_root, "data", log_path, signature, "position", "position.jsonl")
-        with open(position_file_path, "a") as f:
-            # Write JSON format transaction record, containing date, operation ID, transaction details and updated position
-            print(
-                f"Writing to position.jsonl: {json.dumps({'date': today_date, 'id': current_action_id + 1, 'this_action':{'action':'buy','symbol':symbol,'amount':amount},'positions': new_position})}"
-            )
-            f.write(
-                json.dumps(
-                    {
-                        "date": today_date,
-                        "id": current_action_id + 1,
-                        "this_action": {"action": "buy", "symbol": symbol, "amount": amount},
-                        "positions": new_position,
-                    }
-                )
-                + "\n"
-            )
-        # Step 7: Return updated position
-        write_config_value("IF_TRADE", True)
-        print("IF_TRADE", get_config_value("IF_TRADE"))
-        return new_position
+        # Step 3: Get stock opening price for the day
+        # Use get_open_prices function to get the opening price of specified stock for the day
+        # If stock symbol does not exist or price data is missing, KeyError exception will be raised
+        try:
+            this_symbol_price = get_open_prices(today_date, [symbol], market=market)[f"{symbol}_price"]
+        except KeyError:
+            # Stock symbol does not exist or price data is missing, return error message
+            return {
+                "error": f"Symbol {symbol} not found! This action will not be allowed.",
+                "symbol": symbol,
+                "date": today_date,
+            }
+        # Validate price availability (e.g., timestamp not present in dataset yet)
+        if this_symbol_price is None:
+            return {
+                "error": f"Price data not available for {symbol} at {today_date}.",
+                "symbol": symbol,
+                "date": today_date,
+                "market": market,
+            }
+
+        # Step 4: Validate buy conditions
+        # Calculate cash required for purchase: stock price × buy quantity
+        try:
+            cash_left = current_position["CASH"] - this_symbol_price * amount
+        except Exception as e:
+            # Defensive: if any unexpected structure, surface a clear error
+            return {
+                "error": f"Failed to compute cash after purchase: {e}",
+                "symbol": symbol,
+                "date": today_date,
+                "price": this_symbol_price,
+                "amount": amount,
+                "position_keys": list(current_position.keys()),
+            }
+
+        # Check if cash balance is sufficient for purchase
+        if cash_left < 0:
+            # Insufficient cash, return error message
+            return {
+                "error": "Insufficient cash! This action will not be allowed.",
+                "required_cash": this_symbol_price * amount,
+                "cash_available": current_position.get("CASH", 0),
+                "symbol": symbol,
+                "date": today_date,
+            }
+        else:
+            # Step 5: Execute buy operation, update position
+            # Create a copy of current position to avoid directly modifying original data
+            new_position = current_position.copy()
+
+            # Decrease cash balance
+            new_position["CASH"] = cash_left
+
+            # Increase stock position quantity
+            new_position[symbol] = new_position.get(symbol, 0) + amount
+
+            # Step 6: Record transaction to position.jsonl file
+            # Append to the signature's ledger (position.jsonl or the SQLite ledger, per LEDGER_BACKEND)
+            # Each operation ID increments by 1, ensuring uniqueness of operation sequence
+            record = {
+                "date": today_date,
+                "id": current_action_id + 1,
+                "this_action": {"action": "buy", "symbol": symbol, "amount": amount},
+                "positions": new_position,
+            }
+            print(f"Writing to position.jsonl: {json.dumps(record)}")
+            append_ledger_record(signature, record, price=this_symbol_price)
+            # Step 7: Return updated position
+            write_config_value("IF_TRADE", True)
+            print("IF_TRADE", get_config_value("IF_TRADE"))
+            return new_position
 
 
 def _get_today_buy_amount(symbol: str, today_date: str, signature: str) -> int:
@@ -237,32 +194,11 @@ def _get_today_buy_amount(symbol: str, today_date: str, signature: str) -> int:
     Returns:
         Total shares bought today
     """
-    log_path = get_config_value("LOG_PATH", "./data/agent_data")
-    if log_path.startswith("./data/"):
-        log_path = log_path[7:]  # Remove "./data/" prefix
-    position_file_path = os.path.join(project_root, "data", log_path, signature, "position", "position.jsonl")
-
-    if not os.path.exists(position_file_path):
-        return 0
-
-    total_bought_today = 0
-    with open(position_file_path, "r") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            try:
-                record = json.loads(line)
-                if record.get("date") == today_date:
-                    this_action = record.get("this_action", {})
-                    if this_action.get("action") == "buy" and this_action.get("symbol") == symbol:
-                        total_bought_today += this_action.get("amount", 0)
-            except Exception:
-                continue
-
-    return total_bought_today
+    return get_today_buy_amount(signature, today_date, symbol)
 
 
 @mcp.tool()
+@with_agent_context
 def sell(symbol: str, amount: int) -> Dict[str, Any]:
     """
     Sell stock function
@@ -340,96 +276,251 @@ def sell(symbol: str, amount: int) -> Dict[str, Any]:
     # Step 2: Get current latest position and operation ID
     # get_latest_position returns two values: position dictionary and current maximum operation ID
     # This ID is used to ensure each operation has a unique identifier
-    current_position, current_action_id = get_latest_position(today_date, signature)
+    # Acquire lock for atomic read-modify-write on positions
+    with ledger_transaction(signature):
+        current_position, current_action_id = get_latest_position(today_date, signature)
 
-    # Step 3: Get stock opening price for the day
-    # Use get_open_prices function to get the opening price of specified stock for the day
-    # If stock symbol does not exist or price data is missing, KeyError exception will be raised
-    try:
-        this_symbol_price = get_open_prices(today_date, [symbol], market=market)[f"{symbol}_price"]
-    except KeyError:
-        # Stock symbol does not exist or price data is missing, return error message
-        return {
-            "error": f"Symbol {symbol} not found! This action will not be allowed.",
-            "symbol": symbol,
-            "date": today_date,
-        }
+        # Step 3: Get stock opening price for the day
+        # Use get_open_prices function to get the opening price of specified stock for the day
+        # If stock symbol does not exist or price data is missing, KeyError exception will be raised
+        try:
+            this_symbol_price = get_open_prices(today_date, [symbol], market=market)[f"{symbol}_price"]
+        except KeyError:
+            # Stock symbol does not exist or price data is missing, return error message
+            return {
+                "error": f"Symbol {symbol} not found! This action will not be allowed.",
+                "symbol": symbol,
+                "date": today_date,
+            }
+
+        # Step 4: Validate sell conditions
+        # Check if holding this stock
+        if symbol not in current_position:
+            return {
+                "error": f"No position for {symbol}! This action will not be allowed.",
+                "symbol": symbol,
+                "date": today_date,
+            }
+
+        # Check if position quantity is sufficient for selling
+        if current_position[symbol] < amount:
+            return {
+                "error": "Insufficient shares! This action will not be allowed.",
+                "have": current_position.get(symbol, 0),
+                "want_to_sell": amount,
+                "symbol": symbol,
+                "date": today_date,
+            }
+
+        # 🇨🇳 Chinese A-shares T+1 trading rule: Cannot sell shares bought on the same day
+        if market == "cn":
+            bought_today = _get_today_buy_amount(symbol, today_date, signature)
+            if bought_today > 0:
+                # Calculate sellable quantity (total position - bought today)
+                sellable_amount = current_position[symbol] - bought_today
+                if amount > sellable_amount:
+                    return {
+                        "error": f"T+1 restriction violated! You bought {bought_today} shares of {symbol} today and cannot sell them until tomorrow.",
+                        "symbol": symbol,
+                        "total_position": current_position[symbol],
+                        "bought_today": bought_today,
+                        "sellable_today": max(0, sellable_amount),
+                        "want_to_sell": amount,
+                        "date": today_date,
+                    }
 
-    # Step 4: Validate sell conditions
-    # Check if holding this stock
-    if symbol not in current_position:
-        return {
-            "error": f"No position for {symbol}! This action will not be allowed.",
-            "symbol": symbol,
-            "date": today_date,
-        }
+        # Step 5: Execute sell operation, update position
+        # Create a copy of current position to avoid directly modifying original data
+        new_position = current_position.copy()
 
-    # Check if position quantity is sufficient for selling
-    if current_position[symbol] < amount:
-        return {
-            "error": "Insufficient shares! This action will not be allowed.",
-            "have": current_position.get(symbol, 0),
-            "want_to_sell": amount,
-            "symbol": symbol,
+        # Decrease stock position quantity
+        new_position[symbol] -= amount
+
+        # Increase cash balance: sell price × sell quantity
+        # Use get method to ensure CASH field exists, default to 0 if not present
+        new_position["CASH"] = new_position.get("CASH", 0) + this_symbol_price * amount
+
+        # Step 6: Record transaction to position.jsonl file
+        # Append to the signature's ledger (position.jsonl or the SQLite ledger, per LEDGER_BACKEND)
+        # Each operation ID increments by 1, ensuring uniqueness of operation sequence
+        record = {
             "date": today_date,
+            "id": current_action_id + 1,
+            "this_action": {"action": "sell", "symbol": symbol, "amount": amount},
+            "positions": new_position,
         }
+        print(f"Writing to position.jsonl: {json.dumps(record)}")
+        append_ledger_record(signature, record, price=this_symbol_price)
 
-    # 🇨🇳 Chinese A-shares T+1 trading rule: Cannot sell shares bought on the same day
-    if market == "cn":
-        bought_today = _get_today_buy_amount(symbol, today_date, signature)
-        if bought_today > 0:
-            # Calculate sellable quantity (total position - bought today)
-            sellable_amount = current_position[symbol] - bought_today
-            if amount > sellable_amount:
-                return {
-                    "error": f"T+1 restriction violated! You bought {bought_today} shares of {symbol} today and cannot sell them until tomorrow.",
-                    "symbol": symbol,
-                    "total_position": current_position[symbol],
-                    "bought_today": bought_today,
-                    "sellable_today": max(0, sellable_amount),
-                    "want_to_sell": amount,
-                    "date": today_date,
-                }
+        # Step 7: Return updated position
+        write_config_value("IF_TRADE", True)
+        return new_position
+
+
+@mcp.tool()
+@with_agent_context
+def place_orders(orders: List[Dict[str, Any]], all_or_nothing: bool = False) -> Dict[str, Any]:
+    """
+    Place several buy/sell orders in one call
+
+    All orders are priced from one snapshot of today's opening prices and applied in the given
+    order against the running position, with the same checks as buy() and sell():
+    positive integer amount, multiples of 100 shares for Chinese A-shares, sufficient cash,
+    sufficient shares and the A-shares T+1 rule (shares bought earlier in the batch count as
+    bought today). The executed orders are recorded together.
 
-    # Step 5: Execute sell operation, update position
-    # Create a copy of current position to avoid directly modifying original data
-    new_position = current_position.copy()
-
-    # Decrease stock position quantity
-    new_position[symbol] -= amount
-
-    # Increase cash balance: sell price × sell quantity
-    # Use get method to ensure CASH field exists, default to 0 if not present
-    new_position["CASH"] = new_position.get("CASH", 0) + this_symbol_price * amount
-
-    # Step 6: Record transaction to position.jsonl file
-    # Build file path: {project_root}/data/{log_path}/{signature}/position/position.jsonl
-    # Use append mode ("a") to write new transaction record
-    # Each operation ID increments by 1, ensuring uniqueness of operation sequence
-    log_path = get_config_value("LOG_PATH", "./data/agent_data")
-    if log_path.startswith("./data/"):
-        log_path = log_path[7:]  # Remove "./data/" prefix
-    position_file_path = os.path.join(project_root, "data", log_path, signature, "position", "position.jsonl")
-    with open(position_file_path, "a") as f:
-        # Write JSON format transaction record, containing date, operation ID and updated position
-        print(
-            f"Writing to position.jsonl: {json.dumps({'date': today_date, 'id': current_action_id + 1, 'this_action':{'action':'sell','symbol':symbol,'amount':amount},'positions': new_position})}"
-        )
-        f.write(
-            json.dumps(
+    Args:
+        orders: List of orders, e.g. [{"action": "sell", "symbol": "MSFT", "amount": 5},
+                {"action": "buy", "symbol": "AAPL", "amount": 10}]
+                Place sells before buys if the buys need the cash they free up.
+        all_or_nothing: If True, nothing is executed unless every order is valid
+
+    Returns:
+        Dict[str, Any]:
+          - "results": one entry per order with "status" ("ok", "error" or "skipped") and, for
+            errors, an "error" message
+          - "executed": number of orders executed
+          - "positions": position after the executed orders
+
+    Example:
+        >>> place_orders([{"action": "sell", "symbol": "MSFT", "amount": 5}, {"action": "buy", "symbol": "AAPL", "amount": 10}])
+    """
+    signature = get_config_value("SIGNATURE")
+    if signature is None:
+        raise ValueError("SIGNATURE environment variable is not set")
+
+    today_date = get_config_value("TODAY_DATE")
+
+    if not isinstance(orders, list) or not orders:
+        return {"error": "orders must be a non-empty list", "date": today_date}
+
+    # One price snapshot per market for every symbol in the batch
+    symbols_by_market: Dict[str, List[str]] = {}
+    for order in orders:
+        symbol = str(order.get("symbol", "")) if isinstance(order, dict) else ""
+        if symbol:
+            market = "cn" if symbol.endswith((".SH", ".SZ")) else "us"
+            symbols_by_market.setdefault(market, []).append(symbol)
+    prices: Dict[str, Optional[float]] = {}
+    for market, symbols in symbols_by_market.items():
+        found = get_open_prices(today_date, symbols, market=market)
+        for symbol in symbols:
+            if f"{symbol}_price" in found:
+                prices[symbol] = found[f"{symbol}_price"]
+
+    with ledger_transaction(signature):
+        try:
+            current_position, current_action_id = get_latest_position(today_date, signature)
+        except Exception as e:
+            return {"error": f"Failed to load latest position: {e}", "date": today_date}
+
+        position = current_position.copy()
+        bought_in_batch: Dict[str, int] = {}
+        results: List[Dict[str, Any]] = []
+        records: List[Dict[str, Any]] = []
+        record_prices: List[float] = []
+
+        for order in orders:
+            if not isinstance(order, dict):
+                results.append({"order": order, "status": "error", "error": "Each order must be an object"})
+                continue
+            action = str(order.get("action", "")).lower()
+            symbol = str(order.get("symbol", ""))
+            result: Dict[str, Any] = {"action": action, "symbol": symbol, "amount": order.get("amount")}
+            results.append(result)
+
+            def _fail(message: str, **extra: Any) -> None:
+                result.update({"status": "error", "error": message, **extra})
+
+            market = "cn" if symbol.endswith((".SH", ".SZ")) else "us"
+            try:
+                amount = int(order.get("amount"))
+            except (TypeError, ValueError):
+                _fail(f"Invalid amount format. Amount must be an integer for stock trading. You provided: {order.get('amount')}")
+                continue
+
+            if action not in ("buy", "sell"):
+                _fail(f"Unknown action '{action}'. Use 'buy' or 'sell'.")
+                continue
+            if amount <= 0:
+                _fail(f"Amount must be positive. You tried to {action} {amount} shares.")
+                continue
+            if market == "cn" and amount % 100 != 0:
+                _fail(
+                    f"Chinese A-shares must be traded in multiples of 100 shares. You tried to {action} {amount} shares.",
+                    suggestion=f"Please use {(amount // 100) * 100} or {((amount // 100) + 1) * 100} shares instead.",
+                )
+                continue
+            if symbol not in prices:
+                _fail(f"Symbol {symbol} not found! This action will not be allowed.")
+                continue
+            price = prices[symbol]
+            if price is None:
+                _fail(f"Price data not available for {symbol} at {today_date}.")
+                continue
+
+            if action == "buy":
+                cash_left = position.get("CASH", 0) - price * amount
+                if cash_left < 0:
+                    _fail(
+                        "Insufficient cash! This action will not be allowed.",
+                        required_cash=price * amount,
+                        cash_available=position.get("CASH", 0),
+                    )
+                    continue
+                position["CASH"] = cash_left
+                position[symbol] = position.get(symbol, 0) + amount
+                bought_in_batch[symbol] = bought_in_batch.get(symbol, 0) + amount
+            else:
+                if symbol not in position:
+                    _fail(f"No position for {symbol}! This action will not be allowed.")
+                    continue
+                if position[symbol] < amount:
+                    _fail("Insufficient shares! This action will not be allowed.", have=position[symbol])
+                    continue
+                # 🇨🇳 Chinese A-shares T+1 trading rule: Cannot sell shares bought on the same day
+                if market == "cn":
+                    bought_today = _get_today_buy_amount(symbol, today_date, signature) + bought_in_batch.get(symbol, 0)
+                    sellable_amount = position[symbol] - bought_today
+                    if bought_today > 0 and amount > sellable_amount:
+                        _fail(
+                            f"T+1 restriction violated! You bought {bought_today} shares of {symbol} today and cannot sell them until tomorrow.",
+                            bought_today=bought_today,
+                            sellable_today=max(0, sellable_amount),
+                        )
+                        continue
+                position[symbol] -= amount
+                position["CASH"] = position.get("CASH", 0) + price * amount
+
+            result.update({"status": "ok", "price": price})
+            records.append(
                 {
                     "date": today_date,
-                    "id": current_action_id + 1,
-                    "this_action": {"action": "sell", "symbol": symbol, "amount": amount},
-                    "positions": new_position,
+                    "id": current_action_id + 1 + len(records),
+                    "this_action": {"action": action, "symbol": symbol, "amount": amount},
+                    "positions": position.copy(),
                 }
             )
-            + "\n"
-        )
+            record_prices.append(price)
 
-    # Step 7: Return updated position
-    write_config_value("IF_TRADE", True)
-    return new_position
+        if all_or_nothing and len(records) < len(results):
+            for result in results:
+                if result.get("status") == "ok":
+                    result["status"] = "skipped"
+            return {"results": results, "executed": 0, "positions": current_position, "date": today_date}
+
+        if records:
+            print(f"Writing {len(records)} records to position.jsonl")
+            append_ledger_records(signature, records, record_prices)
+
+    if records:
+        write_config_value("IF_TRADE", True)
+    return {
+        "results": results,
+        "executed": len(records),
+        "positions": records[-1]["positions"] if records else current_position,
+        "date": today_date,
+    }
 
 
 if __name__ == "__main__":
@@ -11,6 +11,7 @@ load_dotenv()
 from prompts.agent_prompt import all_nasdaq_100_symbols
 # Import tools and prompts
 from tools.general_tools import get_config_value, write_config_value
+from tools.position_ledger import export_ledger_jsonl, ledger_exists
 
 # Agent class mapping table - for dynamic import and instantiation
 AGENT_REGISTRY = {
@@ -185,6 +186,14 @@ async def main(config_path=None):
     base_delay = agent_config.get("base_delay", 0.5)
     initial_cash = agent_config.get("initial_cash", 10000.0)
     verbose = agent_config.get("verbose", False)
+    mcp_session_mode = agent_config.get("mcp_session_mode", "per_call")
+    in_process_tools = agent_config.get("in_process", False)
+    compact_prompt = agent_config.get("compact_prompt", False)
+    prompt_top_k = agent_config.get("prompt_top_k", None)
+    context_budget = agent_config.get("context_budget", None)
+    keep_recent_steps = agent_config.get("keep_recent_steps", 2)
+    llm_cache = agent_config.get("llm_cache", None)
+    tool_concurrency = agent_config.get("tool_concurrency", None)
 
     # Display enabled model information
     model_names = [m.get("name", m.get("signature")) for m in enabled_models]
@@ -194,7 +203,7 @@ async def main(config_path=None):
     print(f"📅 Date range: {INIT_DATE} to {END_DATE}")
     print(f"🤖 Model list: {model_names}")
     print(
-        f"⚙️  Agent config: max_steps={max_steps}, max_retries={max_retries}, base_delay={base_delay}, initial_cash={initial_cash}, verbose={verbose}"
+        f"⚙️  Agent config: max_steps={max_steps}, max_retries={max_retries}, base_delay={base_delay}, initial_cash={initial_cash}, verbose={verbose}, mcp_session_mode={mcp_session_mode}, in_process={in_process_tools}, compact_prompt={compact_prompt}, prompt_top_k={prompt_top_k}, context_budget={context_budget}, llm_cache={llm_cache}, tool_concurrency={tool_concurrency}"
     )
 
     for model_config in enabled_models:
@@ -221,16 +230,16 @@ async def main(config_path=None):
         # Initialize runtime configuration
         # Use the shared config file from RUNTIME_ENV_PATH in .env
         
-        project_root = _Path(__file__).resolve().parent
-        
         # Get log path configuration
         log_path = log_config.get("log_path", "./data/agent_data")
         
-        # Check position file to determine if this is a fresh start
-        position_file = project_root / log_path / signature / "position" / "position.jsonl"
-        
-        # If position file doesn't exist, reset config to start from INIT_DATE
-        if not position_file.exists():
+        # Position ledger backend: "jsonl" (position.jsonl files) or "sqlite" ({log_path}/positions.db)
+        ledger_backend = log_config.get("ledger_backend", os.getenv("LEDGER_BACKEND", "jsonl"))
+        write_config_value("LEDGER_BACKEND", ledger_backend)
+
+        # Check position ledger to determine if this is a fresh start
+        # If the agent has no positions yet, reset config to start from INIT_DATE
+        if not ledger_exists(signature, log_path):
             # Clear the shared config file for fresh start
             from tools.general_tools import _resolve_runtime_env_path
             runtime_env_path = _resolve_runtime_env_path()
@@ -243,8 +252,9 @@ async def main(config_path=None):
         write_config_value("IF_TRADE", False)
         write_config_value("MARKET", market)
         write_config_value("LOG_PATH", log_path)
+        write_config_value("LEDGER_BACKEND", ledger_backend)
         
-        print(f"✅ Runtime config initialized: SIGNATURE={signature}, MARKET={market}")
+        print(f"✅ Runtime config initialized: SIGNATURE={signature}, MARKET={market}, LEDGER_BACKEND={ledger_backend}")
 
         # Select symbols based on agent type and market
         # Crypto and Forex agents have different parameter requirements
@@ -275,7 +285,15 @@ async def main(config_path=None):
                     initial_cash=initial_cash,
                     init_date=INIT_DATE,
                     openai_base_url=openai_base_url,
-                    openai_api_key=openai_api_key
+                    openai_api_key=openai_api_key,
+                    mcp_session_mode=mcp_session_mode,
+                    in_process_tools=in_process_tools,
+                    compact_prompt=compact_prompt,
+                    prompt_top_k=prompt_top_k,
+                    context_budget=context_budget,
+                    keep_recent_steps=keep_recent_steps,
+                    llm_cache=llm_cache,
+                    tool_concurrency=tool_concurrency
                 )
             elif agent_type == "BaseAgentForex":
                 # Get forex pairs from config
@@ -291,7 +309,15 @@ async def main(config_path=None):
                     initial_cash=initial_cash,
                     init_date=INIT_DATE,
                     openai_base_url=openai_base_url,
-                    openai_api_key=openai_api_key
+                    openai_api_key=openai_api_key,
+                    mcp_session_mode=mcp_session_mode,
+                    in_process_tools=in_process_tools,
+                    compact_prompt=compact_prompt,
+                    prompt_top_k=prompt_top_k,
+                    context_budget=context_budget,
+                    keep_recent_steps=keep_recent_steps,
+                    llm_cache=llm_cache,
+                    tool_concurrency=tool_concurrency
                 )
             else:
                 agent = AgentClass(
@@ -305,7 +331,15 @@ async def main(config_path=None):
                     initial_cash=initial_cash,
                     init_date=INIT_DATE,
                     openai_base_url=openai_base_url,
-                    openai_api_key=openai_api_key
+                    openai_api_key=openai_api_key,
+                    mcp_session_mode=mcp_session_mode,
+                    in_process_tools=in_process_tools,
+                    compact_prompt=compact_prompt,
+                    prompt_top_k=prompt_top_k,
+                    context_budget=context_budget,
+                    keep_recent_steps=keep_recent_steps,
+                    llm_cache=llm_cache,
+                    tool_concurrency=tool_concurrency
                 )
 
             print(f"✅ {agent_type} instance created successfully: {agent}")
@@ -316,6 +350,11 @@ async def main(config_path=None):
             # Run all trading days in date range
             await agent.run_date_range(INIT_DATE, END_DATE)
 
+            # Keep position.jsonl in sync for the metrics and UI scripts when positions live in SQLite
+            exported = export_ledger_jsonl(signature, log_path)
+            if exported is not None:
+                print(f"📤 Exported {exported} position records to position.jsonl")
+
             # Display final position summary
             summary = agent.get_position_summary()
             # Get currency symbol from agent's actual market (more accurate)
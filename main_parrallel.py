@@ -97,7 +97,8 @@ def load_config(config_path=None):
         exit(1)
 
 
-async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END_DATE, agent_config, log_config):
+def _create_agent(AgentClass, model_config, INIT_DATE, agent_config, log_config):
+    """Build an agent for one model entry, or return None if the entry is incomplete."""
     model_name = model_config.get("name", "unknown")
     basemodel = model_config.get("basemodel")
     signature = model_config.get("signature")
@@ -106,16 +107,63 @@ async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END
 
     if not basemodel:
         print(f"❌ Model {model_name} missing basemodel field")
-        return
+        return None
     if not signature:
         print(f"❌ Model {model_name} missing signature field")
-        return
+        return None
 
     print("=" * 60)
     print(f"🤖 Processing model: {model_name}")
     print(f"📝 Signature: {signature}")
     print(f"🔧 BaseModel: {basemodel}")
 
+    max_steps = agent_config.get("max_steps", 10)
+    max_retries = agent_config.get("max_retries", 3)
+    base_delay = agent_config.get("base_delay", 0.5)
+    initial_cash = agent_config.get("initial_cash", 10000.0)
+
+    log_path = log_config.get("log_path", "./data/agent_data")
+
+    agent = AgentClass(
+        signature=signature,
+        basemodel=basemodel,
+        stock_symbols=all_nasdaq_100_symbols,
+        log_path=log_path,
+        openai_base_url=openai_base_url,
+        openai_api_key=openai_api_key,
+        max_steps=max_steps,
+        max_retries=max_retries,
+        base_delay=base_delay,
+        initial_cash=initial_cash,
+        init_date=INIT_DATE,
+        mcp_session_mode=agent_config.get("mcp_session_mode", "per_call"),
+        in_process_tools=agent_config.get("in_process", False),
+        compact_prompt=agent_config.get("compact_prompt", False),
+        prompt_top_k=agent_config.get("prompt_top_k", None),
+        context_budget=agent_config.get("context_budget", None),
+        keep_recent_steps=agent_config.get("keep_recent_steps", 2),
+        llm_cache=agent_config.get("llm_cache", None),
+        tool_concurrency=agent_config.get("tool_concurrency", None)
+    )
+    print(f"✅ {AgentClass.__name__} instance created successfully: {agent}")
+    return agent
+
+
+def _print_position_summary(agent):
+    summary = agent.get_position_summary()
+    print(f"📊 Final position summary ({agent.signature}):")
+    print(f"   - Latest date: {summary.get('latest_date')}")
+    print(f"   - Total records: {summary.get('total_records')}")
+    print(f"   - Cash balance: ${summary.get('positions', {}).get('CASH', 0):.2f}")
+
+
+async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END_DATE, agent_config, log_config):
+    model_name = model_config.get("name", "unknown")
+    agent = _create_agent(AgentClass, model_config, INIT_DATE, agent_config, log_config)
+    if agent is None:
+        return
+    signature = agent.signature
+
     project_root = Path(__file__).resolve().parent
     runtime_env_dir = project_root / "data" / "agent_data" / signature
     runtime_env_dir.mkdir(parents=True, exist_ok=True)
@@ -125,38 +173,12 @@ async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END
     write_config_value("TODAY_DATE", END_DATE)
     write_config_value("IF_TRADE", False)
 
-    max_steps = agent_config.get("max_steps", 10)
-    max_retries = agent_config.get("max_retries", 3)
-    base_delay = agent_config.get("base_delay", 0.5)
-    initial_cash = agent_config.get("initial_cash", 10000.0)
-
-    log_path = log_config.get("log_path", "./data/agent_data")
-
     try:
-        agent = AgentClass(
-            signature=signature,
-            basemodel=basemodel,
-            stock_symbols=all_nasdaq_100_symbols,
-            log_path=log_path,
-            openai_base_url=openai_base_url,
-            openai_api_key=openai_api_key,
-            max_steps=max_steps,
-            max_retries=max_retries,
-            base_delay=base_delay,
-            initial_cash=initial_cash,
-            init_date=INIT_DATE
-        )
-
-        print(f"✅ {AgentClass.__name__} instance created successfully: {agent}")
         await agent.initialize()
         print("✅ Initialization successful")
         await agent.run_date_range(INIT_DATE, END_DATE)
 
-        summary = agent.get_position_summary()
-        print(f"📊 Final position summary:")
-        print(f"   - Latest date: {summary.get('latest_date')}")
-        print(f"   - Total records: {summary.get('total_records')}")
-        print(f"   - Cash balance: ${summary.get('positions', {}).get('CASH', 0):.2f}")
+        _print_position_summary(agent)
 
     except Exception as e:
         print(f"❌ Error processing model {model_name} ({signature}): {str(e)}")
@@ -168,32 +190,224 @@ async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END
     print("=" * 60)
 
 
-async def _spawn_model_subprocesses(config_path, enabled_models):
-    tasks = []
+async def _run_models_in_event_loop(AgentClass, enabled_models, INIT_DATE, END_DATE, agent_config, log_config,
+                                    parallel_config):
+    """Run every enabled model as an asyncio task in this process.
+
+    Instead of one subprocess per model, the agents share:
+    - the process-wide price store (tools/price_store.py), loaded once up front
+    - one MCP client; each tool call carries the calling agent's context headers
+      (tools/agent_context.py), so the shared connections still act per signature
+    - a semaphore capping concurrent LLM steps across all agents (parallel_config.llm_concurrency)
+
+    Each agent keeps its own position ledger and logs under {log_path}/{signature}.
+    """
+    from tools.agent_context import bind_context_headers
+    from tools.local_tools import split_mcp_config
+    from tools.mcp_client import create_mcp_client
+    from tools.price_store import get_price_store
+    from tools.price_tools import get_merged_file_path
+    from tools.tool_concurrency import limit_tool_concurrency, load_server_tools
+
+    agents = []
+    for model_config in enabled_models:
+        agent = _create_agent(AgentClass, model_config, INIT_DATE, agent_config, log_config)
+        if agent is not None:
+            agents.append(agent)
+    if not agents:
+        return
+
+    # Shared read-only price store: loaded once here, then served from memory to every agent
+    for market in sorted({agent.market for agent in agents}):
+        merged_file = get_merged_file_path(market)
+        if merged_file.exists():
+            get_price_store(merged_file)
+            print(f"📦 Price store loaded: {merged_file}")
+
+    # One MCP client (and one tool list) for all agents
+    # (persistent mode keeps one session per server and agent; the per-server tool call caps are
+    # shared by all agents, trades are serialized per calling signature)
+    remote_config, local_servers = split_mcp_config(
+        bind_context_headers(agents[0].mcp_config), agent_config.get("in_process", False)
+    )
+    client = create_mcp_client(
+        remote_config,
+        agent_config.get("mcp_session_mode", "per_call"),
+        max_sessions_per_server=len(agents),
+    )
+    tools = limit_tool_concurrency(
+        await load_server_tools(client, local_servers), tool_concurrency=agent_config.get("tool_concurrency")
+    )
+    print(f"✅ Shared MCP client loaded {len(tools)} tools for {len(agents)} agents")
+
+    llm_concurrency = max(1, int(parallel_config.get("llm_concurrency", 4)))
+    llm_semaphore = asyncio.Semaphore(llm_concurrency)
+    print(f"🚦 LLM concurrency limit: {llm_concurrency}")
+
+    async def run_agent(agent):
+        agent.client = client
+        agent.tools = tools
+        agent.llm_semaphore = llm_semaphore
+        await agent.initialize()
+        await agent.run_date_range(INIT_DATE, END_DATE)
+        _print_position_summary(agent)
+
+    results = await asyncio.gather(*(run_agent(agent) for agent in agents), return_exceptions=True)
+
+    failed = []
+    for agent, result in zip(agents, results):
+        if isinstance(result, BaseException):
+            print(f"❌ Error processing {agent.signature}: {result}")
+            failed.append(agent.signature)
+    if failed:
+        raise RuntimeError(f"❌ {len(failed)}/{len(agents)} agents failed: {', '.join(failed)}")
+
+
+def _estimate_remaining_days(signature, log_path, market, init_date, end_date):
+    """Trading days a signature still has to run, used to schedule the longest jobs first."""
+    from tools.position_ledger import get_last_ledger_date, ledger_exists
+    from tools.price_tools import get_trading_calendar
+
+    start = init_date[:10]
+    try:
+        if ledger_exists(signature, log_path):
+            start = max(start, (get_last_ledger_date(signature, log_path) or start)[:10])
+        calendar = get_trading_calendar(market=market, granularity="daily")
+        return len(calendar.range(start, end_date[:10], include_start=False))
+    except Exception as e:
+        print(f"⚠️  Could not estimate remaining days for {signature}: {e}")
+        return 0
+
+
+def _write_progress(progress_path, progress):
+    """Atomically rewrite the machine-readable progress file."""
+    progress["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    counts = {}
+    for job in progress["jobs"].values():
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    progress["counts"] = counts
+    tmp_path = progress_path.with_name(f"{progress_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(progress, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, progress_path)
+
+
+async def _spawn_model_subprocesses(config_path, enabled_models, INIT_DATE, END_DATE, market, log_config,
+                                    parallel_config):
+    """Run one subprocess per model through a bounded worker pool.
+
+    Jobs are (signature, date range) pairs, started longest-first by remaining trading days, with
+    at most parallel_config.max_workers subprocesses alive at once. A job whose process exits with
+    an error is retried up to max_retries times with exponential backoff; the agent resumes from
+    its position ledger, so a retry only redoes the unfinished days. Job states are written to
+    parallel_config.progress_file (default {log_path}/parallel_progress.json) after every change.
+    """
     python_exec = sys.executable
     this_file = str(Path(__file__).resolve())
+    log_path = log_config.get("log_path", "./data/agent_data")
+
+    max_workers = max(1, int(parallel_config.get("max_workers", os.cpu_count() or 4)))
+    max_retries = max(0, int(parallel_config.get("max_retries", 2)))
+    retry_backoff = float(parallel_config.get("retry_backoff", 5.0))
+    progress_path = Path(parallel_config.get("progress_file") or Path(log_path) / "parallel_progress.json")
+    progress_path.parent.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
     for model in enabled_models:
         signature = model.get("signature")
         if not signature:
             continue
+        remaining = _estimate_remaining_days(signature, log_path, market, INIT_DATE, END_DATE)
+        jobs.append({"signature": signature, "init_date": INIT_DATE, "end_date": END_DATE, "remaining_days": remaining})
+    if not jobs:
+        return
+
+    # Longest expected job first, so the slowest model is not the last one started
+    jobs.sort(key=lambda job: job["remaining_days"], reverse=True)
+
+    progress = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config_path": str(config_path) if config_path else None,
+        "max_workers": max_workers,
+        "jobs": {
+            job["signature"]: {
+                "status": "queued",
+                "init_date": job["init_date"],
+                "end_date": job["end_date"],
+                "remaining_days": job["remaining_days"],
+                "attempts": 0,
+                "returncode": None,
+                "started_at": None,
+                "finished_at": None,
+            }
+            for job in jobs
+        },
+    }
+    _write_progress(progress_path, progress)
+    print(f"🧮 Scheduling {len(jobs)} jobs on {max_workers} workers (progress: {progress_path})")
+
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def run_job(job):
+        signature = job["signature"]
+        state = progress["jobs"][signature]
         cmd = [python_exec, this_file]
         if config_path:
             cmd.append(str(config_path))
         cmd.extend(["--signature", signature])
-        print(f"🧩 Spawning subprocess for signature='{signature}': {' '.join(cmd)}")
-        proc = await asyncio.create_subprocess_exec(*cmd)
-        tasks.append(proc.wait())
-    if not tasks:
-        return
-    await asyncio.gather(*tasks)
-
-
-async def main(config_path=None, only_signature: str | None = None):
+        env = dict(os.environ, INIT_DATE=job["init_date"], END_DATE=job["end_date"])
+
+        for attempt in range(1, max_retries + 2):
+            state.update(status="running", attempts=attempt, started_at=datetime.now().isoformat(timespec="seconds"))
+            _write_progress(progress_path, progress)
+            print(f"🧩 Spawning subprocess for signature='{signature}' (attempt {attempt}): {' '.join(cmd)}")
+            proc = await asyncio.create_subprocess_exec(*cmd, env=env)
+            returncode = await proc.wait()
+            state.update(returncode=returncode, finished_at=datetime.now().isoformat(timespec="seconds"))
+            if returncode == 0:
+                state["status"] = "succeeded"
+                _write_progress(progress_path, progress)
+                print(f"✅ {signature} finished")
+                return
+            if attempt > max_retries:
+                break
+            wait_time = retry_backoff * 2 ** (attempt - 1)
+            state["status"] = "retrying"
+            _write_progress(progress_path, progress)
+            print(f"⏳ {signature} exited with code {returncode}, retrying in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+
+        state["status"] = "failed"
+        _write_progress(progress_path, progress)
+        print(f"💥 {signature} failed after {state['attempts']} attempts (exit code {state['returncode']})")
+
+    async def worker():
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await run_job(job)
+            finally:
+                queue.task_done()
+
+    await asyncio.gather(*(worker() for _ in range(min(max_workers, len(jobs)))))
+
+    failed = [signature for signature, state in progress["jobs"].items() if state["status"] == "failed"]
+    if failed:
+        print(f"❌ {len(failed)}/{len(jobs)} model subprocesses failed: {', '.join(failed)}")
+
+
+async def main(config_path=None, only_signature: str | None = None, in_process: bool = False):
     """Run trading experiment using Agent class (parallel runner)
     
     Args:
         config_path: Configuration file path, if None use default config
         only_signature: If provided, run only this model signature
+        in_process: Run all models as asyncio tasks in this process instead of subprocesses
     """
     # Load configuration file
     config = load_config(config_path)
@@ -244,6 +458,9 @@ async def main(config_path=None, only_signature: str | None = None):
     # Get agent configuration
     agent_config = config.get("agent_config", {})
     log_config = config.get("log_config", {})
+    parallel_config = config.get("parallel_config", {})
+    if parallel_config.get("mode") == "in_process":
+        in_process = True
 
     # Display enabled model information
     model_names = [m.get("name", m.get("signature")) for m in enabled_models]
@@ -256,9 +473,17 @@ async def main(config_path=None, only_signature: str | None = None):
         for model_config in enabled_models:
             await _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END_DATE, agent_config, log_config)
         print("🎉 All models processing completed!")
+    elif in_process:
+        print("⚡ Multiple models enabled; running them as asyncio tasks in this process...")
+        await _run_models_in_event_loop(
+            AgentClass, enabled_models, INIT_DATE, END_DATE, agent_config, log_config, parallel_config
+        )
+        print("🎉 All models processing completed!")
     else:
         print("⚡ Multiple models enabled; running them in parallel using subprocesses...")
-        await _spawn_model_subprocesses(config_path, enabled_models)
+        await _spawn_model_subprocesses(
+            config_path, enabled_models, INIT_DATE, END_DATE, config.get("market", "us"), log_config, parallel_config
+        )
         print("🎉 All model subprocesses completed!")
 
 
@@ -266,6 +491,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="AI-Trader parallel runner")
     parser.add_argument("config_path", nargs="?", default=None, help="Path to config JSON")
     parser.add_argument("--signature", dest="signature", default=None, help="Run only this model signature")
+    parser.add_argument(
+        "--in-process",
+        dest="in_process",
+        action="store_true",
+        help="Run all models as asyncio tasks in one process, sharing price data and the MCP client",
+    )
     args = parser.parse_args()
 
     if args.config_path:
@@ -275,5 +506,5 @@ if __name__ == "__main__":
     if args.signature:
         print(f"🎯 Filtering to single signature: {args.signature}")
 
-    asyncio.run(main(args.config_path, args.signature))
+    asyncio.run(main(args.config_path, args.signature, args.in_process))
 
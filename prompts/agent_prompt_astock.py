@@ -20,9 +20,13 @@ sys.path.insert(0, project_root)
 from tools.general_tools import get_config_value
 from tools.price_tools import (all_sse_50_symbols,
                                format_price_dict_with_names, get_open_prices,
+                               get_stock_name_mapping,
                                get_today_init_position, get_yesterday_date,
                                get_yesterday_open_and_close_price,
                                get_yesterday_profit)
+from tools.prompt_context import get_prompt_prices
+from prompts.prompt_render import (TODAY_PRICES_IN_TABLE, price_table,
+                                   render_nonzero, report_prompt_tokens)
 
 STOP_SIGNAL = "<FINISH_SIGNAL>"
 
@@ -95,7 +99,13 @@ When you think the task is completed, output
 """
 
 
-def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbols: Optional[List[str]] = None) -> str:
+def get_agent_system_prompt_astock(
+    today_date: str,
+    signature: str,
+    stock_symbols: Optional[List[str]] = None,
+    compact: bool = False,
+    top_k: Optional[int] = None,
+) -> str:
     """
     Generate A-share specific system prompt
 
@@ -103,6 +113,8 @@ def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbol
         today_date: Today's date
         signature: Agent signature
         stock_symbols: List of stock codes, default is SSE 50 constituents
+        compact: Render non-zero holdings and one price table instead of full dicts
+        top_k: With compact, keep only the K largest movers (plus holdings) in the price table
 
     Returns:
         Formatted system prompt string
@@ -118,11 +130,10 @@ def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbol
     # Get buy and sell prices of previous time point, hardcoded market="cn"
     # For daily trading: Get yesterday's open and close price
     # For hourly trading: Get previous hour's open and close price
-    yesterday_buy_prices, yesterday_sell_prices = get_yesterday_open_and_close_price(
-        today_date, stock_symbols, market="cn"
-    )
-    # Get buy price of current time point
-    today_buy_price = get_open_prices(today_date, stock_symbols, market="cn")
+    # Plus the buy price of the current time point (precomputed for the run when available)
+    prompt_prices = get_prompt_prices(today_date, stock_symbols, market="cn")
+    yesterday_buy_prices, yesterday_sell_prices = prompt_prices.yesterday_buy, prompt_prices.yesterday_sell
+    today_buy_price = prompt_prices.today_buy
     # Get current position
     today_init_position = get_today_init_position(today_date, signature)
     
@@ -134,10 +145,10 @@ def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbol
     )
 
     # A-share market shows Chinese stock names (Note: keeping keys in English/Codes but names might come from tool)
-    yesterday_sell_prices_display = format_price_dict_with_names(yesterday_sell_prices, market="cn")
-    today_buy_price_display = format_price_dict_with_names(today_buy_price, market="cn")
+    yesterday_sell_prices_display = prompt_prices.yesterday_sell_display
+    today_buy_price_display = prompt_prices.today_buy_display
 
-    return agent_system_prompt_astock.format(
+    prompt = agent_system_prompt_astock.format(
         date=today_date,
         positions=today_init_position,
         STOP_SIGNAL=STOP_SIGNAL,
@@ -145,6 +156,27 @@ def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbol
         today_buy_price=today_buy_price_display,
         current_profit=current_profit,
     )
+    if not compact:
+        report_prompt_tokens(prompt)
+        return prompt
+
+    # Non-zero holdings and profits, and one price table (with stock names) instead of the full dicts
+    compact_prompt = agent_system_prompt_astock.format(
+        date=today_date,
+        positions=render_nonzero(today_init_position),
+        STOP_SIGNAL=STOP_SIGNAL,
+        yesterday_close_price=price_table(
+            yesterday_sell_prices,
+            today_buy_price,
+            today_init_position,
+            names=get_stock_name_mapping("cn"),
+            top_k=top_k,
+        ),
+        today_buy_price=TODAY_PRICES_IN_TABLE,
+        current_profit=render_nonzero(current_profit, keep=()),
+    )
+    report_prompt_tokens(compact_prompt, prompt)
+    return compact_prompt
 
 
 if __name__ == "__main__":
@@ -18,6 +18,9 @@ from tools.price_tools import (format_price_dict_with_names, get_open_prices,
                                get_today_init_position, get_yesterday_date,
                                get_yesterday_open_and_close_price,
                                get_yesterday_profit)
+from tools.prompt_context import get_prompt_prices
+from prompts.prompt_render import (TODAY_PRICES_IN_TABLE, price_table,
+                                   render_nonzero, report_prompt_tokens)
 
 STOP_SIGNAL = "<FINISH_SIGNAL>"
 
@@ -63,7 +66,12 @@ When you think your task is complete, output
 
 
 def get_agent_system_prompt_crypto(
-    today_date: str, signature: str, market: str = "crypto", crypto_symbols: Optional[List[str]] = None
+    today_date: str,
+    signature: str,
+    market: str = "crypto",
+    crypto_symbols: Optional[List[str]] = None,
+    compact: bool = False,
+    top_k: Optional[int] = None,
 ) -> str:
     print(f"signature: {signature}")
     print(f"today_date: {today_date}")
@@ -75,14 +83,13 @@ def get_agent_system_prompt_crypto(
         crypto_symbols = BaseAgentCrypto.DEFAULT_CRYPTO_SYMBOLS
 
     # Get yesterday's buy and sell prices
-    yesterday_buy_prices, yesterday_sell_prices = get_yesterday_open_and_close_price(
-        today_date, crypto_symbols, market=market
-    )
-    today_buy_price = get_open_prices(today_date, crypto_symbols, market=market)
+    prompt_prices = get_prompt_prices(today_date, crypto_symbols, market=market)
+    yesterday_buy_prices, yesterday_sell_prices = prompt_prices.yesterday_buy, prompt_prices.yesterday_sell
+    today_buy_price = prompt_prices.today_buy
     today_init_position = get_today_init_position(today_date, signature)
     # yesterday_profit = get_yesterday_profit(today_date, yesterday_buy_prices, yesterday_sell_prices, today_init_position)
 
-    return agent_system_prompt_crypto.format(
+    prompt = agent_system_prompt_crypto.format(
         date=today_date,
         positions=today_init_position,
         STOP_SIGNAL=STOP_SIGNAL,
@@ -90,6 +97,20 @@ def get_agent_system_prompt_crypto(
         today_buy_price=today_buy_price,
         # yesterday_profit=yesterday_profit
     )
+    if not compact:
+        report_prompt_tokens(prompt)
+        return prompt
+
+    # Non-zero holdings and one price table instead of the full dict reprs
+    compact_prompt = agent_system_prompt_crypto.format(
+        date=today_date,
+        positions=render_nonzero(today_init_position),
+        STOP_SIGNAL=STOP_SIGNAL,
+        yesterday_close_price=price_table(yesterday_sell_prices, today_buy_price, today_init_position, top_k=top_k),
+        today_buy_price=TODAY_PRICES_IN_TABLE,
+    )
+    report_prompt_tokens(compact_prompt, prompt)
+    return compact_prompt
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+Compact rendering of the price and position inputs of the agent system prompts.
+
+The default prompts embed Python dict reprs: every symbol of the universe in `positions`, most of
+them 0, and two `{symbol}_price` dicts for yesterday's close and today's buy price. With
+`compact_prompt` the prompts show instead:
+
+    Holdings: CASH: 6210.33, AAPL: 10, NVDA: 5
+
+    symbol      prev_close  today_open  change%
+    AAPL            254.49      255.10   +0.24%
+    NVDA            181.85      183.22   +0.75%
+    ...
+
+Only non-zero holdings are listed, and prev close, today's open and the change between them share
+one aligned table. With `prompt_top_k` the table keeps the K symbols that moved most (by
+|change%|) plus every symbol held, and says how many were left out.
+
+count_tokens / report_prompt_tokens measure the prompt, so the saving per model call (the system
+prompt is re-sent on every call of a session) can be read from the logs.
+"""
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Replaces the separate "Current buying prices" dict in compact prompts
+TODAY_PRICES_IN_TABLE = "See the today_open column of the table above."
+
+_ENCODER: Any = None
+
+
+def _format_number(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if float(value).is_integer():
+        return str(int(value))
+    return format(value, ".10g")
+
+
+def render_nonzero(values: Mapping[str, Any], keep: Iterable[str] = ("CASH",), empty: str = "none") -> str:
+    """Render `name: value` pairs, dropping zero values except for the names in `keep`.
+
+    Args:
+        values: Mapping such as a position dict {"CASH": 10000.0, "AAPL": 10, "MSFT": 0}
+        keep: Names that are always shown
+        empty: Text returned when nothing is left
+
+    Returns:
+        e.g. "CASH: 10000, AAPL: 10"
+    """
+    keep = set(keep)
+    items = [
+        f"{name}: {_format_number(value)}"
+        for name, value in values.items()
+        if name in keep or (value is not None and value != 0)
+    ]
+    return ", ".join(items) if items else empty
+
+
+def _change_pct(prev_close: Optional[float], today_open: Optional[float]) -> Optional[float]:
+    if prev_close is None or today_open is None or prev_close == 0:
+        return None
+    return (today_open - prev_close) / prev_close * 100
+
+
+def price_table(
+    yesterday_close: Mapping[str, Optional[float]],
+    today_open: Mapping[str, Optional[float]],
+    positions: Optional[Mapping[str, Any]] = None,
+    names: Optional[Mapping[str, str]] = None,
+    top_k: Optional[int] = None,
+) -> str:
+    """One aligned symbol / prev close / today open / change% table.
+
+    Args:
+        yesterday_close: {"<symbol>_price": previous close}, as returned by the price tools
+        today_open: {"<symbol>_price": today's open (buy) price}
+        positions: Current positions; held symbols are always kept by the top-K filter
+        names: Optional symbol -> name mapping, shown next to the symbol (A-shares)
+        top_k: Keep only the K largest movers by |change%| (plus held symbols); None keeps all
+
+    Returns:
+        Table text
+    """
+    symbols: List[str] = []
+    for key in list(yesterday_close) + list(today_open):
+        symbol = key[:-6] if key.endswith("_price") else key
+        if symbol not in symbols:
+            symbols.append(symbol)
+
+    rows: List[Tuple[str, Optional[float], Optional[float], Optional[float]]] = []
+    for symbol in symbols:
+        prev_close = yesterday_close.get(f"{symbol}_price")
+        open_price = today_open.get(f"{symbol}_price")
+        rows.append((symbol, prev_close, open_price, _change_pct(prev_close, open_price)))
+
+    omitted = 0
+    if top_k is not None and top_k >= 0 and len(rows) > top_k:
+        held = {symbol for symbol, amount in (positions or {}).items() if symbol != "CASH" and amount}
+        movers = sorted(
+            (row for row in rows if row[3] is not None and row[0] not in held), key=lambda row: -abs(row[3])
+        )
+        selected = held | {row[0] for row in movers[:top_k]}
+        omitted = len(rows) - sum(1 for row in rows if row[0] in selected)
+        rows = [row for row in rows if row[0] in selected]
+
+    labels = [f"{symbol} ({names[symbol]})" if names and names.get(symbol) else symbol for symbol, *_ in rows]
+    cells = [
+        (label, _format_number(prev_close), _format_number(open_price), "-" if change is None else f"{change:+.2f}%")
+        for label, (_, prev_close, open_price, change) in zip(labels, rows)
+    ]
+    header = ("symbol", "prev_close", "today_open", "change%")
+    widths = [max(len(row[i]) for row in [header] + cells) for i in range(4)]
+
+    lines = [
+        "  ".join([row[0].ljust(widths[0])] + [row[i].rjust(widths[i]) for i in range(1, 4)]).rstrip()
+        for row in [header] + cells
+    ]
+    if omitted:
+        lines.append(f"({omitted} other symbols omitted: showing the {top_k} largest movers and current holdings)")
+    return "\n".join(lines)
+
+
+def count_tokens(text: str) -> int:
+    """Approximate LLM token count of `text`.
+
+    Uses tiktoken's o200k_base encoding when tiktoken is installed, and ~4 characters per token
+    otherwise.
+    """
+    global _ENCODER
+    if _ENCODER is None:
+        try:
+            import tiktoken
+
+            _ENCODER = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODER = False
+    if _ENCODER:
+        return len(_ENCODER.encode(text))
+    return (len(text) + 3) // 4
+
+
+def report_prompt_tokens(prompt: str, full_prompt: Optional[str] = None) -> Dict[str, int]:
+    """Print (and return) the token count of a system prompt.
+
+    Args:
+        prompt: The prompt that will be sent
+        full_prompt: The same prompt rendered without compaction, to report the saving
+
+    Returns:
+        {"tokens": n} plus "full_tokens" and "saved_tokens" when full_prompt is given
+    """
+    report = {"tokens": count_tokens(prompt)}
+    if full_prompt is None:
+        print(f"📏 System prompt: {report['tokens']:,} tokens per model call")
+        return report
+
+    report["full_tokens"] = count_tokens(full_prompt)
+    report["saved_tokens"] = report["full_tokens"] - report["tokens"]
+    saved_pct = report["saved_tokens"] / report["full_tokens"] * 100 if report["full_tokens"] else 0.0
+    print(
+        f"📏 System prompt: {report['tokens']:,} tokens per model call "
+        f"(full: {report['full_tokens']:,}, saved {report['saved_tokens']:,} / {saved_pct:.0f}%)"
+    )
+    return report
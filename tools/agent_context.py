@@ -0,0 +1,213 @@
+"""
+Per-request agent context for the MCP tool servers.
+
+The tool servers used to learn who is calling and what "today" is only from the shared runtime env
+file (RUNTIME_ENV_PATH), so agents running in parallel against one set of servers overwrote each
+other's SIGNATURE / TODAY_DATE. Agents now send their context with every MCP request as HTTP
+headers:
+
+    X-AI-Trader-Signature       SIGNATURE
+    X-AI-Trader-Today-Date      TODAY_DATE
+    X-AI-Trader-Log-Path        LOG_PATH
+    X-AI-Trader-Market          MARKET
+    X-AI-Trader-Ledger-Backend  LEDGER_BACKEND
+
+Tools decorated with `with_agent_context` read these headers and expose them through a context
+variable for the duration of the call. get_config_value consults that context first and falls back
+to the runtime env file, so agents that send no headers behave exactly as before.
+
+Per-agent flags that tools write back (IF_TRADE, LOG_FILE) are stored under
+"<KEY>@<signature>" while a context is active, so one agent's trade never marks another's day as
+traded.
+"""
+
+import copy
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional
+
+HEADER_PREFIX = "X-AI-Trader-"
+
+# Config key -> header name
+CONTEXT_HEADERS: Dict[str, str] = {
+    "SIGNATURE": "X-AI-Trader-Signature",
+    "TODAY_DATE": "X-AI-Trader-Today-Date",
+    "LOG_PATH": "X-AI-Trader-Log-Path",
+    "MARKET": "X-AI-Trader-Market",
+    "LEDGER_BACKEND": "X-AI-Trader-Ledger-Backend",
+}
+
+# Config keys that belong to one agent and are namespaced by signature while a context is active
+AGENT_SCOPED_KEYS = ("IF_TRADE", "LOG_FILE")
+
+# MCP transports that carry HTTP headers
+HTTP_TRANSPORTS = ("streamable_http", "sse")
+
+_AGENT_CONTEXT: ContextVar[Optional[Dict[str, Any]]] = ContextVar("ai_trader_agent_context", default=None)
+
+
+def get_agent_context() -> Dict[str, Any]:
+    """Context of the current request or agent session ({} when none is active)."""
+    return _AGENT_CONTEXT.get() or {}
+
+
+def get_context_value(key: str) -> Optional[Any]:
+    """Value of `key` in the active context, or None."""
+    context = _AGENT_CONTEXT.get()
+    if not context:
+        return None
+    return context.get(key)
+
+
+def scoped_config_key(key: str) -> str:
+    """Runtime env key for `key`, namespaced by the active signature for per-agent flags."""
+    if key in AGENT_SCOPED_KEYS:
+        signature = get_context_value("SIGNATURE")
+        if signature:
+            return f"{key}@{signature}"
+    return key
+
+
+@contextmanager
+def agent_context(**values: Any) -> Iterator[Dict[str, Any]]:
+    """Activate an agent context for the enclosed block.
+
+    Keys are config names (SIGNATURE, TODAY_DATE, LOG_PATH, MARKET, LEDGER_BACKEND); None values
+    are dropped. Contexts nest, and inner values override outer ones.
+
+    Example:
+        with agent_context(SIGNATURE="gpt-5", TODAY_DATE="2025-10-20"):
+            await agent.run_with_retry("2025-10-20")
+    """
+    context = dict(get_agent_context())
+    context.update({key: value for key, value in values.items() if value is not None})
+    token = _AGENT_CONTEXT.set(context)
+    try:
+        yield context
+    finally:
+        _AGENT_CONTEXT.reset(token)
+
+
+def context_headers(context: Mapping[str, Any]) -> Dict[str, str]:
+    """HTTP headers carrying `context` to the tool servers."""
+    return {
+        header: str(context[key])
+        for key, header in CONTEXT_HEADERS.items()
+        if context.get(key) is not None
+    }
+
+
+def context_from_headers(headers: Mapping[str, str]) -> Dict[str, Any]:
+    """Parse agent context from request headers (header names are matched case-insensitively)."""
+    lowered = {str(name).lower(): value for name, value in headers.items()}
+    context: Dict[str, Any] = {}
+    for key, header in CONTEXT_HEADERS.items():
+        value = lowered.get(header.lower())
+        if value:
+            context[key] = value
+    return context
+
+
+def apply_context_headers(
+    mcp_config: Dict[str, Dict[str, Any]], context: Mapping[str, Any]
+) -> Dict[str, Dict[str, Any]]:
+    """Set the context headers on every HTTP connection of an MCP client config, in place.
+
+    The headers dict of each connection is updated rather than replaced, so a
+    MultiServerMCPClient created from this config (which keeps references to the connection
+    dicts) sends the new context on its next tool call.
+
+    Returns:
+        The same mcp_config, for chaining
+    """
+    new_headers = context_headers(context)
+    for connection in mcp_config.values():
+        if connection.get("transport") not in HTTP_TRANSPORTS:
+            continue
+        headers = connection.get("headers")
+        if headers is None:
+            headers = connection["headers"] = {}
+        for name in [name for name in headers if str(name).startswith(HEADER_PREFIX)]:
+            del headers[name]
+        headers.update(new_headers)
+    return mcp_config
+
+
+class ContextHeaders(Mapping):
+    """Headers that always reflect the agent context active when they are read.
+
+    A MultiServerMCPClient shared by several agents in one event loop cannot carry a fixed set of
+    context headers. The MCP adapter reads a connection's headers each time it opens a session
+    for a tool call, and that happens inside the calling agent's task, so this mapping sends that
+    agent's context.
+    """
+
+    def __init__(self, static: Optional[Mapping[str, str]] = None):
+        self._static = {
+            name: value for name, value in (static or {}).items() if not str(name).startswith(HEADER_PREFIX)
+        }
+
+    def _current(self) -> Dict[str, str]:
+        headers = dict(self._static)
+        headers.update(context_headers(get_agent_context()))
+        return headers
+
+    def __getitem__(self, name: str) -> str:
+        return self._current()[name]
+
+    def __iter__(self):
+        return iter(self._current())
+
+    def __len__(self) -> int:
+        return len(self._current())
+
+    def __repr__(self) -> str:
+        return f"ContextHeaders({self._current()!r})"
+
+
+def bind_context_headers(mcp_config: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Copy of an MCP client config whose HTTP connections send the caller's context headers.
+
+    Use this for a client shared between agents; apply_context_headers is enough for a client
+    owned by a single agent.
+    """
+    bound = copy.deepcopy(mcp_config)
+    for connection in bound.values():
+        if connection.get("transport") in HTTP_TRANSPORTS:
+            connection["headers"] = ContextHeaders(connection.get("headers"))
+    return bound
+
+
+def _request_headers() -> Dict[str, str]:
+    """Headers of the MCP HTTP request being served ({} outside a request)."""
+    try:
+        from fastmcp.server.dependencies import get_http_headers
+    except ImportError:
+        return {}
+    try:
+        return get_http_headers() or {}
+    except RuntimeError:
+        return {}
+
+
+def with_agent_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Run an MCP tool with the agent context sent in the request headers.
+
+    Apply below @mcp.tool() so the tool keeps its original signature:
+
+        @mcp.tool()
+        @with_agent_context
+        def buy(symbol: str, amount: int) -> Dict[str, Any]:
+            ...
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        context = context_from_headers(_request_headers())
+        if not context:
+            return func(*args, **kwargs)
+        with agent_context(**context):
+            return func(*args, **kwargs)
+
+    return wrapper
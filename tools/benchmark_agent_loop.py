@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of the agent loop, with the scripted mock model in place of an LLM.
+
+Runs one agent's run_date_range over a date range with basemodel "mock:<policy>" and reports
+sessions per second plus the time spent in each stage of a session:
+
+    session         run_with_retry, one per trading day (everything below happens inside it)
+    llm             mock model calls, i.e. the simulated latency plus the policy's own lookups
+    tools           tool calls (buy/sell, prices, ...), in process or over MCP
+    prompt          building the system prompt
+    precompute      precomputing the range's prompt prices
+    ledger          _handle_trading_result (position ledger / no-trade records)
+    logging         session log writes
+    runtime_config  runtime env file writes
+
+The session total minus llm time is our own overhead per session.
+
+By default the local tool servers are bound in process and remote ones (search) are left out, so
+no MCP service has to be running. Logs and ledgers go to a temporary directory, as does the
+runtime env file unless RUNTIME_ENV_PATH is already set.
+
+Usage:
+    python tools/benchmark_agent_loop.py --policy momentum --init-date 2025-10-01 --end-date 2025-10-21
+    python tools/benchmark_agent_loop.py --agent-type BaseAgent_Hour --latency 0.2 \\
+        --init-date "2025-10-01 10:00:00" --end-date "2025-10-03 15:00:00"
+"""
+
+import argparse
+import asyncio
+import functools
+import inspect
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+# Add project root directory to Python path for running as a script
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+
+class StageTimer:
+    """Accumulates wall time and call counts per named stage."""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def _add(self, stage: str, elapsed: float) -> None:
+        self.totals[stage] = self.totals.get(stage, 0.0) + elapsed
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def wrap(self, stage: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Timed version of a sync or async callable."""
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._add(stage, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    def patch(self, stage: str, owner: Any, name: str) -> None:
+        """Replace owner.name (module function or class method) by its timed version."""
+        if hasattr(owner, name):
+            setattr(owner, name, self.wrap(stage, getattr(owner, name)))
+
+
+def _instrument_tools(timer: StageTimer, tools: List[Any]) -> None:
+    for tool in tools or []:
+        for attr in ("coroutine", "func"):
+            func = getattr(tool, attr, None)
+            if func is not None:
+                setattr(tool, attr, timer.wrap("tools", func))
+
+
+def _report(timer: StageTimer, wall: float) -> None:
+    sessions = timer.counts.get("session", 0)
+    print("\n" + "=" * 72)
+    print(f"📊 {sessions} sessions in {wall:.2f}s = {sessions / wall if wall else 0.0:.2f} sessions/sec")
+    print(f"{'stage':<16}{'total s':>10}{'calls':>8}{'mean ms':>10}{'% wall':>9}")
+    order = ["session", "llm", "tools", "prompt", "precompute", "ledger", "logging", "runtime_config"]
+    for stage in order + sorted(set(timer.totals) - set(order)):
+        if stage not in timer.totals:
+            continue
+        total, count = timer.totals[stage], timer.counts[stage]
+        print(f"{stage:<16}{total:>10.3f}{count:>8}{total / count * 1000:>10.2f}{total / wall * 100 if wall else 0.0:>8.1f}%")
+    if sessions:
+        overhead = timer.totals.get("session", 0.0) - timer.totals.get("llm", 0.0)
+        print(f"Own overhead (session - llm): {overhead:.3f}s total, {overhead / sessions * 1000:.2f} ms/session")
+    print("=" * 72)
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    from main import get_agent_class
+    from tools.general_tools import write_config_value
+    from tools.local_tools import split_mcp_config
+    from tools.mock_llm import MockChatModel
+
+    AgentClass = get_agent_class(args.agent_type)
+    signature = f"bench-{args.policy}"
+    basemodel = f"mock:{args.policy}?latency={args.latency}&amount={args.amount}&seed={args.seed}"
+
+    write_config_value("SIGNATURE", signature)
+    write_config_value("IF_TRADE", False)
+    write_config_value("MARKET", args.market)
+    write_config_value("LOG_PATH", args.log_path)
+    write_config_value("LEDGER_BACKEND", args.ledger_backend)
+
+    kwargs: Dict[str, Any] = dict(
+        signature=signature,
+        basemodel=basemodel,
+        log_path=args.log_path,
+        max_steps=args.max_steps,
+        max_retries=1,
+        base_delay=0.0,
+        init_date=args.init_date,
+        in_process_tools=not args.mcp,
+        mcp_session_mode=args.mcp_session_mode,
+    )
+    if args.agent_type in ("BaseAgent", "BaseAgent_Hour"):
+        kwargs["market"] = args.market
+    agent = AgentClass(**kwargs)
+    if not args.mcp:
+        # Only the servers that can be bound in process; search and other remote tools are left out
+        _, local_servers = split_mcp_config(agent.mcp_config, True)
+        agent.mcp_config = {name: agent.mcp_config[name] for name in local_servers}
+
+    timer = StageTimer()
+    agent_module = sys.modules[AgentClass.__module__]
+    modules = {agent_module} | {sys.modules[cls.__module__] for cls in AgentClass.__mro__ if cls.__module__ in sys.modules}
+    for module in modules:
+        for name in ("get_agent_system_prompt", "get_agent_system_prompt_astock",
+                     "get_agent_system_prompt_crypto", "get_agent_system_prompt_forex"):
+            timer.patch("prompt", module, name)
+        timer.patch("precompute", module, "precompute_prompt_context")
+        timer.patch("runtime_config", module, "write_config_value")
+    timer.patch("session", AgentClass, "run_with_retry")
+    timer.patch("ledger", AgentClass, "_handle_trading_result")
+    timer.patch("logging", AgentClass, "_log_message")
+    timer.patch("llm", MockChatModel, "_agenerate")
+    timer.patch("llm", MockChatModel, "_generate")
+
+    await agent.initialize()
+    _instrument_tools(timer, agent.tools)
+
+    start = time.perf_counter()
+    await agent.run_date_range(args.init_date, args.end_date)
+    wall = time.perf_counter() - start
+
+    if hasattr(agent.client, "aclose"):
+        await agent.client.aclose()
+    _report(timer, wall)
+    print(f"📁 Logs and ledger: {args.log_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop with the scripted mock model")
+    parser.add_argument("--agent-type", default="BaseAgent", help="Agent class from main.AGENT_REGISTRY")
+    parser.add_argument("--market", default="us", help="Market for BaseAgent / BaseAgent_Hour")
+    parser.add_argument("--policy", default="momentum", choices=["hold", "random", "momentum"])
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per model call")
+    parser.add_argument("--amount", type=float, default=10, help="Shares/units per buy order")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random policy")
+    parser.add_argument("--init-date", default="2025-10-01")
+    parser.add_argument("--end-date", default="2025-10-21")
+    parser.add_argument("--max-steps", type=int, default=5)
+    parser.add_argument("--log-path", help="Agent data directory (default: a new temporary directory)")
+    parser.add_argument("--ledger-backend", default=os.getenv("LEDGER_BACKEND", "jsonl"), choices=["jsonl", "sqlite"])
+    parser.add_argument("--mcp", action="store_true", help="Call the running MCP services instead of binding tools in process")
+    parser.add_argument("--mcp-session-mode", default="per_call", choices=["per_call", "persistent"])
+    args = parser.parse_args()
+
+    if not args.log_path:
+        args.log_path = tempfile.mkdtemp(prefix="ai_trader_bench_")
+    if not os.getenv("RUNTIME_ENV_PATH"):
+        os.environ["RUNTIME_ENV_PATH"] = os.path.join(args.log_path, ".runtime_env.json")
+
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,19 @@ Metrics:
 """
 
 import json
+import os
+import sys
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
 import argparse
 
+# Add project root directory to Python path for running as a script
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
 
 def load_position_data(position_file):
     """Load position data from JSONL file."""
@@ -191,6 +198,74 @@ def calculate_portfolio_values(positions, price_data, is_crypto=False, verbose=T
     return df
 
 
+def calculate_portfolio_values_columnar(positions, prices, verbose=True):
+    """
+    Calculate portfolio value at each timestamp from a columnar price reader.
+
+    Holdings are valued at the latest available close at or before each position's date, looked
+    up with one vectorized gather per entry instead of sorting each symbol's dates.
+
+    Args:
+        positions: Position records loaded from position.jsonl
+        prices: tools.columnar_prices.ColumnarPrices reader
+
+    Returns:
+        DataFrame with columns: date, cash, stock_value, total_value
+    """
+    close = prices.field('close')
+    n_symbols, n_times = close.shape
+
+    # last_valid[i, j] = column of the latest non-missing close of symbol i at or before column j
+    columns = np.where(np.isnan(close), -1, np.arange(n_times))
+    last_valid = np.maximum.accumulate(columns, axis=1) if n_times else columns
+
+    portfolio_values = []
+    missing_prices = set()
+
+    for entry in positions:
+        date = entry['date']
+        pos = entry['positions']
+        cash = pos.get('CASH', 0)
+
+        held = [(symbol, amount) for symbol, amount in pos.items() if symbol != 'CASH' and amount != 0]
+        rows = prices.symbol_indices([symbol for symbol, _ in held])
+        amounts = np.array([amount for _, amount in held], dtype=np.float64)
+        col = int(np.searchsorted(prices.timestamps, date, side='right')) - 1
+
+        stock_value = 0.0
+        if held:
+            found = rows >= 0
+            if col >= 0:
+                src_cols = np.full(len(held), -1, dtype=np.int64)
+                src_cols[found] = last_valid[rows[found], col]
+                found &= src_cols >= 0
+                stock_value = float(np.sum(amounts[found] * close[rows[found], src_cols[found]]))
+            else:
+                found[:] = False
+
+            for (symbol, _), ok in zip(held, found):
+                if ok:
+                    continue
+                if verbose and (symbol, date) not in missing_prices:
+                    print(f"Warning: No price found for {symbol} on {date}")
+                missing_prices.add((symbol, date))
+
+        portfolio_values.append({
+            'date': date,
+            'cash': cash,
+            'stock_value': stock_value,
+            'total_value': cash + stock_value
+        })
+
+    df = pd.DataFrame(portfolio_values)
+    df['date'] = pd.to_datetime(df['date'])
+
+    if not verbose and missing_prices:
+        print(f"Warning: {len(missing_prices)} missing price entries (use --verbose to see details)")
+
+    return df
+
+
 def calculate_metrics(portfolio_df, periods_per_year=252, risk_free_rate=0.0):
     """
     Calculate performance metrics.
@@ -302,6 +377,8 @@ def main():
     parser.add_argument('--is-hourly', action='store_true', help='Use hourly trading periods (affects annualization)')
     parser.add_argument('--verbose', action='store_true', help='Show all warning messages')
     parser.add_argument('--risk-free-rate', type=float, default=0.0, help='Annual risk-free rate (default: 0.0)')
+    parser.add_argument('--merged-file', help='Value holdings from a merged JSONL file via its memory-mapped columnar '
+                                              'conversion (built on first use) instead of daily_prices_*.json')
 
     args = parser.parse_args()
 
@@ -323,21 +400,34 @@ def main():
 
     print(f"Detected market type: {market_type}")
 
-    # Load price data
-    print(f"Loading price data from {args.data_dir}...")
-    price_data = load_all_price_files(args.data_dir, is_crypto, is_astock)
-    print(f"Loaded price data for {len(price_data)} symbols")
-
-    if len(price_data) == 0:
-        print("ERROR: No price data loaded! Check your --data-dir path.")
-        print(f"Looking in: {args.data_dir}")
-        if is_astock:
-            print("For A-stock, try: --data-dir data/A_stock")
-        return
-
-    # Calculate portfolio values
-    print("Calculating portfolio values...")
-    portfolio_df = calculate_portfolio_values(positions, price_data, is_crypto, args.verbose)
+    if args.merged_file:
+        from tools.columnar_prices import load_columnar_prices
+
+        print(f"Loading columnar prices for {args.merged_file}...")
+        prices = load_columnar_prices(args.merged_file)
+        if prices is None:
+            print(f"ERROR: Could not load {args.merged_file}")
+            return
+        print(f"Loaded {len(prices.symbols)} symbols x {len(prices.timestamps)} timestamps")
+
+        print("Calculating portfolio values...")
+        portfolio_df = calculate_portfolio_values_columnar(positions, prices, args.verbose)
+    else:
+        # Load price data
+        print(f"Loading price data from {args.data_dir}...")
+        price_data = load_all_price_files(args.data_dir, is_crypto, is_astock)
+        print(f"Loaded price data for {len(price_data)} symbols")
+
+        if len(price_data) == 0:
+            print("ERROR: No price data loaded! Check your --data-dir path.")
+            print(f"Looking in: {args.data_dir}")
+            if is_astock:
+                print("For A-stock, try: --data-dir data/A_stock")
+            return
+
+        # Calculate portfolio values
+        print("Calculating portfolio values...")
+        portfolio_df = calculate_portfolio_values(positions, price_data, is_crypto, args.verbose)
 
     # Determine periods per year based on data frequency and market type
     if args.is_hourly:
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Columnar, memory-mapped layout for the merged JSONL price files.
+
+A merged file (one JSON line per symbol, string prices) is converted once into a directory of
+NumPy arrays that share a single sorted timestamp axis:
+
+    <dir>/timestamps.npy   (T,)    zero-padded "YYYY-MM-DD" / "YYYY-MM-DD HH:MM:SS" strings
+    <dir>/open.npy         (S, T)  float64, NaN where the bar or field is missing
+    <dir>/high.npy         (S, T)  float64
+    <dir>/low.npy          (S, T)  float64
+    <dir>/close.npy        (S, T)  float64
+    <dir>/volume.npy       (S, T)  float64 (crypto volumes are fractional; NaN marks missing)
+    <dir>/present.npy      (S, T)  bool, True where the symbol has a bar at that timestamp
+    <dir>/meta.json        symbol table, names, series key and the source file's size/mtime
+
+The reader memory-maps the arrays, so slicing a symbol's history or a cross-section of the
+universe is zero-copy and nothing is parsed or float-converted at lookup time.
+
+Usage:
+    python tools/columnar_prices.py --market us
+    python tools/columnar_prices.py --merged-file data/A_stock/merged_hourly.jsonl
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Add project root directory to Python path for running as a script
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+COLUMNAR_VERSION = 1
+
+# Column name -> field inside a merged.jsonl bar
+FIELDS = {
+    "open": "1. buy price",
+    "high": "2. high",
+    "low": "3. low",
+    "close": "4. sell price",
+    "volume": "5. volume",
+}
+
+
+def _pad_timestamp(ts: str) -> str:
+    """Zero-pad the hour so timestamps sort chronologically as strings."""
+    if " " not in ts:
+        return ts
+    date_part, time_part = ts.split(" ", 1)
+    parts = time_part.split(":")
+    if len(parts) != 3:
+        return ts
+    return f"{date_part} {parts[0].zfill(2)}:{parts[1]}:{parts[2]}"
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def get_columnar_dir(merged_path: Union[str, Path]) -> Path:
+    """Default output directory for a merged file, e.g. data/merged.jsonl -> data/columnar/merged/."""
+    merged_path = Path(merged_path)
+    return merged_path.parent / "columnar" / merged_path.stem
+
+
+def build_columnar_arrays(merged_path: Union[str, Path]) -> Dict[str, Any]:
+    """Parse a merged JSONL file into in-memory columnar arrays.
+
+    Args:
+        merged_path: Path to a merged JSONL price file
+
+    Returns:
+        Dict with "timestamps" (T,), "symbols", "names", "series_keys", one (S, T) matrix per
+        entry in FIELDS, and a boolean "present" matrix
+    """
+    merged_path = Path(merged_path)
+    series_by_symbol: Dict[str, Dict[str, Dict[str, str]]] = {}
+    names: Dict[str, str] = {}
+    series_keys: Dict[str, str] = {}
+
+    with merged_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                doc = json.loads(line)
+            except Exception:
+                continue
+            meta = doc.get("Meta Data", {}) if isinstance(doc, dict) else {}
+            symbol = meta.get("2. Symbol")
+            if not symbol or symbol in series_by_symbol:
+                continue
+            for key, value in doc.items():
+                if key.startswith("Time Series"):
+                    if isinstance(value, dict):
+                        series_by_symbol[symbol] = value
+                        series_keys[symbol] = key
+                    break
+            if meta.get("2.1. Name"):
+                names[symbol] = meta["2.1. Name"]
+
+    symbols = list(series_by_symbol.keys())
+    timestamps = sorted({_pad_timestamp(ts) for series in series_by_symbol.values() for ts in series})
+    time_index = {ts: j for j, ts in enumerate(timestamps)}
+
+    shape = (len(symbols), len(timestamps))
+    arrays: Dict[str, Any] = {name: np.full(shape, np.nan, dtype=np.float64) for name in FIELDS}
+    present = np.zeros(shape, dtype=bool)
+
+    for i, symbol in enumerate(symbols):
+        for ts, bar in series_by_symbol[symbol].items():
+            if not isinstance(bar, dict):
+                continue
+            j = time_index[_pad_timestamp(ts)]
+            present[i, j] = True
+            for name, field in FIELDS.items():
+                if field in bar:
+                    arrays[name][i, j] = _to_float(bar[field])
+
+    arrays["present"] = present
+    arrays["timestamps"] = np.array(timestamps, dtype="U19")
+    arrays["symbols"] = symbols
+    arrays["names"] = names
+    arrays["series_keys"] = series_keys
+    return arrays
+
+
+def convert_merged_to_columnar(
+    merged_path: Union[str, Path], out_dir: Optional[Union[str, Path]] = None
+) -> Path:
+    """Convert a merged JSONL price file to the columnar .npy layout.
+
+    The arrays are written to a temporary sibling directory and swapped in at the end, so readers
+    never observe a half-written conversion.
+
+    Args:
+        merged_path: Path to a merged JSONL price file
+        out_dir: Output directory; defaults to get_columnar_dir(merged_path)
+
+    Returns:
+        Path to the written directory
+    """
+    merged_path = Path(merged_path)
+    out_dir = Path(out_dir) if out_dir is not None else get_columnar_dir(merged_path)
+    stat = os.stat(merged_path)
+    arrays = build_columnar_arrays(merged_path)
+
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.{os.getpid()}.tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(tmp_dir / "timestamps.npy", arrays["timestamps"])
+    for name in list(FIELDS) + ["present"]:
+        np.save(tmp_dir / f"{name}.npy", arrays[name])
+
+    meta = {
+        "version": COLUMNAR_VERSION,
+        "source": str(merged_path.resolve()),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "symbols": arrays["symbols"],
+        "names": arrays["names"],
+        "series_keys": arrays["series_keys"],
+    }
+    with (tmp_dir / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    old_dir = out_dir.with_name(f"{out_dir.name}.{os.getpid()}.old")
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return out_dir
+
+
+class ColumnarPrices:
+    """Reader over a columnar price directory (memory-mapped by default)."""
+
+    def __init__(self, directory: Union[str, Path], mmap: bool = True):
+        self.directory = Path(directory)
+        with (self.directory / "meta.json").open("r", encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+
+        mmap_mode = "r" if mmap else None
+        self.timestamps: np.ndarray = np.load(self.directory / "timestamps.npy", mmap_mode=mmap_mode)
+        self._arrays: Dict[str, np.ndarray] = {
+            name: np.load(self.directory / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in list(FIELDS) + ["present"]
+        }
+        self.symbols: List[str] = self.meta["symbols"]
+        self.names: Dict[str, str] = self.meta.get("names", {})
+        self._symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any]) -> "ColumnarPrices":
+        """Wrap in-memory arrays from build_columnar_arrays without touching disk."""
+        reader = cls.__new__(cls)
+        reader.directory = None
+        reader.meta = {
+            "symbols": arrays["symbols"],
+            "names": arrays["names"],
+            "series_keys": arrays["series_keys"],
+        }
+        reader.timestamps = arrays["timestamps"]
+        reader._arrays = {name: arrays[name] for name in list(FIELDS) + ["present"]}
+        reader.symbols = arrays["symbols"]
+        reader.names = arrays["names"]
+        reader._symbol_index = {symbol: i for i, symbol in enumerate(reader.symbols)}
+        return reader
+
+    def is_stale(self, merged_path: Union[str, Path]) -> bool:
+        """True if the source merged file changed since this directory was written."""
+        try:
+            stat = os.stat(merged_path)
+        except OSError:
+            return False
+        return (
+            self.meta.get("version") != COLUMNAR_VERSION
+            or self.meta.get("source_size") != stat.st_size
+            or self.meta.get("source_mtime_ns") != stat.st_mtime_ns
+        )
+
+    def field(self, name: str) -> np.ndarray:
+        """(symbols x timestamps) matrix for "open", "high", "low", "close", "volume" or "present"."""
+        return self._arrays[name]
+
+    def symbol_index(self, symbol: str) -> Optional[int]:
+        return self._symbol_index.get(symbol)
+
+    def symbol_indices(self, symbols: List[str]) -> np.ndarray:
+        """Row of each symbol, -1 for symbols not in the table."""
+        return np.array([self._symbol_index.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+
+    def time_index(self, ts: str) -> Optional[int]:
+        """Column of an exact timestamp, or None if it is not on the axis."""
+        ts = _pad_timestamp(ts)
+        j = int(np.searchsorted(self.timestamps, ts, side="left"))
+        if j < len(self.timestamps) and self.timestamps[j] == ts:
+            return j
+        return None
+
+    def time_slice(self, start: Optional[str] = None, end: Optional[str] = None) -> slice:
+        """Column slice covering start <= ts <= end (either bound may be None)."""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, _pad_timestamp(start), side="left"))
+        hi = len(self.timestamps) if end is None else int(np.searchsorted(self.timestamps, _pad_timestamp(end), side="right"))
+        return slice(lo, max(lo, hi))
+
+    def get(self, symbol: str, ts: str, name: str = "close") -> Optional[float]:
+        """Single value, or None if the symbol, timestamp or field is missing."""
+        i = self.symbol_index(symbol)
+        j = self.time_index(ts)
+        if i is None or j is None:
+            return None
+        value = self._arrays[name][i, j]
+        return None if np.isnan(value) else float(value)
+
+    def cross_section(self, ts: str, name: str = "close") -> Optional[np.ndarray]:
+        """Values of every symbol at one timestamp (a view, not a copy)."""
+        j = self.time_index(ts)
+        if j is None:
+            return None
+        return self._arrays[name][:, j]
+
+    def window(
+        self, symbol: str, start: Optional[str] = None, end: Optional[str] = None, name: str = "close"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(timestamps, values) of one symbol between start and end, inclusive."""
+        i = self.symbol_index(symbol)
+        cols = self.time_slice(start, end)
+        if i is None:
+            return self.timestamps[:0], np.empty(0, dtype=np.float64)
+        return self.timestamps[cols], self._arrays[name][i, cols]
+
+    def last_valid(self, symbol: str, ts: str, name: str = "close") -> Optional[float]:
+        """Latest non-missing value at or before ts (as-of lookup)."""
+        i = self.symbol_index(symbol)
+        if i is None:
+            return None
+        hi = int(np.searchsorted(self.timestamps, _pad_timestamp(ts), side="right"))
+        if hi == 0:
+            return None
+        values = self._arrays[name][i, :hi]
+        valid = np.flatnonzero(~np.isnan(values))
+        if valid.size == 0:
+            return None
+        return float(values[valid[-1]])
+
+
+_READERS: Dict[str, ColumnarPrices] = {}
+_READERS_LOCK = threading.Lock()
+
+
+def load_columnar_prices(merged_path: Union[str, Path], build: bool = True) -> Optional[ColumnarPrices]:
+    """Get a memory-mapped reader for a merged file, converting it first if needed.
+
+    Args:
+        merged_path: Path to the merged JSONL price file
+        build: Whether to (re)convert when the columnar directory is missing or stale
+
+    Returns:
+        ColumnarPrices reader, or None if no up-to-date conversion exists and build is False
+    """
+    merged_path = Path(merged_path)
+    out_dir = get_columnar_dir(merged_path)
+    key = str(out_dir.resolve())
+
+    with _READERS_LOCK:
+        reader = _READERS.get(key)
+        if reader is not None and not reader.is_stale(merged_path):
+            return reader
+
+        reader = None
+        if (out_dir / "meta.json").exists():
+            reader = ColumnarPrices(out_dir)
+            if reader.is_stale(merged_path):
+                reader = None
+        if reader is None:
+            if not build or not merged_path.exists():
+                return None
+            convert_merged_to_columnar(merged_path, out_dir)
+            reader = ColumnarPrices(out_dir)
+        _READERS[key] = reader
+        return reader
+
+
+def main():
+    from tools.price_tools import get_merged_file_path
+
+    parser = argparse.ArgumentParser(description="Convert merged JSONL price files to columnar .npy arrays")
+    parser.add_argument("--market", choices=["us", "cn", "crypto"], help="Convert the market's default merged file")
+    parser.add_argument("--merged-file", help="Path to a merged JSONL file to convert")
+    parser.add_argument("--out-dir", help="Output directory (default: <merged dir>/columnar/<stem>)")
+    args = parser.parse_args()
+
+    if args.merged_file:
+        merged_path = Path(args.merged_file)
+    else:
+        merged_path = get_merged_file_path(args.market or "us")
+
+    if not merged_path.exists():
+        print(f"❌ {merged_path} not found")
+        sys.exit(1)
+
+    out_dir = convert_merged_to_columnar(merged_path, args.out_dir)
+    reader = ColumnarPrices(out_dir)
+    print(
+        f"✅ Wrote {out_dir}: {len(reader.symbols)} symbols x {len(reader.timestamps)} timestamps "
+        f"({reader.timestamps[0]} .. {reader.timestamps[-1]})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Token budget for the message history of a trading session.
+
+run_trading_session appends the model's reply and a "Tool results: ..." user message after every
+step and sends the whole history again on the next call, so later steps carry every price table
+and search result fetched earlier in the session. ContextBudget.fit returns the history to send
+for the next call:
+
+1. The most recent `keep_recent_steps` tool results (and everything after them) are sent verbatim.
+2. An older tool result identical to a later one is replaced by a pointer to that later step.
+3. If the history is still above `max_tokens`, older tool results are cut down to their first
+   `truncate_chars` characters, oldest first.
+4. If that is not enough either, they are replaced by a one-line summary, oldest first.
+
+The user query and the model's own replies are never changed, and the session log keeps the full
+messages; only what is sent to the model shrinks. Token counts are memoized per message content,
+so each message is counted once per session.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from prompts.prompt_render import count_tokens
+
+TOOL_RESULTS_PREFIX = "Tool results: "
+
+
+class ContextBudget:
+    """Keeps the history sent to the model within a token budget."""
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        keep_recent_steps: int = 2,
+        system_prompt: Optional[str] = None,
+        truncate_chars: int = 600,
+    ):
+        """
+        Args:
+            max_tokens: Token budget for the system prompt plus the history; None disables the
+                budget (fit returns the history unchanged)
+            keep_recent_steps: Number of most recent tool results that are never changed
+            system_prompt: System prompt sent with every call, counted against the budget
+            truncate_chars: Characters kept of an older tool result when truncating
+        """
+        self.max_tokens = max_tokens
+        self.keep_recent_steps = max(0, keep_recent_steps)
+        self.truncate_chars = truncate_chars
+        self._token_counts: Dict[str, int] = {}
+        self.reserved_tokens = count_tokens(system_prompt) if (max_tokens and system_prompt) else 0
+
+    def tokens(self, content: Any) -> int:
+        """Token count of one message's content (memoized)."""
+        text = content if isinstance(content, str) else str(content)
+        count = self._token_counts.get(text)
+        if count is None:
+            count = self._token_counts[text] = count_tokens(text)
+        return count
+
+    def total_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Tokens of the history plus the reserved system prompt."""
+        return self.reserved_tokens + sum(self.tokens(msg.get("content", "")) for msg in messages)
+
+    @staticmethod
+    def _is_tool_result(msg: Dict[str, Any]) -> bool:
+        content = msg.get("content")
+        return msg.get("role") == "user" and isinstance(content, str) and content.startswith(TOOL_RESULTS_PREFIX)
+
+    def fit(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """History to send for the next call, within the budget where possible.
+
+        Args:
+            messages: Full session history (not modified)
+
+        Returns:
+            The same list when the budget is disabled or there are no older steps yet, otherwise a
+            new list with older tool results deduplicated, truncated or summarized
+        """
+        if not self.max_tokens:
+            return messages
+
+        tool_positions = [i for i, msg in enumerate(messages) if self._is_tool_result(msg)]
+        step_of = {position: step for step, position in enumerate(tool_positions, start=1)}
+        older = tool_positions[: max(0, len(tool_positions) - self.keep_recent_steps)]
+        if not older:
+            return messages
+
+        fitted = list(messages)
+        older_set = set(older)
+
+        # Identical results of a later step: keep the later one, point to it from the older one
+        latest_step: Dict[str, int] = {}
+        for position in reversed(tool_positions):
+            content = messages[position]["content"]
+            if content in latest_step and position in older_set:
+                fitted[position] = {
+                    **messages[position],
+                    "content": f"{TOOL_RESULTS_PREFIX}[identical to the tool results of step {latest_step[content]}]",
+                }
+            else:
+                latest_step.setdefault(content, step_of[position])
+
+        before = self.total_tokens(messages)
+        total = self.total_tokens(fitted)
+
+        # Truncate, then summarize, older tool results (oldest first) until within budget
+        for shrink in (self._truncate, self._summarize):
+            for position in older:
+                if total <= self.max_tokens:
+                    break
+                current = fitted[position]["content"]
+                replacement = shrink(current, step_of[position])
+                if replacement is None or len(replacement) >= len(current):
+                    continue
+                total += self.tokens(replacement) - self.tokens(current)
+                fitted[position] = {**fitted[position], "content": replacement}
+
+        if total < before:
+            print(f"🧮 Context: {before:,} → {total:,} tokens (budget {self.max_tokens:,})")
+        return fitted
+
+    def _truncate(self, content: str, step: int) -> Optional[str]:
+        body = content[len(TOOL_RESULTS_PREFIX):]
+        if len(body) <= self.truncate_chars:
+            return None
+        return (
+            f"{TOOL_RESULTS_PREFIX}{body[: self.truncate_chars]}"
+            f"... [{len(body) - self.truncate_chars} more characters of step {step} tool output omitted]"
+        )
+
+    def _summarize(self, content: str, step: int) -> Optional[str]:
+        # Longer than a deduplicated or already short result, so fit() leaves those alone
+        body = content[len(TOOL_RESULTS_PREFIX):]
+        first_line = body.strip().splitlines()[0][:120] if body.strip() else ""
+        return f"{TOOL_RESULTS_PREFIX}[step {step} tool output omitted to save context; it began: {first_line}]"
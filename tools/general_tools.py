@@ -1,12 +1,24 @@
+import fcntl
 import json
 import os
+import threading
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
+from tools.agent_context import get_context_value, scoped_config_key
+
 load_dotenv()
 
+# RUNTIME_ENV_PATH value -> resolved path (directory already created)
+_RUNTIME_ENV_PATHS: Dict[Optional[str], str] = {}
+
+# Parsed runtime env per path, revalidated by (mtime_ns, size, inode) on each read
+_RUNTIME_ENV_CACHE: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+_RUNTIME_ENV_LOCK = threading.Lock()
+
+
 def _resolve_runtime_env_path() -> str:
     """Resolve runtime env path from RUNTIME_ENV_PATH in .env file.
     
@@ -15,7 +27,12 @@ def _resolve_runtime_env_path() -> str:
     2. If relative path, resolve from project root
     3. Return the path (will be created by write_config_value if needed)
     """
-    path = os.environ.get("RUNTIME_ENV_PATH")
+    env_value = os.environ.get("RUNTIME_ENV_PATH")
+    cached = _RUNTIME_ENV_PATHS.get(env_value)
+    if cached is not None:
+        return cached
+
+    path = env_value
     
     if not path:
         # Fallback to default if not set
@@ -26,16 +43,22 @@ def _resolve_runtime_env_path() -> str:
         base_dir = Path(__file__).resolve().parents[1]
         path = str(base_dir / path)
     
-    # Ensure directory exists
+    # Ensure directory exists (once per resolved path)
     Path(path).parent.mkdir(parents=True, exist_ok=True)
     
+    _RUNTIME_ENV_PATHS[env_value] = path
     return path
 
 
-def _load_runtime_env() -> dict:
-    path = _resolve_runtime_env_path()
-    if path is None:
-        return {}
+def _stat_key(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _read_runtime_env_file(path: str) -> dict:
     try:
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
@@ -47,7 +70,36 @@ def _load_runtime_env() -> dict:
     return {}
 
 
+def _load_runtime_env() -> dict:
+    """Parsed runtime env, re-read only when the file's mtime, size or inode changed.
+
+    The returned dict is shared by the cache; treat it as read-only.
+    """
+    path = _resolve_runtime_env_path()
+    if path is None:
+        return {}
+    stat_key = _stat_key(path)
+    if stat_key is None:
+        return {}
+    cached = _RUNTIME_ENV_CACHE.get(path)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    data = _read_runtime_env_file(path)
+    # Only cache if the file did not change while it was being read
+    if _stat_key(path) == stat_key:
+        with _RUNTIME_ENV_LOCK:
+            _RUNTIME_ENV_CACHE[path] = (stat_key, data)
+    return data
+
+
 def get_config_value(key: str, default=None):
+    # Per-request agent context (tools/agent_context.py) takes precedence over the shared file
+    context_value = get_context_value(key)
+    if context_value is not None:
+        return context_value
+    key = scoped_config_key(key)
+
     _RUNTIME_ENV = _load_runtime_env()
 
     if key in _RUNTIME_ENV:
@@ -56,15 +108,38 @@ def get_config_value(key: str, default=None):
 
 
 def write_config_value(key: str, value: Any):
+    """Set one runtime config value.
+
+    The read-modify-write runs under an fcntl lock on "<path>.lock" so concurrent writers cannot
+    lose each other's updates, and the new file is swapped in with os.replace so readers never
+    see a partially written file. Writing a value that is already set is a no-op.
+
+    Per-agent flags (IF_TRADE, LOG_FILE) are stored under "<KEY>@<signature>" while an agent
+    context is active.
+    """
+    key = scoped_config_key(key)
     path = _resolve_runtime_env_path()
     if path is None:
         print(f"⚠️  WARNING: RUNTIME_ENV_PATH not set, config value '{key}' not persisted")
         return
-    _RUNTIME_ENV = _load_runtime_env()
-    _RUNTIME_ENV[key] = value
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(_RUNTIME_ENV, f, ensure_ascii=False, indent=4)
+        with open(f"{path}.lock", "a+") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                _RUNTIME_ENV = dict(_read_runtime_env_file(path))
+                if key in _RUNTIME_ENV and _RUNTIME_ENV[key] == value and type(_RUNTIME_ENV[key]) is type(value):
+                    return
+                _RUNTIME_ENV[key] = value
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(_RUNTIME_ENV, f, ensure_ascii=False, indent=4)
+                os.replace(tmp_path, path)
+                stat_key = _stat_key(path)
+                if stat_key is not None:
+                    with _RUNTIME_ENV_LOCK:
+                        _RUNTIME_ENV_CACHE[path] = (stat_key, _RUNTIME_ENV)
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
     except Exception as e:
         print(f"❌ Error writing config to {path}: {e}")
 
@@ -0,0 +1,271 @@
+"""
+Record/replay cache for the agents' chat models.
+
+CachedChatModel wraps the ChatOpenAI / DeepSeekChatOpenAI model created in initialize(). Each
+generation is keyed by the sha256 of (model, normalized messages, bound tools and call options).
+The store is a directory of JSON files with size-bounded, least-recently-used eviction.
+
+Modes:
+    "record"       Return the cached response when there is one, otherwise call the provider and
+                   store the answer (a read-through cache)
+    "replay"       Only answer from the cache; a miss raises LLMCacheMiss and nothing touches the
+                   network, so a recorded backtest re-runs offline at local-disk speed
+    "passthrough"  No caching, the wrapped model is used as is
+
+Tool call ids are left out of the key because providers generate them randomly. A replayed
+session only hits the cache if every tool result it sends back matches the recorded run. Local
+price and trade tools satisfy that; live web search results only match as long as they do not
+change.
+
+Configured per agent with agent_config.llm_cache, e.g.
+    {"mode": "record", "path": "./data/llm_cache", "max_size_mb": 1024}
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+
+LLM_CACHE_MODES = ("record", "replay", "passthrough")
+DEFAULT_CACHE_PATH = "./data/llm_cache"
+DEFAULT_MAX_SIZE_MB = 1024
+# Placeholder credential for replay runs; the provider client is built but never called
+REPLAY_API_KEY = "llm-cache-replay"
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def _normalize_message(message: BaseMessage) -> Dict[str, Any]:
+    normalized: Dict[str, Any] = {"type": message.type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        normalized["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in tool_calls]
+    name = getattr(message, "name", None)
+    if name:
+        normalized["name"] = name
+    return normalized
+
+
+def cache_key(model: str, messages: Sequence[BaseMessage], stop: Optional[List[str]], options: Dict[str, Any]) -> str:
+    """sha256 of a generation request.
+
+    Args:
+        model: Model name
+        messages: Messages sent to the model
+        stop: Stop sequences
+        options: Call options bound to the model (tools, tool_choice, ...)
+
+    Returns:
+        Hex digest
+    """
+    payload = {
+        "model": model,
+        "messages": [_normalize_message(message) for message in messages],
+        "stop": stop,
+        "options": options,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LLMCacheStore:
+    """Directory of cached responses (<path>/<key[:2]>/<key>.json) bounded in total size."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size_mb: float = DEFAULT_MAX_SIZE_MB):
+        self.path = Path(path)
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def _entries(self) -> List[Path]:
+        return list(self.path.glob("*/*.json")) if self.path.exists() else []
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached entry, or None. A hit refreshes the entry's recency for eviction."""
+        file = self._file(key)
+        try:
+            with file.open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(file)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store an entry atomically, then evict the least recently used entries if over size."""
+        file = self._file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        written = tmp.stat().st_size
+        os.replace(tmp, file)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_file.stat().st_size for entry_file in self._entries())
+            else:
+                self._size += written
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Rescan: other processes may share the directory
+        entries = []
+        for entry_file in self._entries():
+            try:
+                stat = entry_file.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_file))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, entry_file in entries:
+            if total <= target:
+                break
+            try:
+                entry_file.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._size = total
+        if removed:
+            print(f"🧹 LLM cache: evicted {removed} entries ({total / 1024 / 1024:.1f} MB kept)")
+
+
+def _result_to_entry(result: ChatResult) -> Dict[str, Any]:
+    return {
+        "generations": [
+            {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+            for generation in result.generations
+        ],
+        "llm_output": result.llm_output,
+    }
+
+
+def _entry_to_result(entry: Dict[str, Any]) -> ChatResult:
+    messages = messages_from_dict([generation["message"] for generation in entry["generations"]])
+    return ChatResult(
+        generations=[
+            ChatGeneration(message=message, generation_info=generation.get("generation_info"))
+            for message, generation in zip(messages, entry["generations"])
+        ],
+        llm_output=entry.get("llm_output"),
+    )
+
+
+class CachedChatModel(BaseChatModel):
+    """Chat model answering from an LLMCacheStore before (or instead of) the wrapped model."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True, protected_namespaces=())
+
+    inner: BaseChatModel
+    model_name: str
+    mode: str = "record"
+    store: Any = None
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.inner._llm_type}"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Any:
+        """Bind tools formatted exactly as the wrapped model would send them."""
+        bound = self.inner.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(bound, "kwargs", {}))
+
+    def _lookup(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]):
+        key = cache_key(self.model_name, messages, stop, kwargs)
+        entry = self.store.get(key)
+        if entry is not None:
+            self.hits += 1
+            return key, _entry_to_result(entry)
+        self.misses += 1
+        if self.mode == "replay":
+            raise LLMCacheMiss(
+                f"❌ LLM cache miss in replay mode for {self.model_name} "
+                f"(key {key[:12]}, {len(messages)} messages); record this session first"
+            )
+        return key, None
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        key, result = self._lookup(messages, stop, kwargs)
+        if result is None:
+            result = self.inner._generate(messages, stop=stop, **kwargs)
+            self.store.put(key, _result_to_entry(result))
+        return result
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        key, result = self._lookup(messages, stop, kwargs)
+        if result is None:
+            result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+            self.store.put(key, _result_to_entry(result))
+        return result
+
+
+_STORES: Dict[str, LLMCacheStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_llm_cache_store(path: str = DEFAULT_CACHE_PATH, max_size_mb: float = DEFAULT_MAX_SIZE_MB) -> LLMCacheStore:
+    """Process-wide store for a cache directory, shared by all agents using it."""
+    key = str(Path(path).resolve())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = LLMCacheStore(path, max_size_mb)
+        return store
+
+
+def wrap_llm_cache(model: BaseChatModel, llm_cache: Optional[Dict[str, Any]], model_name: str) -> BaseChatModel:
+    """Wrap a chat model according to an agent's llm_cache config.
+
+    Args:
+        model: The provider chat model
+        llm_cache: {"mode", "path", "max_size_mb"}, or None to disable caching
+        model_name: Model name used in the cache key (the agent's basemodel)
+
+    Returns:
+        CachedChatModel, or the model itself when caching is disabled or in passthrough mode
+    """
+    if not llm_cache:
+        return model
+    mode = llm_cache.get("mode", "record")
+    if mode not in LLM_CACHE_MODES:
+        raise ValueError(f"❌ Unsupported llm_cache mode: {mode} (supported: {', '.join(LLM_CACHE_MODES)})")
+    if mode == "passthrough":
+        return model
+
+    store = get_llm_cache_store(
+        llm_cache.get("path", DEFAULT_CACHE_PATH), llm_cache.get("max_size_mb", DEFAULT_MAX_SIZE_MB)
+    )
+    print(f"💾 LLM cache: {mode} mode, store {store.path}")
+    return CachedChatModel(inner=model, model_name=model_name, mode=mode, store=store)
+
+
+def is_llm_replay(llm_cache: Optional[Dict[str, Any]]) -> bool:
+    """True if the agent answers only from the cache (no provider credentials needed)."""
+    return bool(llm_cache) and llm_cache.get("mode") == "replay"
@@ -0,0 +1,107 @@
+"""
+In-process binding of the local MCP tool servers.
+
+Math, local prices, indicators and trading are plain Python functions in agent_tools/, served over
+HTTP by start_mcp_services.py. With the agent config option `in_process`, an agent imports those
+modules instead and calls the functions directly as LangChain tools, skipping the HTTP round trip
+and JSON serialization of every call. Remote tools (search) stay on MCP.
+
+A connection is local when its URL points at localhost on the port of one of the servers below;
+the tool descriptions and argument schemas are taken from the module's FastMCP registry, so the
+model sees exactly the same tools as over MCP. The agent context (tools/agent_context.py) is
+active in the agent's own task, so get_config_value inside the tools resolves to the calling
+agent's signature and date.
+"""
+
+import importlib
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+# Port environment variable -> (default port, tool module), as started by start_mcp_services.py
+LOCAL_TOOL_SERVERS: Dict[str, Tuple[str, str]] = {
+    "MATH_HTTP_PORT": ("8000", "agent_tools.tool_math"),
+    "TRADE_HTTP_PORT": ("8002", "agent_tools.tool_trade"),
+    "GETPRICE_HTTP_PORT": ("8003", "agent_tools.tool_get_price_local"),
+    "CRYPTO_HTTP_PORT": ("8005", "agent_tools.tool_crypto_trade"),
+    "INDICATOR_HTTP_PORT": ("8006", "agent_tools.tool_indicators"),
+}
+
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "0.0.0.0")
+
+
+def get_local_tool_module(connection: Dict[str, Any]) -> Optional[str]:
+    """Module implementing an MCP connection's server, or None if it is not a local tool server."""
+    url = connection.get("url")
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.hostname not in _LOCAL_HOSTS or parts.port is None:
+        return None
+    for env_var, (default_port, module) in LOCAL_TOOL_SERVERS.items():
+        if int(os.getenv(env_var, default_port)) == parts.port:
+            return module
+    return None
+
+
+def split_mcp_config(
+    mcp_config: Dict[str, Dict[str, Any]], in_process: Union[bool, Iterable[str], None]
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Split an MCP config into servers still reached over MCP and servers bound in process.
+
+    Args:
+        mcp_config: MCP connection configuration, one entry per server
+        in_process: True for every local server, a list of server names, or False/None for none
+
+    Returns:
+        (remote mcp_config, {server name: tool module}); the remote entries are the original
+        connection dicts, so in-place header updates still reach them
+    """
+    if not in_process:
+        return mcp_config, {}
+    wanted = None if in_process is True else set(in_process)
+
+    remote: Dict[str, Dict[str, Any]] = {}
+    local: Dict[str, str] = {}
+    for name, connection in mcp_config.items():
+        module = get_local_tool_module(connection) if wanted is None or name in wanted else None
+        if module:
+            local[name] = module
+        else:
+            if wanted is not None and name in wanted:
+                print(f"⚠️  MCP server '{name}' is not a local tool server, keeping it on MCP")
+            remote[name] = connection
+    return remote, local
+
+
+async def _registered_tools(module_path: str) -> List[Any]:
+    server = getattr(importlib.import_module(module_path), "mcp")
+    if hasattr(server, "get_tools"):
+        return list((await server.get_tools()).values())
+    return list(server._tool_manager.list_tools())
+
+
+async def load_local_tools(local_servers: Dict[str, str]) -> List[Any]:
+    """LangChain tools calling the functions of the given tool modules directly.
+
+    Args:
+        local_servers: {server name: tool module}, as returned by split_mcp_config
+
+    Returns:
+        List of StructuredTool
+    """
+    from langchain_core.tools import StructuredTool
+
+    tools: List[Any] = []
+    for module_path in dict.fromkeys(local_servers.values()):
+        for tool in await _registered_tools(module_path):
+            tools.append(
+                StructuredTool(
+                    name=tool.name,
+                    description=tool.description or (tool.fn.__doc__ or ""),
+                    args_schema=tool.parameters,
+                    func=tool.fn,
+                    handle_tool_error=True,
+                )
+            )
+    return tools
@@ -0,0 +1,215 @@
+"""
+MCP client factory for the agents.
+
+"per_call" (default) is the stock MultiServerMCPClient: every tool call opens a new HTTP connection
+and MCP session (initialize handshake included) to the tool server and closes it afterwards.
+
+"persistent" keeps one long-lived session per server instead. The streamable HTTP transport holds
+a single keep-alive HTTP client per session, so all tool calls of an agent reuse the same
+connection. A call that fails because the session or connection broke reconnects once; it is
+retried on the fresh session unless it is a trade, which may already have been filled.
+
+Sessions are keyed by server and by the headers the connection sends at open time. Agent context
+headers (tools/agent_context.py) are fixed for the life of a session, so a new trading date or a
+different agent on a shared client gets its own session; the least recently used ones beyond
+max_sessions_per_server are dropped from the pool and closed once their in-flight calls finish.
+"""
+
+import asyncio
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+
+from tools.tool_concurrency import TRADE_TOOLS
+
+try:
+    from mcp.shared.exceptions import McpError
+except ImportError:  # pragma: no cover - older mcp releases
+    McpError = None
+
+MCP_SESSION_MODES = ("per_call", "persistent")
+
+
+def create_mcp_client(
+    mcp_config: Dict[str, Dict[str, Any]], mode: str = "per_call", max_sessions_per_server: int = 2
+) -> Any:
+    """Create the MCP client for an agent.
+
+    Args:
+        mcp_config: MCP connection configuration, one entry per server
+        mode: "per_call" (a new session per tool call) or "persistent" (long-lived sessions)
+        max_sessions_per_server: Persistent mode only, sessions kept open per server
+
+    Returns:
+        Client exposing `await get_tools()`
+    """
+    if mode not in MCP_SESSION_MODES:
+        raise ValueError(f"❌ Unsupported MCP session mode: {mode} (supported: {', '.join(MCP_SESSION_MODES)})")
+    if mode == "persistent":
+        return PersistentMCPClient(mcp_config, max_sessions_per_server=max_sessions_per_server)
+    return MultiServerMCPClient(mcp_config)
+
+
+class _SessionHandle:
+    """An open MCP session and the task that owns its transport."""
+
+    def __init__(self, session: Any, stop: asyncio.Event, task: asyncio.Task):
+        self.session = session
+        self.stop = stop
+        self.task = task
+        # Tool calls (or listings) currently using the session
+        self.active = 0
+        # Dropped from the pool; closed as soon as it is idle
+        self.retired = False
+
+
+class _ServerSessionProxy:
+    """Stands in for a ClientSession in LangChain tools, routing calls through the pool."""
+
+    def __init__(self, client: "PersistentMCPClient", server: str):
+        self._client = client
+        self._server = server
+
+    async def call_tool(self, *args: Any, **kwargs: Any) -> Any:
+        return await self._client.call_tool(self._server, *args, **kwargs)
+
+
+class PersistentMCPClient:
+    """MCP client that reuses long-lived sessions, reconnecting when one breaks."""
+
+    def __init__(self, connections: Dict[str, Dict[str, Any]], max_sessions_per_server: int = 2):
+        self.connections = connections
+        self.max_sessions_per_server = max(1, max_sessions_per_server)
+        self._client = MultiServerMCPClient(connections)
+        self._sessions: "OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...]], _SessionHandle]" = OrderedDict()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _session_key(self, server: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        headers = self.connections[server].get("headers") or {}
+        return server, tuple(sorted((str(name), str(value)) for name, value in dict(headers).items()))
+
+    async def _open(self, server: str) -> _SessionHandle:
+        # The transport runs in anyio task groups that must be entered and exited by the same
+        # task, so each session lives in its own task until asked to stop.
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+
+        async def hold() -> None:
+            try:
+                async with self._client.session(server) as session:
+                    ready.set_result(session)
+                    await stop.wait()
+            except asyncio.CancelledError:
+                if not ready.done():
+                    ready.cancel()
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+
+        task = asyncio.create_task(hold(), name=f"mcp-session-{server}")
+        session = await ready
+        return _SessionHandle(session, stop, task)
+
+    @staticmethod
+    async def _close(handle: _SessionHandle) -> None:
+        handle.stop.set()
+        with suppress(Exception):
+            await asyncio.wait_for(handle.task, timeout=5)
+
+    async def _retire(self, handle: _SessionHandle) -> None:
+        handle.retired = True
+        if handle.active == 0:
+            await self._close(handle)
+
+    async def _release(self, handle: _SessionHandle) -> None:
+        handle.active -= 1
+        if handle.retired and handle.active == 0:
+            await self._close(handle)
+
+    async def _get_session(self, server: str, stale: Optional[_SessionHandle] = None) -> _SessionHandle:
+        """Open session for the server and the caller's headers, replacing `stale` if given.
+
+        The returned handle counts as in use until the caller passes it to _release. Sessions
+        dropped from the pool (LRU eviction, broken) are only closed once no call is using them.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        key = self._session_key(server)
+        to_close: List[_SessionHandle] = []
+        async with self._lock:
+            handle = self._sessions.get(key)
+            if handle is not None and (handle.task.done() or handle is stale):
+                to_close.append(self._sessions.pop(key))
+                handle = None
+            if handle is None:
+                handle = await self._open(server)
+                self._sessions[key] = handle
+                same_server = [k for k in self._sessions if k[0] == server and k != key]
+                for old_key in same_server[: max(0, len(same_server) + 1 - self.max_sessions_per_server)]:
+                    to_close.append(self._sessions.pop(old_key))
+            else:
+                self._sessions.move_to_end(key)
+            handle.active += 1
+        for old in to_close:
+            await self._retire(old)
+        return handle
+
+    async def call_tool(self, server: str, *args: Any, **kwargs: Any) -> Any:
+        """Call a tool on a pooled session, reconnecting once if the session broke.
+
+        A failed connect is always retried, since the call never reached the server. A call that
+        failed after it was sent is only repeated for read-only tools: a trade may already have been
+        filled, so its error goes back to the agent instead of placing the order twice.
+        """
+        try:
+            handle = await self._get_session(server)
+        except Exception as e:
+            print(f"⚠️  MCP connect to {server} failed ({e}), retrying...")
+            handle = await self._get_session(server)
+        try:
+            return await handle.session.call_tool(*args, **kwargs)
+        except Exception as e:
+            # The server answered with a protocol error: the session is fine, don't repeat the call
+            if McpError is not None and isinstance(e, McpError):
+                raise
+            tool_name = args[0] if args else kwargs.get("name")
+            if tool_name in TRADE_TOOLS:
+                print(f"⚠️  MCP call {tool_name} to {server} failed ({e}); not retried, the order may have been placed")
+                raise
+            print(f"⚠️  MCP session to {server} failed ({e}), reconnecting...")
+            retry = await self._get_session(server, stale=handle)
+            try:
+                return await retry.session.call_tool(*args, **kwargs)
+            finally:
+                await self._release(retry)
+        finally:
+            await self._release(handle)
+
+    async def get_tools(self, *, server_name: Optional[str] = None) -> List[Any]:
+        """LangChain tools for every server (or only `server_name`), bound to the pooled sessions."""
+        tools: List[Any] = []
+        for server in [server_name] if server_name is not None else self.connections:
+            handle = await self._get_session(server)
+            proxy = _ServerSessionProxy(self, server)
+            session = handle.session
+            cursor = None
+            try:
+                while True:
+                    page = await session.list_tools(cursor=cursor) if cursor else await session.list_tools()
+                    tools.extend(convert_mcp_tool_to_langchain_tool(proxy, tool) for tool in page.tools)
+                    cursor = getattr(page, "nextCursor", None)
+                    if not cursor:
+                        break
+            finally:
+                await self._release(handle)
+        return tools
+
+    async def aclose(self) -> None:
+        """Close every pooled session."""
+        handles = list(self._sessions.values())
+        self._sessions.clear()
+        for handle in handles:
+            await self._close(handle)
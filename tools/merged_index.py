@@ -0,0 +1,188 @@
+"""
+Byte-offset sidecar index for merged JSONL price files.
+
+For a data file such as data/merged.jsonl, a sidecar data/merged.idx maps every symbol to the byte
+offset and length of its line, plus its "Time Series ..." key and first/last timestamp:
+
+    {
+        "version": 1,
+        "data_size": 1234567,
+        "data_mtime_ns": 1730000000000000000,
+        "symbols": {"AAPL": [offset, length, "Time Series (60min)", "2025-10-01 10:00:00", "2025-11-10 15:00:00"]}
+    }
+
+Readers seek straight to one line and decode only that symbol's history. The sidecar is built lazily
+on first use and rebuilt whenever the data file's size or mtime no longer match.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+INDEX_VERSION = 1
+
+_INDEX_CACHE: Dict[str, Tuple[Tuple[int, int], Dict[str, List[Any]]]] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index_path(data_path: Union[str, Path]) -> Path:
+    """Sidecar path for a data file, e.g. merged.jsonl -> merged.idx."""
+    return Path(data_path).with_suffix(".idx")
+
+
+def _data_stat_key(data_path: Path) -> Tuple[int, int]:
+    stat = os.stat(data_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_merged_index(data_path: Union[str, Path], write: bool = True) -> Dict[str, Any]:
+    """Scan a merged JSONL file once and build its symbol -> byte-offset index.
+
+    Args:
+        data_path: Path to the merged JSONL file
+        write: Whether to persist the index next to the data file
+
+    Returns:
+        The index document (see module docstring)
+    """
+    data_path = Path(data_path)
+    size, mtime_ns = _data_stat_key(data_path)
+    symbols: Dict[str, List[Any]] = {}
+
+    with data_path.open("rb") as f:
+        offset = 0
+        for raw in f:
+            length = len(raw)
+            line_offset = offset
+            offset += length
+            if not raw.strip():
+                continue
+            try:
+                doc = json.loads(raw)
+            except Exception:
+                continue
+            if not isinstance(doc, dict):
+                continue
+            meta = doc.get("Meta Data", {})
+            symbol = meta.get("2. Symbol") if isinstance(meta, dict) else None
+            # First occurrence wins, matching a top-to-bottom scan
+            if not symbol or symbol in symbols:
+                continue
+
+            series_key = None
+            first_ts = last_ts = None
+            for key, value in doc.items():
+                if key.startswith("Time Series"):
+                    series_key = key
+                    if isinstance(value, dict) and value:
+                        timestamps = sorted(value.keys())
+                        first_ts, last_ts = timestamps[0], timestamps[-1]
+                    break
+            symbols[symbol] = [line_offset, length, series_key, first_ts, last_ts]
+
+    index = {
+        "version": INDEX_VERSION,
+        "data_size": size,
+        "data_mtime_ns": mtime_ns,
+        "symbols": symbols,
+    }
+
+    if write:
+        index_path = get_index_path(data_path)
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            # Read-only data directory: keep the in-memory index only
+            print(f"⚠️  Could not write index {index_path}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    return index
+
+
+def _read_index_file(data_path: Path, stat_key: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+    index_path = get_index_path(data_path)
+    if not index_path.exists():
+        return None
+    try:
+        with index_path.open("r", encoding="utf-8") as f:
+            index = json.load(f)
+    except Exception:
+        return None
+    if (
+        index.get("version") != INDEX_VERSION
+        or (index.get("data_size"), index.get("data_mtime_ns")) != stat_key
+    ):
+        return None
+    return index
+
+
+def load_merged_index(data_path: Union[str, Path]) -> Dict[str, List[Any]]:
+    """Get the symbol -> [offset, length, series_key, first_ts, last_ts] map for a data file.
+
+    The map is cached per process and re-validated against the data file's size and mtime on each
+    call; a stale or missing sidecar is rebuilt.
+
+    Args:
+        data_path: Path to the merged JSONL file
+
+    Returns:
+        Mapping of symbol to its index entry
+    """
+    data_path = Path(data_path)
+    key = str(data_path.resolve())
+    stat_key = _data_stat_key(data_path)
+
+    cached = _INDEX_CACHE.get(key)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    with _INDEX_LOCK:
+        cached = _INDEX_CACHE.get(key)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        index = _read_index_file(data_path, stat_key)
+        if index is None:
+            index = build_merged_index(data_path)
+        symbols = index["symbols"]
+        _INDEX_CACHE[key] = ((index["data_size"], index["data_mtime_ns"]), symbols)
+        return symbols
+
+
+def read_symbol_doc(data_path: Union[str, Path], symbol: str) -> Optional[Dict[str, Any]]:
+    """Decode the single JSONL line holding a symbol's data.
+
+    Args:
+        data_path: Path to the merged JSONL file
+        symbol: Symbol to read
+
+    Returns:
+        The decoded line, or None if the symbol is not in the file
+    """
+    data_path = Path(data_path)
+    for _ in range(2):
+        entry = load_merged_index(data_path).get(symbol)
+        if entry is None:
+            return None
+        offset, length = entry[0], entry[1]
+        with data_path.open("rb") as f:
+            f.seek(offset)
+            raw = f.read(length)
+        try:
+            doc = json.loads(raw)
+        except ValueError:
+            doc = None
+        meta = doc.get("Meta Data", {}) if isinstance(doc, dict) else {}
+        if meta.get("2. Symbol") == symbol:
+            return doc
+        # The file was rewritten between the stat check and the read: drop the cached index and retry
+        with _INDEX_LOCK:
+            _INDEX_CACHE.pop(str(data_path.resolve()), None)
+    return None
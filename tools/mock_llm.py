@@ -0,0 +1,195 @@
+"""
+Scripted chat model for running the agent loop without an LLM provider.
+
+Selected with `basemodel: "mock:<policy>"` in a config's model entry. Options can follow as a query
+string, e.g. "mock:momentum?latency=0.5&amount=20&seed=7":
+
+    latency   Seconds each model call sleeps, to simulate provider latency (default: 0)
+    amount    Shares/units bought per buy order; rounded to whole lots of 100 for A-shares (default: 10)
+    seed      Seed of the random policy (default: 0)
+
+Policies (all deterministic for a given signature and date):
+
+    hold      No trades; the session stops on the first call
+    random    Sells one random holding and buys one random symbol
+    momentum  Sells every holding whose open is below the previous close, buys the biggest riser
+
+On the first call of a session the model emits the trades as tool calls to the bound buy/sell tools
+(buy_crypto/sell_crypto for crypto). Once the tool results come back it answers with STOP_SIGNAL,
+so a session with trades costs one agent invocation and two model calls, plus the configured latency.
+Prices come from the precomputed prompt context and positions from the ledger. Both are read for
+the agent context's SIGNATURE and TODAY_DATE.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from prompts.agent_prompt import STOP_SIGNAL
+from tools.general_tools import get_config_value
+from tools.price_tools import get_today_init_position
+from tools.prompt_context import get_prompt_prices
+
+MOCK_MODEL_PREFIX = "mock:"
+MOCK_POLICIES = ("hold", "random", "momentum")
+
+# (buy tool, sell tool), in order of preference
+_TRADE_TOOLS = (("buy", "sell"), ("buy_crypto", "sell_crypto"))
+
+
+def is_mock_model(basemodel: Optional[str]) -> bool:
+    """True if a config's basemodel selects the scripted mock model."""
+    return bool(basemodel) and basemodel.startswith(MOCK_MODEL_PREFIX)
+
+
+def parse_mock_model(basemodel: str) -> Tuple[str, Dict[str, str]]:
+    """Split "mock:<policy>?key=value&..." into (policy, options)."""
+    spec = basemodel[len(MOCK_MODEL_PREFIX):]
+    policy, _, query = spec.partition("?")
+    policy = policy or "hold"
+    if policy not in MOCK_POLICIES:
+        raise ValueError(f"❌ Unknown mock policy: {policy} (supported: {', '.join(MOCK_POLICIES)})")
+    return policy, dict(parse_qsl(query))
+
+
+def _whole(amount: float) -> Any:
+    # Stock trade tools take integer share counts
+    return int(amount) if float(amount).is_integer() else amount
+
+
+class MockChatModel(BaseChatModel):
+    """Chat model that answers with scripted trades instead of calling a provider."""
+
+    policy: str = "hold"
+    latency: float = 0.0
+    amount: float = 10
+    seed: int = 0
+    market: str = "us"
+    symbols: List[str] = []
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "MockChatModel":
+        """Remember which tools exist; the trades are emitted as calls to them."""
+        names = []
+        for tool in tools:
+            name = getattr(tool, "name", None)
+            names.append(name or convert_to_openai_tool(tool)["function"]["name"])
+        return self.model_copy(update={"tool_names": names})
+
+    def _trade_tools(self) -> Optional[Tuple[str, str]]:
+        for buy_tool, sell_tool in _TRADE_TOOLS:
+            if buy_tool in self.tool_names and sell_tool in self.tool_names:
+                return buy_tool, sell_tool
+        return None
+
+    def _buy_amount(self) -> float:
+        if self.market == "cn":
+            return max(100, int(round(self.amount / 100)) * 100)
+        return self.amount
+
+    def _orders(self) -> List[Tuple[str, str, float]]:
+        """(tool, symbol, amount) of today's trades under the policy."""
+        trade_tools = self._trade_tools()
+        today_date = get_config_value("TODAY_DATE")
+        signature = get_config_value("SIGNATURE")
+        if self.policy == "hold" or trade_tools is None or not today_date or not signature:
+            return []
+        buy_tool, sell_tool = trade_tools
+
+        prices = get_prompt_prices(today_date, self.symbols, market=self.market)
+        positions = get_today_init_position(today_date, signature)
+        held = [symbol for symbol, amount in positions.items() if symbol != "CASH" and amount and amount > 0]
+        tradable = [
+            symbol for symbol in self.symbols if prices.today_buy.get(f"{symbol}_price") is not None
+        ]
+
+        orders: List[Tuple[str, str, float]] = []
+        if self.policy == "random":
+            rng = random.Random(f"{self.seed}:{signature}:{today_date}")
+            if held:
+                symbol = rng.choice(held)
+                orders.append((sell_tool, symbol, positions[symbol]))
+            if tradable:
+                orders.append((buy_tool, rng.choice(tradable), self._buy_amount()))
+            return orders
+
+        # momentum: change from the previous close to today's open
+        changes: Dict[str, float] = {}
+        for symbol in tradable:
+            prev_close = prices.yesterday_sell.get(f"{symbol}_price")
+            if prev_close:
+                changes[symbol] = prices.today_buy[f"{symbol}_price"] / prev_close - 1
+        for symbol in held:
+            if changes.get(symbol, 0.0) < 0:
+                orders.append((sell_tool, symbol, positions[symbol]))
+        if changes:
+            best = max(changes, key=changes.get)
+            if changes[best] > 0:
+                orders.append((buy_tool, best, self._buy_amount()))
+        return orders
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        if messages and isinstance(messages[-1], ToolMessage):
+            return AIMessage(content=f"Rebalance submitted ({self.policy} policy).\n{STOP_SIGNAL}")
+        orders = self._orders()
+        if not orders:
+            return AIMessage(content=f"No trades today ({self.policy} policy).\n{STOP_SIGNAL}")
+        tool_calls = [
+            {
+                "name": tool,
+                "args": {"symbol": symbol, "amount": _whole(amount)},
+                "id": f"mock_call_{i}",
+                "type": "tool_call",
+            }
+            for i, (tool, symbol, amount) in enumerate(orders)
+        ]
+        return AIMessage(content="", tool_calls=tool_calls)
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+
+def create_mock_chat_model(basemodel: str, symbols: List[str], market: str = "us") -> MockChatModel:
+    """Build the mock model selected by a "mock:<policy>?..." basemodel.
+
+    Args:
+        basemodel: Model name from the config
+        symbols: Symbols the agent trades
+        market: Market type ("us", "cn", "crypto", ...)
+
+    Returns:
+        MockChatModel
+    """
+    policy, options = parse_mock_model(basemodel)
+    model = MockChatModel(
+        policy=policy,
+        latency=float(options.get("latency", 0.0)),
+        amount=float(options.get("amount", 10)),
+        seed=int(options.get("seed", 0)),
+        market=market,
+        symbols=list(symbols),
+    )
+    print(f"🧪 Mock model: policy={policy}, latency={model.latency}s, amount={model.amount}")
+    return model
@@ -0,0 +1,494 @@
+"""
+Position ledger helpers for {LOG_PATH}/{signature}/position/position.jsonl.
+
+position.jsonl is append-only and written in trading order, so the latest state of an agent lives
+at the end of the file. This module reads the file backwards from the end and keeps a small
+snapshot next to it (position/latest.json):
+
+    {
+        "version": 1,
+        "size": 20480,
+        "mtime_ns": 1730000000000000000,
+        "last": {...last record...},
+        "prev": {...last record dated before last["date"], or null...}
+    }
+
+The snapshot is refreshed on every append made through append_position_record (under
+position_lock) and is trusted only while the ledger's size and mtime match. Writes made any other
+way simply invalidate it, and it is rebuilt from a short backwards read.
+
+The LEDGER_BACKEND config value selects where positions live: "jsonl" (default, the files above)
+or "sqlite" (tools/sqlite_ledger.py, one WAL database per log path). The ledger_* functions at the
+end of this module dispatch to the configured backend.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from tools.general_tools import get_config_value
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_NAME = "latest.json"
+
+# position file path -> (stat key, snapshot)
+_SNAPSHOT_CACHE: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+def get_signature_dir(signature: str, log_path: Optional[str] = None) -> Path:
+    """Directory holding an agent's data, {LOG_PATH}/{signature}.
+
+    Args:
+        signature: Model name
+        log_path: Log root; defaults to the LOG_PATH config value
+
+    Returns:
+        Path of the signature directory
+    """
+    base_dir = Path(__file__).resolve().parents[1]
+    if log_path is None:
+        log_path = get_config_value("LOG_PATH", "./data/agent_data")
+
+    # Handle different path formats:
+    # - If it's an absolute path (like temp directory), use it directly
+    # - If it's a relative path starting with "./data/", remove the prefix and prepend base_dir/data
+    # - Otherwise, treat as relative to base_dir/data
+    if os.path.isabs(log_path):
+        return Path(log_path) / signature
+    if log_path.startswith("./data/"):
+        log_path = log_path[7:]  # Remove "./data/" prefix
+    return base_dir / "data" / log_path / signature
+
+
+def get_position_file(signature: str, log_path: Optional[str] = None) -> Path:
+    """Path of an agent's position.jsonl."""
+    return get_signature_dir(signature, log_path) / "position" / "position.jsonl"
+
+
+def get_snapshot_path(position_file: Union[str, Path]) -> Path:
+    """Path of the latest.json snapshot kept next to a position file."""
+    return Path(position_file).with_name(SNAPSHOT_NAME)
+
+
+def position_lock(signature: str):
+    """Context manager for file-based lock to serialize position updates per signature."""
+    class _Lock:
+        def __init__(self, name: str):
+            # The lock file lives alongside the positions directory
+            base_dir = get_signature_dir(name)
+            base_dir.mkdir(parents=True, exist_ok=True)
+            self.lock_path = base_dir / ".position.lock"
+            # Ensure lock file exists
+            self._fh = open(self.lock_path, "a+")
+        def __enter__(self):
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+            return self
+        def __exit__(self, exc_type, exc, tb):
+            try:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._fh.close()
+    return _Lock(signature)
+
+
+def _parse_record(raw: bytes) -> Optional[Dict[str, Any]]:
+    if not raw.strip():
+        return None
+    try:
+        doc = json.loads(raw)
+    except Exception:
+        return None
+    return doc if isinstance(doc, dict) else None
+
+
+def iter_records_reversed(position_file: Union[str, Path], chunk_size: int = 65536) -> Iterator[Dict[str, Any]]:
+    """Yield ledger records from the last line to the first, reading the file in chunks from the end.
+
+    Blank and malformed lines are skipped.
+
+    Args:
+        position_file: Path to position.jsonl
+        chunk_size: Bytes read per backwards step
+
+    Yields:
+        Decoded records, newest first
+    """
+    with open(position_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        remainder = b""
+        while pos > 0:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + remainder).split(b"\n")
+            # The first piece may be the tail of a line that starts in an earlier chunk
+            remainder = lines[0]
+            for raw in reversed(lines[1:]):
+                record = _parse_record(raw)
+                if record is not None:
+                    yield record
+        record = _parse_record(remainder)
+        if record is not None:
+            yield record
+
+
+def _stat_key(position_file: Path) -> Tuple[int, int]:
+    stat = os.stat(position_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _build_snapshot(position_file: Path) -> Dict[str, Any]:
+    """Find the last record and the last record of an earlier date with a backwards read."""
+    last = prev = None
+    for record in iter_records_reversed(position_file):
+        if last is None:
+            last = record
+        elif record.get("date") != last.get("date"):
+            prev = record
+            break
+    return {"last": last, "prev": prev}
+
+
+def _write_snapshot(position_file: Path, stat_key: Tuple[int, int], snapshot: Dict[str, Any]) -> None:
+    snapshot_path = get_snapshot_path(position_file)
+    tmp_path = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.tmp")
+    doc = {
+        "version": SNAPSHOT_VERSION,
+        "size": stat_key[0],
+        "mtime_ns": stat_key[1],
+        "last": snapshot["last"],
+        "prev": snapshot["prev"],
+    }
+    try:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(doc, f)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        print(f"⚠️  Could not write position snapshot {snapshot_path}: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+def _read_snapshot_file(position_file: Path, stat_key: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+    snapshot_path = get_snapshot_path(position_file)
+    if not snapshot_path.exists():
+        return None
+    try:
+        with snapshot_path.open("r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except Exception:
+        return None
+    if doc.get("version") != SNAPSHOT_VERSION or (doc.get("size"), doc.get("mtime_ns")) != stat_key:
+        return None
+    return {"last": doc.get("last"), "prev": doc.get("prev")}
+
+
+def load_position_snapshot(position_file: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Get {"last": record, "prev": record} for a position file.
+
+    "last" is the final record of the file and "prev" the last record dated before it (None when
+    the whole file shares one date). Both are None for an empty file.
+
+    Args:
+        position_file: Path to position.jsonl
+
+    Returns:
+        The snapshot, or None if the position file does not exist
+    """
+    position_file = Path(position_file)
+    try:
+        stat_key = _stat_key(position_file)
+    except OSError:
+        return None
+
+    key = str(position_file)
+    cached = _SNAPSHOT_CACHE.get(key)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    snapshot = _read_snapshot_file(position_file, stat_key)
+    if snapshot is None:
+        snapshot = _build_snapshot(position_file)
+        # Only persist if nobody wrote to the ledger while we were reading it
+        if _stat_key(position_file) == stat_key:
+            _write_snapshot(position_file, stat_key, snapshot)
+    with _SNAPSHOT_LOCK:
+        _SNAPSHOT_CACHE[key] = (stat_key, snapshot)
+    return snapshot
+
+
+def append_position_record(position_file: Union[str, Path], record: Dict[str, Any]) -> None:
+    """Append one record to position.jsonl and update its snapshot.
+
+    Callers must hold position_lock for the signature so that the append and the snapshot update
+    are not interleaved with another writer.
+
+    Args:
+        position_file: Path to position.jsonl
+        record: Ledger record ({"date", "id", "this_action", "positions"})
+    """
+    append_position_records(position_file, [record])
+
+
+def append_position_records(position_file: Union[str, Path], records: List[Dict[str, Any]]) -> None:
+    """Append several records with a single write and update the snapshot once.
+
+    Callers must hold position_lock for the signature.
+
+    Args:
+        position_file: Path to position.jsonl
+        records: Ledger records, oldest first
+    """
+    if not records:
+        return
+    position_file = Path(position_file)
+    previous = load_position_snapshot(position_file) or {"last": None, "prev": None}
+    size_before = position_file.stat().st_size if position_file.exists() else 0
+
+    with position_file.open("a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+
+    # Keep an already loaded buy index current without re-reading the file
+    index = _BUY_INDEXES.get(str(position_file))
+    if index is not None:
+        with index.lock:
+            if index.offset == size_before and index.inode is not None:
+                for record in records:
+                    index.add(record)
+                index.offset = position_file.stat().st_size
+
+    last, prev = previous["last"], previous["prev"]
+    for record in records:
+        if last is not None and last.get("date") != record.get("date"):
+            prev = last
+        last = record
+    snapshot = {"last": last, "prev": prev}
+
+    stat_key = _stat_key(position_file)
+    _write_snapshot(position_file, stat_key, snapshot)
+    with _SNAPSHOT_LOCK:
+        _SNAPSHOT_CACHE[str(position_file)] = (stat_key, snapshot)
+
+# ---------------------------------------------------------------------------
+# Per-(date, symbol) buy totals for the A-share T+1 check
+# ---------------------------------------------------------------------------
+
+
+class _BuyIndex:
+    """Running totals of "buy" amounts per (date, symbol) for one position file.
+
+    The file is consumed incrementally from `offset`, so records appended by other processes are
+    picked up by reading only the new bytes. A replaced (different inode) or truncated file is
+    re-read from the start.
+    """
+
+    def __init__(self):
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.totals: Dict[Tuple[str, str], float] = {}
+        self.lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        this_action = record.get("this_action")
+        if isinstance(this_action, dict) and this_action.get("action") == "buy":
+            key = (record.get("date"), this_action.get("symbol"))
+            self.totals[key] = self.totals.get(key, 0) + this_action.get("amount", 0)
+
+    def refresh(self, position_file: Path) -> None:
+        try:
+            stat = os.stat(position_file)
+        except OSError:
+            self.inode, self.offset, self.totals = None, 0, {}
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode, self.offset, self.totals = stat.st_ino, 0, {}
+        if stat.st_size == self.offset:
+            return
+        with open(position_file, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(stat.st_size - self.offset)
+        # Leave a partially written last line for the next refresh
+        end = data.rfind(b"\n") + 1
+        for raw in data[:end].split(b"\n"):
+            record = _parse_record(raw)
+            if record is not None:
+                self.add(record)
+        self.offset += end
+
+
+_BUY_INDEXES: Dict[str, _BuyIndex] = {}
+_BUY_INDEXES_LOCK = threading.Lock()
+
+
+def _get_buy_index(position_file: Path) -> _BuyIndex:
+    key = str(position_file)
+    index = _BUY_INDEXES.get(key)
+    if index is None:
+        with _BUY_INDEXES_LOCK:
+            index = _BUY_INDEXES.setdefault(key, _BuyIndex())
+    return index
+
+
+def get_today_buy_amount(signature: str, today_date: str, symbol: str) -> float:
+    """Total amount of `symbol` bought by `signature` on `today_date`.
+
+    JSONL: a dictionary lookup in the incrementally maintained buy index. SQLite: an indexed SUM
+    over the trades table.
+    """
+    if get_ledger_backend() == "sqlite":
+        return get_ledger().bought_amount(signature, today_date, symbol)
+    position_file = get_position_file(signature)
+    index = _get_buy_index(position_file)
+    with index.lock:
+        index.refresh(position_file)
+        return index.totals.get((today_date, symbol), 0)
+
+
+# ---------------------------------------------------------------------------
+# Backend selection
+# ---------------------------------------------------------------------------
+
+LEDGER_BACKENDS = ("jsonl", "sqlite")
+
+_LEDGERS: Dict[str, Any] = {}
+_LEDGERS_LOCK = threading.Lock()
+
+
+def get_ledger_backend() -> str:
+    """Configured ledger backend, "jsonl" or "sqlite"."""
+    backend = str(get_config_value("LEDGER_BACKEND", "jsonl") or "jsonl").lower()
+    if backend not in LEDGER_BACKENDS:
+        raise ValueError(f"Unknown LEDGER_BACKEND '{backend}', expected one of {LEDGER_BACKENDS}")
+    return backend
+
+
+def get_ledger(log_path: Optional[str] = None):
+    """Process-wide SqliteLedger for a log path ({LOG_PATH}/positions.db)."""
+    from tools.sqlite_ledger import LEDGER_DB_NAME, SqliteLedger
+
+    db_path = get_signature_dir("_", log_path).parent / LEDGER_DB_NAME
+    key = str(db_path)
+    ledger = _LEDGERS.get(key)
+    if ledger is None:
+        with _LEDGERS_LOCK:
+            ledger = _LEDGERS.get(key)
+            if ledger is None:
+                ledger = SqliteLedger(db_path)
+                _LEDGERS[key] = ledger
+    return ledger
+
+
+def ledger_exists(signature: str, log_path: Optional[str] = None) -> bool:
+    """Whether the signature already has position records.
+
+    With the SQLite backend, an existing position.jsonl that is not in the database yet is imported
+    first, so switching backends keeps an agent's history.
+    """
+    position_file = get_position_file(signature, log_path)
+    if get_ledger_backend() == "jsonl":
+        return position_file.exists()
+    ledger = get_ledger(log_path)
+    if ledger.has_records(signature):
+        return True
+    if position_file.exists():
+        count = ledger.import_jsonl(signature, position_file)
+        print(f"📥 Imported {count} records from {position_file} into {ledger.db_path}")
+        return count > 0
+    return False
+
+
+def write_initial_position(signature: str, record: Dict[str, Any], log_path: Optional[str] = None) -> str:
+    """Create a new ledger holding only the registration record.
+
+    Returns:
+        Where the ledger lives, for logging
+    """
+    if get_ledger_backend() == "sqlite":
+        ledger = get_ledger(log_path)
+        ledger.append(signature, record)
+        return str(ledger.db_path)
+    position_file = get_position_file(signature, log_path)
+    position_file.parent.mkdir(parents=True, exist_ok=True)
+    with position_file.open("w", encoding="utf-8") as f:  # Use "w" mode to ensure creating new file
+        f.write(json.dumps(record) + "\n")
+    return str(position_file)
+
+
+def read_ledger_records(signature: str, log_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """All records of a signature, oldest first."""
+    if get_ledger_backend() == "sqlite":
+        return get_ledger(log_path).records(signature)
+    position_file = get_position_file(signature, log_path)
+    if not position_file.exists():
+        return []
+    records = []
+    with position_file.open("r", encoding="utf-8") as f:
+        for line in f:
+            record = _parse_record(line.encode("utf-8"))
+            if record is not None:
+                records.append(record)
+    return records
+
+
+def get_last_ledger_date(signature: str, log_path: Optional[str] = None) -> Optional[str]:
+    """Latest record date of a signature, as written, or None if it has no records."""
+    if get_ledger_backend() == "sqlite":
+        return get_ledger(log_path).last_date(signature)
+    from tools.price_tools import _normalize_timestamp_str
+
+    max_date = None
+    for record in read_ledger_records(signature, log_path):
+        date = record.get("date")
+        if date and (max_date is None or _normalize_timestamp_str(date) > _normalize_timestamp_str(max_date)):
+            max_date = date
+    return max_date
+
+
+@contextmanager
+def ledger_transaction(signature: str):
+    """Serialize a read-modify-write of the signature's positions.
+
+    JSONL: the per-signature lock file. SQLite: a BEGIN IMMEDIATE transaction.
+    """
+    if get_ledger_backend() == "sqlite":
+        with get_ledger().transaction():
+            yield
+    else:
+        with position_lock(signature):
+            yield
+
+
+def append_ledger_record(signature: str, record: Dict[str, Any], price: Optional[float] = None) -> None:
+    """Append a record to the signature's ledger; call inside ledger_transaction."""
+    if get_ledger_backend() == "sqlite":
+        get_ledger().append(signature, record, price=price)
+    else:
+        append_position_record(get_position_file(signature), record)
+
+
+def append_ledger_records(
+    signature: str, records: List[Dict[str, Any]], prices: Optional[List[Optional[float]]] = None
+) -> None:
+    """Append several records to the signature's ledger in one write; call inside ledger_transaction."""
+    if get_ledger_backend() == "sqlite":
+        ledger = get_ledger()
+        with ledger.transaction():
+            for i, record in enumerate(records):
+                ledger.append(signature, record, price=prices[i] if prices else None)
+    else:
+        append_position_records(get_position_file(signature), records)
+
+
+def export_ledger_jsonl(signature: str, log_path: Optional[str] = None) -> Optional[int]:
+    """Write the SQLite ledger of a signature back to its position.jsonl (no-op for JSONL)."""
+    if get_ledger_backend() != "sqlite":
+        return None
+    return get_ledger(log_path).export_jsonl(signature, get_position_file(signature, log_path))
@@ -0,0 +1,182 @@
+"""
+Process-resident price store for the merged JSONL price files.
+
+Each merged file (data/merged.jsonl, data/A_stock/merged.jsonl, data/A_stock/merged_hourly.jsonl,
+data/crypto/crypto_merged.jsonl, ...) is parsed at most once per process and kept in memory as a
+symbol -> {timestamp -> bar} index. The file's mtime and size are checked on every lookup, and the
+store is reloaded transparently when the merge step rewrites the file.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+
+class PriceStore:
+    """In-memory index over a single merged JSONL price file.
+
+    Bars are addressed by (symbol, timestamp). Only the first "Time Series ..." key of each line is
+    indexed, matching how the price helpers have always read the file.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        # Bumped on every (re)load so derived caches can detect stale entries
+        self.version = 0
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+        self._series: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self._series_keys: Dict[str, str] = {}
+        self._names: Dict[str, str] = {}
+        self._timestamps: FrozenSet[str] = frozenset()
+        self._daily_dates: FrozenSet[str] = frozenset()
+
+    def _current_stat_key(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self) -> bool:
+        """Reload the file if it changed on disk since the last load.
+
+        Returns:
+            True if the store was (re)loaded, False if the cached index is still current
+        """
+        stat_key = self._current_stat_key()
+        if stat_key == self._stat_key and self.version > 0:
+            return False
+        with self._lock:
+            # Another thread may have reloaded while we were waiting for the lock
+            stat_key = self._current_stat_key()
+            if stat_key == self._stat_key and self.version > 0:
+                return False
+            self._load()
+            self._stat_key = stat_key
+            self.version += 1
+            return True
+
+    def _load(self) -> None:
+        series_by_symbol: Dict[str, Dict[str, Dict[str, str]]] = {}
+        series_keys: Dict[str, str] = {}
+        names: Dict[str, str] = {}
+        timestamps = set()
+        daily_dates = set()
+
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        doc = json.loads(line)
+                    except Exception:
+                        continue
+                    if not isinstance(doc, dict):
+                        continue
+                    meta = doc.get("Meta Data", {})
+                    symbol = meta.get("2. Symbol") if isinstance(meta, dict) else None
+                    if not symbol:
+                        continue
+
+                    name = meta.get("2.1. Name", "")
+                    if name:
+                        names[symbol] = name
+
+                    for key, value in doc.items():
+                        if key.startswith("Time Series"):
+                            if isinstance(value, dict):
+                                # First occurrence of a symbol wins, as with a linear scan
+                                if symbol not in series_by_symbol:
+                                    series_by_symbol[symbol] = value
+                                    series_keys[symbol] = key
+                                timestamps.update(value.keys())
+                                if key == "Time Series (Daily)":
+                                    daily_dates.update(value.keys())
+                            break
+
+        self._series = series_by_symbol
+        self._series_keys = series_keys
+        self._names = names
+        self._timestamps = frozenset(timestamps)
+        self._daily_dates = frozenset(daily_dates)
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._series.keys())
+
+    def has_symbol(self, symbol: str) -> bool:
+        return symbol in self._series
+
+    def get_series(self, symbol: str) -> Optional[Dict[str, Dict[str, str]]]:
+        """Return the full {timestamp: bar} mapping for a symbol, or None if unknown."""
+        return self._series.get(symbol)
+
+    def get_series_key(self, symbol: str) -> Optional[str]:
+        """Return the "Time Series ..." key the symbol's bars were stored under."""
+        return self._series_keys.get(symbol)
+
+    def get_bar(self, symbol: str, timestamp: str) -> Optional[Dict[str, str]]:
+        """Return the bar for (symbol, timestamp), or None if either is missing."""
+        series = self._series.get(symbol)
+        if series is None:
+            return None
+        bar = series.get(timestamp)
+        return bar if isinstance(bar, dict) else None
+
+    def iter_bars(
+        self, symbols: Iterable[str], timestamp: str
+    ) -> Iterable[Tuple[str, Optional[Dict[str, str]]]]:
+        """Yield (symbol, bar or None) for each requested symbol present in the file."""
+        for symbol in dict.fromkeys(symbols):
+            if symbol in self._series:
+                yield symbol, self.get_bar(symbol, timestamp)
+
+    def get_name(self, symbol: str) -> str:
+        return self._names.get(symbol, "")
+
+    def name_mapping(self) -> Dict[str, str]:
+        return dict(self._names)
+
+    def timestamps(self) -> FrozenSet[str]:
+        """All timestamps present in any symbol's series."""
+        return self._timestamps
+
+    def daily_dates(self) -> FrozenSet[str]:
+        """Dates present under a "Time Series (Daily)" key."""
+        return self._daily_dates
+
+
+_STORES: Dict[str, PriceStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_price_store(path: Union[str, Path]) -> PriceStore:
+    """Get the process-wide PriceStore for a merged file, reloading it if the file changed.
+
+    Args:
+        path: Path to a merged JSONL price file
+
+    Returns:
+        PriceStore indexed over the current contents of the file
+    """
+    key = str(Path(path).resolve())
+    store = _STORES.get(key)
+    if store is None:
+        with _STORES_LOCK:
+            store = _STORES.get(key)
+            if store is None:
+                store = PriceStore(key)
+                _STORES[key] = store
+    store.refresh()
+    return store
+
+
+def clear_price_stores() -> None:
+    """Drop every cached store, forcing the next lookup to re-read from disk."""
+    with _STORES_LOCK:
+        _STORES.clear()
@@ -14,6 +14,11 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 from tools.general_tools import get_config_value
+from tools.position_ledger import (append_ledger_record, get_ledger,
+                                   get_ledger_backend, get_position_file,
+                                   ledger_transaction, load_position_snapshot)
+from tools.price_store import get_price_store
+from tools.trading_calendar import TradingCalendar
 
 def _normalize_timestamp_str(ts: str) -> str:
     """
@@ -264,6 +269,57 @@ def _resolve_merged_file_path_for_date(
     return get_merged_file_path(market)
 
 
+_CALENDAR_CACHE: Dict[Tuple[str, str], Tuple[int, TradingCalendar]] = {}
+
+
+def _get_calendar_for_file(merged_file: Path, granularity: str = "daily") -> TradingCalendar:
+    """
+    Build (or reuse) the trading calendar of a merged file.
+    - "daily": every distinct date that has at least one bar
+    - "hourly": every intraday timestamp (date-only keys are skipped)
+    The calendar is rebuilt only when the underlying price store reloads the file.
+    """
+    store = get_price_store(merged_file)
+    key = (str(store.path), granularity)
+    cached = _CALENDAR_CACHE.get(key)
+    if cached is not None and cached[0] == store.version:
+        return cached[1]
+
+    if granularity == "hourly":
+        calendar = TradingCalendar(
+            _normalize_timestamp_str(ts) for ts in store.timestamps() if " " in ts
+        )
+    else:
+        calendar = TradingCalendar(ts.split(" ", 1)[0] for ts in store.timestamps())
+    _CALENDAR_CACHE[key] = (store.version, calendar)
+    return calendar
+
+
+def get_trading_calendar(
+    market: str = "us", granularity: str = "daily", merged_path: Optional[str] = None
+) -> TradingCalendar:
+    """Get the sorted trading calendar for a market and granularity.
+
+    Args:
+        market: Market type ("us", "cn", or "crypto")
+        granularity: "daily" for trading days, "hourly" for intraday trading timestamps
+        merged_path: Optional, custom merged.jsonl path; overrides the market's default file
+
+    Returns:
+        TradingCalendar supporting prev/next/range/contains lookups
+    """
+    if merged_path is not None:
+        merged_file = Path(merged_path)
+    elif market == "cn" and granularity == "hourly":
+        merged_file = Path(__file__).resolve().parents[1] / "data" / "A_stock" / "merged_hourly.jsonl"
+    else:
+        merged_file = get_merged_file_path(market)
+
+    if not merged_file.exists():
+        return TradingCalendar([])
+    return _get_calendar_for_file(merged_file, granularity)
+
+
 def is_trading_day(date: str, market: str = "us") -> bool:
     """Check if a given date is a trading day by looking up merged.jsonl.
 
@@ -307,27 +363,9 @@ def is_trading_day(date: str, market: str = "us") -> bool:
         return False
 
     try:
-        with open(merged_file_path, "r", encoding="utf-8") as f:
-            # Read first line to check if date exists
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    # Check for daily time series first
-                    time_series = data.get("Time Series (Daily)", {})
-                    if date in time_series:
-                        return True
-
-                    # If no daily data, check for hourly data (e.g., "Time Series (60min)")
-                    for key, value in data.items():
-                        if key.startswith("Time Series") and isinstance(value, dict):
-                            # Check if any hourly timestamp starts with the date
-                            for timestamp in value.keys():
-                                if timestamp.startswith(date):
-                                    return True
-                except json.JSONDecodeError:
-                    continue
-            # If we get here, checked all stocks and date was not found in any
-            return False
+        if " " in date:
+            return _get_calendar_for_file(merged_file_path, "hourly").contains(_normalize_timestamp_str(date))
+        return _get_calendar_for_file(merged_file_path, "daily").contains(date)
     except Exception as e:
         print(f"⚠️  Error checking trading day: {e}")
         return False
@@ -348,18 +386,8 @@ def get_all_trading_days(market: str = "us") -> List[str]:
         print(f"⚠️  Warning: {merged_file_path} not found")
         return []
 
-    trading_days = set()
     try:
-        with open(merged_file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    time_series = data.get("Time Series (Daily)", {})
-                    # Add all dates from this stock's time series
-                    trading_days.update(time_series.keys())
-                except json.JSONDecodeError:
-                    continue
-        return sorted(list(trading_days))
+        return sorted(get_price_store(merged_file_path).daily_dates())
     except Exception as e:
         print(f"⚠️  Error reading trading days: {e}")
         return []
@@ -379,33 +407,22 @@ def get_stock_name_mapping(market: str = "us") -> Dict[str, str]:
     if not merged_file_path.exists():
         return {}
 
-    name_map = {}
     try:
-        with open(merged_file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    meta = data.get("Meta Data", {})
-                    symbol = meta.get("2. Symbol")
-                    name = meta.get("2.1. Name", "")
-                    if symbol and name:
-                        name_map[symbol] = name
-                except json.JSONDecodeError:
-                    continue
-        return name_map
+        return get_price_store(merged_file_path).name_mapping()
     except Exception as e:
         print(f"⚠️  Error reading stock names: {e}")
         return {}
 
 
 def format_price_dict_with_names(
-    price_dict: Dict[str, Optional[float]], market: str = "us"
+    price_dict: Dict[str, Optional[float]], market: str = "us", name_map: Optional[Dict[str, str]] = None
 ) -> Dict[str, Optional[float]]:
     """Format price dictionary to include stock names for display.
 
     Args:
         price_dict: Original price dictionary with keys like "600519.SH_price"
         market: Market type ("us" or "cn")
+        name_map: Optional symbol -> name mapping; defaults to get_stock_name_mapping(market)
 
     Returns:
         New dictionary with keys like "600519.SH (Kweichow Moutai)_price" for CN market,
@@ -414,7 +431,8 @@ def format_price_dict_with_names(
     if market != "cn":
         return price_dict
 
-    name_map = get_stock_name_mapping(market)
+    if name_map is None:
+        name_map = get_stock_name_mapping(market)
     if not name_map:
         return price_dict
 
@@ -437,7 +455,7 @@ def format_price_dict_with_names(
 def get_yesterday_date(today_date: str, merged_path: Optional[str] = None, market: str = "us") -> str:
     """
     Get the previous trading day or time point for the input date.
-    Read all available trading times from merged.jsonl, then find the previous time for today_date.
+    Look up the previous time for today_date in the trading calendar built from merged.jsonl.
     
     Args:
         today_date: Date string, format YYYY-MM-DD or YYYY-MM-DD HH:MM:SS.
@@ -470,47 +488,10 @@ def get_yesterday_date(today_date: str, merged_path: Optional[str] = None, marke
             yesterday_dt = input_dt - timedelta(hours=1)
             return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
     
-    # Read all available trading times from merged.jsonl
-    all_timestamps = set()
-    
-    with merged_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            try:
-                doc = json.loads(line)
-                # Find all keys starting with "Time Series"
-                for key, value in doc.items():
-                    if key.startswith("Time Series"):
-                        if isinstance(value, dict):
-                            all_timestamps.update(value.keys())
-                        break
-            except Exception:
-                continue
-    
-    if not all_timestamps:
-        # If no timestamps found, fallback based on input type
-        if date_only:
-            yesterday_dt = input_dt - timedelta(days=1)
-            while yesterday_dt.weekday() >= 5:
-                yesterday_dt -= timedelta(days=1)
-            return yesterday_dt.strftime("%Y-%m-%d")
-        else:
-            yesterday_dt = input_dt - timedelta(hours=1)
-            return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Convert all timestamps to datetime objects and find max timestamp less than today_date
-    previous_timestamp = None
-    
-    for ts_str in all_timestamps:
-        try:
-            ts_dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-            if ts_dt < input_dt:
-                if previous_timestamp is None or ts_dt > previous_timestamp:
-                    previous_timestamp = ts_dt
-        except Exception:
-            continue
-    
+    # Previous entry in the sorted trading calendar (O(log n) bisect)
+    calendar = _get_calendar_for_file(merged_file, "daily" if date_only else "hourly")
+    previous_timestamp = calendar.prev(_normalize_timestamp_str(today_date))
+
     # If no earlier timestamp found, fallback based on input type
     if previous_timestamp is None:
         if date_only:
@@ -522,12 +503,7 @@ def get_yesterday_date(today_date: str, merged_path: Optional[str] = None, marke
             yesterday_dt = input_dt - timedelta(hours=1)
             return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
 
-    # Return result
-    if date_only:
-        return previous_timestamp.strftime("%Y-%m-%d")
-    else:
-        return previous_timestamp.strftime("%Y-%m-%d %H:%M:%S")
-
+    return previous_timestamp
 
 
 def get_open_prices(
@@ -544,7 +520,6 @@ def get_open_prices(
     Returns:
         Dictionary of {symbol_price: open_price or None}; value is None if date or symbol not found.
     """
-    wanted = set(symbols)
     results: Dict[str, Optional[float]] = {}
 
     merged_file = _resolve_merged_file_path_for_date(today_date, market, merged_path)
@@ -552,35 +527,15 @@ def get_open_prices(
     if not merged_file.exists():
         return results
 
-    with merged_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
+    store = get_price_store(merged_file)
+    for sym, bar in store.iter_bars(symbols, today_date):
+        if isinstance(bar, dict):
+            open_val = bar.get("1. buy price")
+
             try:
-                doc = json.loads(line)
+                results[f"{sym}_price"] = float(open_val) if open_val is not None else None
             except Exception:
-                continue
-            meta = doc.get("Meta Data", {}) if isinstance(doc, dict) else {}
-            sym = meta.get("2. Symbol")
-            if sym not in wanted:
-                continue
-            # Find all keys starting with "Time Series"
-            series = None
-            for key, value in doc.items():
-                if key.startswith("Time Series"):
-                    series = value
-                    break
-            if not isinstance(series, dict):
-                continue
-            bar = series.get(today_date)
-            
-            if isinstance(bar, dict):
-                open_val = bar.get("1. buy price")
-                
-                try:
-                    results[f"{sym}_price"] = float(open_val) if open_val is not None else None
-                except Exception:
-                    results[f"{sym}_price"] = None
+                results[f"{sym}_price"] = None
 
     return results
 
@@ -599,7 +554,6 @@ def get_yesterday_open_and_close_price(
     Returns:
         Tuple of (buy price dict, sell price dict); value is None if date or symbol not found.
     """
-    wanted = set(symbols)
     buy_results: Dict[str, Optional[float]] = {}
     sell_results: Dict[str, Optional[float]] = {}
 
@@ -610,78 +564,58 @@ def get_yesterday_open_and_close_price(
 
     yesterday_date = get_yesterday_date(today_date, merged_path=merged_path, market=market)
 
-    with merged_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
+    store = get_price_store(merged_file)
+    for sym, bar in store.iter_bars(symbols, yesterday_date):
+        # Try to get yesterday's buy and sell prices
+        if isinstance(bar, dict):
+            buy_val = bar.get("1. buy price")  # Buy price field
+            sell_val = bar.get("4. sell price")  # Sell price field
+
             try:
-                doc = json.loads(line)
+                buy_price = float(buy_val) if buy_val is not None else None
+                sell_price = float(sell_val) if sell_val is not None else None
+                buy_results[f"{sym}_price"] = buy_price
+                sell_results[f"{sym}_price"] = sell_price
             except Exception:
-                continue
-            meta = doc.get("Meta Data", {}) if isinstance(doc, dict) else {}
-            sym = meta.get("2. Symbol")
-            if sym not in wanted:
-                continue
-            # Find all keys starting with "Time Series"
-            series = None
-            for key, value in doc.items():
-                if key.startswith("Time Series"):
-                    series = value
-                    break
-            if not isinstance(series, dict):
-                continue
-
-            # Try to get yesterday's buy and sell prices
-            bar = series.get(yesterday_date)
-            if isinstance(bar, dict):
-                buy_val = bar.get("1. buy price")  # Buy price field
-                sell_val = bar.get("4. sell price")  # Sell price field
-
-                try:
-                    buy_price = float(buy_val) if buy_val is not None else None
-                    sell_price = float(sell_val) if sell_val is not None else None
-                    buy_results[f"{sym}_price"] = buy_price
-                    sell_results[f"{sym}_price"] = sell_price
-                except Exception:
-                    buy_results[f"{sym}_price"] = None
-                    sell_results[f"{sym}_price"] = None
-            else:
-                # If no data for yesterday, try to look back for nearest trading day
-                # raise ValueError(f"No data found for {sym} on {yesterday_date}")
-                # print(f"No data found for {sym} on {yesterday_date}")
-                buy_results[f'{sym}_price'] = None
-                sell_results[f'{sym}_price'] = None
-                # today_dt = datetime.strptime(today_date, "%Y-%m-%d")
-                # yesterday_dt = today_dt - timedelta(days=1)
-                # current_date = yesterday_dt
-                # found_data = False
+                buy_results[f"{sym}_price"] = None
+                sell_results[f"{sym}_price"] = None
+        else:
+            # If no data for yesterday, try to look back for nearest trading day
+            # raise ValueError(f"No data found for {sym} on {yesterday_date}")
+            # print(f"No data found for {sym} on {yesterday_date}")
+            buy_results[f'{sym}_price'] = None
+            sell_results[f'{sym}_price'] = None
+            # today_dt = datetime.strptime(today_date, "%Y-%m-%d")
+            # yesterday_dt = today_dt - timedelta(days=1)
+            # current_date = yesterday_dt
+            # found_data = False
+            
+            # # Look back at most 5 trading days
+            # for _ in range(5):
+            #     current_date -= timedelta(days=1)
+            #     # Skip weekends
+            #     while current_date.weekday() >= 5:
+            #         current_date -= timedelta(days=1)
                 
-                # # Look back at most 5 trading days
-                # for _ in range(5):
-                #     current_date -= timedelta(days=1)
-                #     # Skip weekends
-                #     while current_date.weekday() >= 5:
-                #         current_date -= timedelta(days=1)
+            #     check_date = current_date.strftime("%Y-%m-%d")
+            #     bar = series.get(check_date)
+            #     if isinstance(bar, dict):
+            #         buy_val = bar.get("1. buy price")
+            #         sell_val = bar.get("4. sell price")
                     
-                #     check_date = current_date.strftime("%Y-%m-%d")
-                #     bar = series.get(check_date)
-                #     if isinstance(bar, dict):
-                #         buy_val = bar.get("1. buy price")
-                #         sell_val = bar.get("4. sell price")
-                        
-                #         try:
-                #             buy_price = float(buy_val) if buy_val is not None else None
-                #             sell_price = float(sell_val) if sell_val is not None else None
-                #             buy_results[f'{sym}_price'] = buy_price
-                #             sell_results[f'{sym}_price'] = sell_price
-                #             found_data = True
-                #             break
-                #         except Exception:
-                #             continue
-                
-                # if not found_data:
-                #     buy_results[f'{sym}_price'] = None
-                #     sell_results[f'{sym}_price'] = None
+            #         try:
+            #             buy_price = float(buy_val) if buy_val is not None else None
+            #             sell_price = float(sell_val) if sell_val is not None else None
+            #             buy_results[f'{sym}_price'] = buy_price
+            #             sell_results[f'{sym}_price'] = sell_price
+            #             found_data = True
+            #             break
+            #         except Exception:
+            #             continue
+            
+            # if not found_data:
+            #     buy_results[f'{sym}_price'] = None
+            #     sell_results[f'{sym}_price'] = None
 
     return buy_results, sell_results
 
@@ -749,35 +683,32 @@ def get_today_init_position(today_date: str, signature: str) -> Dict[str, float]
     Returns:
         Dictionary of {symbol: weight}; returns empty dict if date not found.
     """
-    from tools.general_tools import get_config_value
-    import os
-
-    base_dir = Path(__file__).resolve().parents[1]
+    if get_ledger_backend() == "sqlite":
+        record = get_ledger().latest_before(signature, today_date)
+        return record.get("positions", {}) if record else {}
 
-    # Get log_path from config, default to "agent_data" for backward compatibility
-    log_path = get_config_value("LOG_PATH", "./data/agent_data")
-
-    # Handle different path formats:
-    # - If it's an absolute path (like temp directory), use it directly
-    # - If it's a relative path starting with "./data/", remove the prefix and prepend base_dir/data
-    # - Otherwise, treat as relative to base_dir/data
-    if os.path.isabs(log_path):
-        # Absolute path (like temp directory) - use directly
-        position_file = Path(log_path) / signature / "position" / "position.jsonl"
-    else:
-        if log_path.startswith("./data/"):
-            log_path = log_path[7:]  # Remove "./data/" prefix
-        position_file = base_dir / "data" / log_path / signature / "position" / "position.jsonl"
-#     position_file = base_dir / "data" / "agent_data" / signature / "position" / "position.jsonl"
+    position_file = get_position_file(signature)
 
     if not position_file.exists():
         print(f"Position file {position_file} does not exist")
         return {}
-    
-    # Get market type, intelligent judgment
-    market = get_market_type()
-    yesterday_date = get_yesterday_date(today_date, market=market)
-    
+
+    # Fast path: the ledger snapshot holds the last record and the last record of the day before it
+    snapshot = load_position_snapshot(position_file)
+    if snapshot is not None:
+        last, prev = snapshot["last"], snapshot["prev"]
+        if last is None:
+            return {}
+        last_date = last.get("date")
+        if last_date and last_date < today_date:
+            return last.get("positions", {})
+        if last_date == today_date:
+            if prev is None:
+                return {}
+            if prev.get("date") and prev.get("date") < today_date:
+                return prev.get("positions", {})
+
+    # Ledger extends past today (e.g. replaying an earlier date): scan the whole file
     max_id = -1
     latest_positions = {}
     all_records = []
@@ -803,6 +734,59 @@ def get_today_init_position(today_date: str, signature: str) -> Dict[str, float]
     return all_records[0].get("positions", {})
 
 
+def _latest_position_from_snapshot(
+    position_file: Path, today_date: str, market: str
+) -> Optional[Tuple[Dict[str, float], int]]:
+    """Answer get_latest_position from the ledger snapshot when the last record decides it.
+
+    The ledger is appended in trading order, so its last record is the newest one. Returns None
+    when the full scan is needed (the ledger extends past today_date, the last record has no
+    positions, or it falls between the previous trading timestamp and today).
+    """
+    snapshot = load_position_snapshot(position_file)
+    if snapshot is None:
+        return None
+    last = snapshot["last"]
+    if last is None:
+        return {}, -1
+    last_date = last.get("date")
+    positions = last.get("positions", {})
+    if not last_date or not positions:
+        return None
+    if last_date == today_date:
+        return positions, last.get("id", -1)
+
+    norm_last = _normalize_timestamp_str(last_date)
+    norm_today = _normalize_timestamp_str(today_date)
+    if norm_last >= norm_today:
+        return None
+    # Records of the previous trading day take precedence over anything dated after it
+    prev_date = get_yesterday_date(today_date, market=market)
+    if last_date != prev_date and norm_last > _normalize_timestamp_str(prev_date):
+        return None
+    return positions, last.get("id", -1)
+
+
+def _latest_position_from_ledger_db(
+    signature: str, today_date: str, market: str
+) -> Tuple[Dict[str, float], int]:
+    """get_latest_position over the SQLite ledger: the same three steps as the file scan, each an indexed query."""
+    ledger = get_ledger()
+    # Step 1: today's record with the largest id
+    record = ledger.latest_on_date(signature, today_date)
+    if record and record.get("positions"):
+        return record["positions"], record.get("id", -1)
+    # Step 2: previous trading day
+    record = ledger.latest_on_date(signature, get_yesterday_date(today_date, market=market))
+    if record and record.get("positions"):
+        return record["positions"], record.get("id", -1)
+    # Step 3: latest non-empty record before today
+    record = ledger.latest_before(signature, today_date, skip_empty=True)
+    if record:
+        return record.get("positions", {}), record.get("id", -1)
+    return {}, -1
+
+
 def get_latest_position(today_date: str, signature: str) -> Tuple[Dict[str, float], int]:
     """
     Get latest position. Read from ../data/agent_data/{signature}/position/position.jsonl.
@@ -818,32 +802,21 @@ def get_latest_position(today_date: str, signature: str) -> Tuple[Dict[str, floa
           - positions: Dict of {symbol: weight}; empty dict if no record found.
           - max_id: Max id of selected record; -1 if no record found.
     """
-    from tools.general_tools import get_config_value
-    import os
-
-    base_dir = Path(__file__).resolve().parents[1]
+    # Get market type, intelligent judgment
+    market = get_market_type()
 
-    # Get log_path from config, default to "agent_data" for backward compatibility
-    log_path = get_config_value("LOG_PATH", "./data/agent_data")
+    if get_ledger_backend() == "sqlite":
+        return _latest_position_from_ledger_db(signature, today_date, market)
 
-    # Handle different path formats:
-    # - If it's an absolute path (like temp directory), use it directly
-    # - If it's a relative path starting with "./data/", remove the prefix and prepend base_dir/data
-    # - Otherwise, treat as relative to base_dir/data
-    if os.path.isabs(log_path):
-        # Absolute path (like temp directory) - use directly
-        position_file = Path(log_path) / signature / "position" / "position.jsonl"
-    else:
-        if log_path.startswith("./data/"):
-            log_path = log_path[7:]  # Remove "./data/" prefix
-        position_file = base_dir / "data" / log_path / signature / "position" / "position.jsonl"
+    position_file = get_position_file(signature)
 
     if not position_file.exists():
         return {}, -1
 
-    # Get market type, intelligent judgment
-    market = get_market_type()
-    
+    fast = _latest_position_from_snapshot(position_file, today_date, market)
+    if fast is not None:
+        return fast
+
     # Step 1: Check today's records first
     max_id_today = -1
     latest_positions_today: Dict[str, float] = {}
@@ -936,36 +909,16 @@ def add_no_trade_record(today_date: str, signature: str):
         None
     """
     save_item = {}
-    current_position, current_action_id = get_latest_position(today_date, signature)
-    
-    save_item["date"] = today_date
-    save_item["id"] = current_action_id + 1
-    save_item["this_action"] = {"action": "no_trade", "symbol": "", "amount": 0}
-
-    save_item["positions"] = current_position
+    with ledger_transaction(signature):
+        current_position, current_action_id = get_latest_position(today_date, signature)
 
-    from tools.general_tools import get_config_value
-    import os
-
-    base_dir = Path(__file__).resolve().parents[1]
+        save_item["date"] = today_date
+        save_item["id"] = current_action_id + 1
+        save_item["this_action"] = {"action": "no_trade", "symbol": "", "amount": 0}
 
-    # Get log_path from config, default to "agent_data" for backward compatibility
-    log_path = get_config_value("LOG_PATH", "./data/agent_data")
-
-    # Handle different path formats:
-    # - If it's an absolute path (like temp directory), use it directly
-    # - If it's a relative path starting with "./data/", remove the prefix and prepend base_dir/data
-    # - Otherwise, treat as relative to base_dir/data
-    if os.path.isabs(log_path):
-        # Absolute path (like temp directory) - use directly
-        position_file = Path(log_path) / signature / "position" / "position.jsonl"
-    else:
-        if log_path.startswith("./data/"):
-            log_path = log_path[7:]  # Remove "./data/" prefix
-        position_file = base_dir / "data" / log_path / signature / "position" / "position.jsonl"
+        save_item["positions"] = current_position
 
-    with position_file.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(save_item) + "\n")
+        append_ledger_record(signature, save_item)
     return
 
 
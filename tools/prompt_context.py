@@ -0,0 +1,224 @@
+"""
+Precomputed price context for the agent system prompts.
+
+Building one system prompt asks the price tools for yesterday's open and close, today's open and,
+for A-shares, the stock names, each a separate lookup against the market's price file. A backtest
+asks the same questions for every timestamp of its range, so precompute_prompt_context answers
+them for the whole range at once: the previous trading time of every timestamp comes from one
+searchsorted over the trading calendar, and the open/close of every symbol at all of those times
+is gathered from the columnar arrays (tools/columnar_prices.py) in a single indexing step.
+
+The gathered (symbols x timestamps) matrices are shared by the range and indexed by
+(market, timestamp), so get_prompt_prices only turns one column into the dicts the prompts format.
+The dicts are identical to what get_yesterday_open_and_close_price, get_open_prices and
+format_price_dict_with_names return. Timestamps that were not precomputed, or whose price file
+changed since, fall back to those functions.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Add project root directory to Python path for running from subdirectories
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from tools.columnar_prices import ColumnarPrices, _pad_timestamp, load_columnar_prices
+from tools.price_tools import (_resolve_merged_file_path_for_date,
+                               format_price_dict_with_names, get_open_prices,
+                               get_stock_name_mapping, get_yesterday_date,
+                               get_yesterday_open_and_close_price)
+
+# (market, timestamp) -> (block, column)
+CACHE_MAX_ENTRIES = 50000
+
+
+class PromptPrices(NamedTuple):
+    """Price inputs of one system prompt, keyed like get_open_prices ("<symbol>_price")."""
+
+    yesterday_buy: Dict[str, Optional[float]]
+    yesterday_sell: Dict[str, Optional[float]]
+    today_buy: Dict[str, Optional[float]]
+    # Same as yesterday_sell / today_buy, with stock names in the keys for the CN market
+    yesterday_sell_display: Dict[str, Optional[float]]
+    today_buy_display: Dict[str, Optional[float]]
+
+
+class _RangeBlock:
+    """Prompt prices of every symbol of a price file at a range of timestamps (one column each)."""
+
+    def __init__(
+        self,
+        merged_file: Path,
+        prices: ColumnarPrices,
+        yesterday_open: np.ndarray,
+        yesterday_close: np.ndarray,
+        today_open: np.ndarray,
+        today_present: np.ndarray,
+        name_map: Optional[Dict[str, str]],
+    ):
+        self.merged_file = merged_file
+        self.prices = prices
+        self.row = {symbol: i for i, symbol in enumerate(prices.symbols)}
+        self.yesterday_open = yesterday_open
+        self.yesterday_close = yesterday_close
+        self.today_open = today_open
+        self.today_present = today_present
+        self.name_map = name_map
+
+
+_PROMPT_CACHE: "OrderedDict[Tuple[str, str], Tuple[_RangeBlock, int]]" = OrderedDict()
+_PROMPT_CACHE_LOCK = threading.Lock()
+
+
+def _columns(axis: np.ndarray, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(column, found) of each timestamp on a sorted timestamp axis."""
+    cols = np.searchsorted(axis, timestamps, side="left")
+    clipped = np.minimum(cols, len(axis) - 1)
+    found = (cols < len(axis)) & (axis[clipped] == timestamps)
+    return clipped, found
+
+
+def _previous_timestamps(axis: np.ndarray, timestamps: List[str], hourly: bool, market: str) -> np.ndarray:
+    """Previous trading time of each timestamp, as get_yesterday_date computes it."""
+    if hourly:
+        calendar = axis[np.char.str_len(axis) > 10]
+    else:
+        calendar = np.unique(axis.astype("U10"))
+    padded = np.array([_pad_timestamp(ts) for ts in timestamps], dtype=axis.dtype)
+    idx = np.searchsorted(calendar, padded, side="left") - 1
+    previous = calendar[np.maximum(idx, 0)] if len(calendar) else padded.copy()
+    # Nothing earlier on the calendar: get_yesterday_date steps back by weekday/hour instead
+    for k in np.flatnonzero(idx < 0):
+        previous[k] = get_yesterday_date(timestamps[k], market=market)
+    return previous
+
+
+def precompute_prompt_context(timestamps: Iterable[str], market: str = "us") -> int:
+    """Precompute the prompt prices of every symbol for a range of timestamps.
+
+    Args:
+        timestamps: Trading dates/times of the run, YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
+        market: Market type ("us", "cn", "crypto", ...)
+
+    Returns:
+        Number of timestamps cached; timestamps without a price file are left to the fallback
+    """
+    groups: Dict[Tuple[Path, bool], List[str]] = {}
+    for ts in dict.fromkeys(timestamps):
+        merged_file = _resolve_merged_file_path_for_date(ts, market)
+        groups.setdefault((merged_file, " " in ts), []).append(ts)
+
+    cached = 0
+    for (merged_file, hourly), group in groups.items():
+        if not merged_file.exists():
+            continue
+        prices = load_columnar_prices(merged_file)
+        if prices is None or len(prices.timestamps) == 0:
+            continue
+
+        axis = prices.timestamps
+        today = np.array([_pad_timestamp(ts) for ts in group], dtype=axis.dtype)
+        today_cols, today_found = _columns(axis, today)
+        yesterday_cols, yesterday_found = _columns(axis, _previous_timestamps(axis, group, hourly, market))
+
+        opens = prices.field("open")
+        closes = prices.field("close")
+        block = _RangeBlock(
+            merged_file,
+            prices,
+            yesterday_open=np.where(yesterday_found, opens[:, yesterday_cols], np.nan),
+            yesterday_close=np.where(yesterday_found, closes[:, yesterday_cols], np.nan),
+            today_open=np.where(today_found, opens[:, today_cols], np.nan),
+            today_present=prices.field("present")[:, today_cols] & today_found,
+            name_map=get_stock_name_mapping(market) if market == "cn" else None,
+        )
+
+        with _PROMPT_CACHE_LOCK:
+            for col, ts in enumerate(today):
+                key = (market, str(ts))
+                _PROMPT_CACHE[key] = (block, col)
+                _PROMPT_CACHE.move_to_end(key)
+            while len(_PROMPT_CACHE) > CACHE_MAX_ENTRIES:
+                _PROMPT_CACHE.popitem(last=False)
+        cached += len(group)
+    return cached
+
+
+def _cached_column(today_date: str, market: str) -> Optional[Tuple[_RangeBlock, int]]:
+    with _PROMPT_CACHE_LOCK:
+        entry = _PROMPT_CACHE.get((market, _pad_timestamp(today_date)))
+    if entry is None:
+        return None
+    block = entry[0]
+    # The columnar reader is replaced when the merged file changes; drop columns built from the old one
+    if load_columnar_prices(block.merged_file, build=False) is not block.prices:
+        return None
+    return entry
+
+
+def _value(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+def get_prompt_prices(today_date: str, symbols: List[str], market: str = "us") -> PromptPrices:
+    """Yesterday's open/close and today's open prices for a system prompt.
+
+    Args:
+        today_date: Date string, format YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
+        symbols: Symbols shown in the prompt
+        market: Market type ("us", "cn", "crypto", ...)
+
+    Returns:
+        PromptPrices, read from the precomputed context when available
+    """
+    entry = _cached_column(today_date, market)
+    if entry is None:
+        yesterday_buy, yesterday_sell = get_yesterday_open_and_close_price(today_date, symbols, market=market)
+        today_buy = get_open_prices(today_date, symbols, market=market)
+        return PromptPrices(
+            yesterday_buy,
+            yesterday_sell,
+            today_buy,
+            format_price_dict_with_names(yesterday_sell, market=market),
+            format_price_dict_with_names(today_buy, market=market),
+        )
+
+    block, col = entry
+    yesterday_open = block.yesterday_open[:, col].tolist()
+    yesterday_close = block.yesterday_close[:, col].tolist()
+    today_open = block.today_open[:, col].tolist()
+    today_present = block.today_present[:, col].tolist()
+
+    yesterday_buy: Dict[str, Optional[float]] = {}
+    yesterday_sell: Dict[str, Optional[float]] = {}
+    today_buy: Dict[str, Optional[float]] = {}
+    for symbol in dict.fromkeys(symbols):
+        i = block.row.get(symbol)
+        if i is None:
+            continue
+        key = f"{symbol}_price"
+        yesterday_buy[key] = _value(yesterday_open[i])
+        yesterday_sell[key] = _value(yesterday_close[i])
+        if today_present[i]:
+            today_buy[key] = _value(today_open[i])
+
+    return PromptPrices(
+        yesterday_buy,
+        yesterday_sell,
+        today_buy,
+        format_price_dict_with_names(yesterday_sell, market=market, name_map=block.name_map),
+        format_price_dict_with_names(today_buy, market=market, name_map=block.name_map),
+    )
+
+
+def clear_prompt_context() -> None:
+    """Drop all precomputed prompt prices."""
+    with _PROMPT_CACHE_LOCK:
+        _PROMPT_CACHE.clear()
@@ -0,0 +1,309 @@
+"""
+SQLite position ledger.
+
+All signatures under one LOG_PATH share a single database, {LOG_PATH}/positions.db, opened in WAL
+mode so readers never block the writer and many agents can trade concurrently:
+
+    positions(seq, signature, date, sort_date, id, this_action, positions)
+        one row per position.jsonl record; sort_date is the zero-padded timestamp used for
+        chronological comparisons, indexed on (signature, date, id) and (signature, sort_date, id)
+    trades(seq, signature, date, id, action, symbol, amount, price)
+        one row per buy/sell, indexed on (signature, date, symbol, action)
+
+Read-modify-write cycles run inside `transaction()` (BEGIN IMMEDIATE), which replaces the
+per-signature lock file used by the JSONL ledger. export_jsonl / import_jsonl convert to and from
+the position.jsonl format that the metrics and UI scripts read.
+
+Usage:
+    python tools/sqlite_ledger.py import --log-path ./data/agent_data --signature gpt-5
+    python tools/sqlite_ledger.py export --log-path ./data/agent_data --signature gpt-5
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+# Ensure project root is on sys.path when run as a script
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+LEDGER_DB_NAME = "positions.db"
+
+TRADE_ACTIONS = ("buy", "sell", "buy_crypto", "sell_crypto")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    signature TEXT NOT NULL,
+    date TEXT NOT NULL,
+    sort_date TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    this_action TEXT,
+    positions TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_positions_signature_date_id ON positions (signature, date, id);
+CREATE INDEX IF NOT EXISTS idx_positions_signature_sort_date_id ON positions (signature, sort_date, id);
+
+CREATE TABLE IF NOT EXISTS trades (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    signature TEXT NOT NULL,
+    date TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    amount REAL NOT NULL,
+    price REAL
+);
+CREATE INDEX IF NOT EXISTS idx_trades_signature_date_symbol ON trades (signature, date, symbol, action);
+"""
+
+
+def _sort_date(date: str) -> str:
+    from tools.price_tools import _normalize_timestamp_str
+
+    return _normalize_timestamp_str(date)
+
+
+def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+    record: Dict[str, Any] = {"date": row["date"], "id": row["id"]}
+    if row["this_action"] is not None:
+        record["this_action"] = json.loads(row["this_action"])
+    record["positions"] = json.loads(row["positions"])
+    return record
+
+
+class SqliteLedger:
+    """Position ledger for every signature under one log path, backed by SQLite in WAL mode."""
+
+    def __init__(self, db_path: Union[str, Path], timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.timeout = timeout
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a read-modify-write cycle atomically.
+
+        BEGIN IMMEDIATE takes the write lock up front, so two agents can never read the same latest
+        position and both append on top of it. Nested calls join the outer transaction.
+        """
+        conn = self._connect()
+        if self._local.depth > 0:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def append(self, signature: str, record: Dict[str, Any], price: Optional[float] = None) -> None:
+        """Insert one ledger record (and its trade row for buy/sell actions).
+
+        Args:
+            signature: Model name
+            record: {"date", "id", "this_action", "positions"} as written to position.jsonl
+            price: Execution price of the trade, if any
+        """
+        with self.transaction() as conn:
+            self._insert(conn, signature, record, price)
+
+    def _insert(
+        self, conn: sqlite3.Connection, signature: str, record: Dict[str, Any], price: Optional[float] = None
+    ) -> None:
+        date = record.get("date")
+        this_action = record.get("this_action")
+        conn.execute(
+            "INSERT INTO positions (signature, date, sort_date, id, this_action, positions) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                signature,
+                date,
+                _sort_date(date),
+                record.get("id", 0),
+                json.dumps(this_action) if this_action is not None else None,
+                json.dumps(record.get("positions", {})),
+            ),
+        )
+        if isinstance(this_action, dict) and this_action.get("action") in TRADE_ACTIONS:
+            conn.execute(
+                "INSERT INTO trades (signature, date, id, action, symbol, amount, price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    signature,
+                    date,
+                    record.get("id", 0),
+                    this_action["action"],
+                    this_action.get("symbol", ""),
+                    this_action.get("amount", 0),
+                    price,
+                ),
+            )
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def has_records(self, signature: str) -> bool:
+        row = self._connect().execute("SELECT 1 FROM positions WHERE signature = ? LIMIT 1", (signature,)).fetchone()
+        return row is not None
+
+    def latest_on_date(self, signature: str, date: str) -> Optional[Dict[str, Any]]:
+        """Record with the largest id dated exactly `date`."""
+        row = self._connect().execute(
+            "SELECT date, id, this_action, positions FROM positions WHERE signature = ? AND date = ? "
+            "ORDER BY id DESC LIMIT 1",
+            (signature, date),
+        ).fetchone()
+        return _row_to_record(row) if row else None
+
+    def latest_before(self, signature: str, date: str, skip_empty: bool = False) -> Optional[Dict[str, Any]]:
+        """Latest record (by timestamp, then id) strictly earlier than `date`.
+
+        Args:
+            signature: Model name
+            date: Upper bound, "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"
+            skip_empty: Ignore records whose positions are empty
+        """
+        query = "SELECT date, id, this_action, positions FROM positions WHERE signature = ? AND sort_date < ?"
+        if skip_empty:
+            query += " AND positions != '{}'"
+        query += " ORDER BY sort_date DESC, id DESC LIMIT 1"
+        row = self._connect().execute(query, (signature, _sort_date(date))).fetchone()
+        return _row_to_record(row) if row else None
+
+    def last_date(self, signature: str) -> Optional[str]:
+        """Latest record date of a signature, as written."""
+        row = self._connect().execute(
+            "SELECT date FROM positions WHERE signature = ? ORDER BY sort_date DESC, id DESC LIMIT 1", (signature,)
+        ).fetchone()
+        return row["date"] if row else None
+
+    def bought_amount(self, signature: str, date: str, symbol: str) -> float:
+        """Total quantity of `symbol` bought on `date`."""
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(amount), 0) AS total FROM trades "
+            "WHERE signature = ? AND date = ? AND symbol = ? AND action = 'buy'",
+            (signature, date, symbol),
+        ).fetchone()
+        total = row["total"]
+        return int(total) if float(total).is_integer() else total
+
+    def records(self, signature: str) -> List[Dict[str, Any]]:
+        """All records of a signature in insertion order."""
+        rows = self._connect().execute(
+            "SELECT date, id, this_action, positions FROM positions WHERE signature = ? ORDER BY seq", (signature,)
+        ).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+    # ------------------------------------------------------------------
+    # position.jsonl compatibility
+    # ------------------------------------------------------------------
+
+    def export_jsonl(self, signature: str, position_file: Union[str, Path]) -> int:
+        """Write a signature's records to a position.jsonl file (atomically).
+
+        Returns:
+            Number of records written
+        """
+        position_file = Path(position_file)
+        position_file.parent.mkdir(parents=True, exist_ok=True)
+        records = self.records(signature)
+        tmp_path = position_file.with_name(f"{position_file.name}.{os.getpid()}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, position_file)
+        return len(records)
+
+    def import_jsonl(self, signature: str, position_file: Union[str, Path], replace: bool = True) -> int:
+        """Load a position.jsonl file into the database.
+
+        Args:
+            signature: Model name
+            position_file: Path to position.jsonl
+            replace: Delete the signature's existing rows first
+
+        Returns:
+            Number of records imported
+        """
+        count = 0
+        with self.transaction() as conn:
+            if replace:
+                conn.execute("DELETE FROM positions WHERE signature = ?", (signature,))
+                conn.execute("DELETE FROM trades WHERE signature = ?", (signature,))
+            with open(position_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except Exception:
+                        continue
+                    if not isinstance(record, dict) or not record.get("date"):
+                        continue
+                    self._insert(conn, signature, record)
+                    count += 1
+        return count
+
+
+def main():
+    from tools.position_ledger import get_ledger, get_position_file
+
+    parser = argparse.ArgumentParser(description="Convert between position.jsonl and the SQLite position ledger")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("--log-path", default="./data/agent_data", help="Log path holding the signature directories")
+    parser.add_argument("--signature", required=True, help="Model signature")
+    args = parser.parse_args()
+
+    ledger = get_ledger(args.log_path)
+    position_file = get_position_file(args.signature, args.log_path)
+    if args.command == "import":
+        if not position_file.exists():
+            print(f"❌ Position file not found: {position_file}")
+            sys.exit(1)
+        count = ledger.import_jsonl(args.signature, position_file)
+        print(f"✅ Imported {count} records from {position_file} into {ledger.db_path}")
+    else:
+        count = ledger.export_jsonl(args.signature, position_file)
+        print(f"✅ Exported {count} records from {ledger.db_path} to {position_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Concurrency limits for the tool calls of an agent step.
+
+When the model asks for several tools in one turn, the agent graph (langchain's create_agent)
+starts every call as its own task, so independent lookups (get_price_local, get_information, ...)
+already run side by side and a step takes as long as its slowest call. Nothing bounds them though,
+and trades run side by side too. limit_tool_concurrency wraps an agent's tools so that:
+
+- read-only tools share one semaphore per MCP server, capping the calls in flight to that server
+  (`tool_concurrency`, 4 by default);
+- trade tools (buy, sell, place_orders, buy_crypto, sell_crypto) take a lock per signature and run
+  one at a time, in the order the model issued them. Each trade reads the latest position and
+  appends a new one, so two concurrent trades would both start from the same position.
+
+The trade lock is taken for the signature of the calling agent (tools/agent_context.py), so one
+wrapped tool list can be shared by several agents, as the in-process runner in main_parrallel.py
+does; its per-server caps then apply to all of them together. Tools bound in process (sync
+functions) run in a worker thread, like langchain runs them anyway.
+"""
+
+import asyncio
+import functools
+import weakref
+from typing import Any, Dict, List, Optional, Union
+
+from tools.agent_context import get_context_value
+from tools.local_tools import load_local_tools
+
+TRADE_TOOLS = frozenset({"buy", "sell", "place_orders", "buy_crypto", "sell_crypto"})
+DEFAULT_TOOL_CONCURRENCY = 4
+
+# event loop -> {signature: lock}
+_TRADE_LOCKS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_trade_lock(signature: str) -> asyncio.Lock:
+    """Lock serializing the trade tool calls of one signature in the running event loop."""
+    locks = _TRADE_LOCKS.setdefault(asyncio.get_running_loop(), {})
+    lock = locks.get(signature)
+    if lock is None:
+        lock = locks[signature] = asyncio.Lock()
+    return lock
+
+
+def _server_limit(tool_concurrency: Union[int, Dict[str, int], None], server: str) -> int:
+    if isinstance(tool_concurrency, dict):
+        limit = tool_concurrency.get(server, tool_concurrency.get("default", DEFAULT_TOOL_CONCURRENCY))
+    else:
+        limit = tool_concurrency if tool_concurrency is not None else DEFAULT_TOOL_CONCURRENCY
+    return max(1, int(limit))
+
+
+class ToolCallLimiter:
+    """Per-server semaphores and the signature's trade lock for one agent's tools."""
+
+    def __init__(self, signature: Optional[str] = None, tool_concurrency: Union[int, Dict[str, int], None] = None):
+        """
+        Args:
+            signature: Signature whose trade calls are serialized when the call carries no agent
+                context (None for a tool list shared by several agents)
+            tool_concurrency: Maximum concurrent calls per MCP server, either one number for every
+                server or {server name: limit} (with an optional "default" entry)
+        """
+        self.signature = signature
+        self.tool_concurrency = tool_concurrency
+        # Created lazily, inside the event loop that runs the tools
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, server: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(server)
+        if semaphore is None:
+            semaphore = self._semaphores[server] = asyncio.Semaphore(_server_limit(self.tool_concurrency, server))
+        return semaphore
+
+    def wrap(self, tool: Any, server: str) -> Any:
+        """Route a LangChain tool's async calls through the limits (the tool is modified in place)."""
+        call = tool.coroutine
+        if call is None:
+            func = tool.func
+
+            async def call(*args: Any, **kwargs: Any) -> Any:
+                return await asyncio.to_thread(func, *args, **kwargs)
+
+            call = functools.wraps(func)(call)
+
+        is_trade = tool.name in TRADE_TOOLS
+
+        @functools.wraps(call)
+        async def limited(*args: Any, **kwargs: Any) -> Any:
+            if is_trade:
+                signature = get_context_value("SIGNATURE") or self.signature or ""
+                async with get_trade_lock(signature), self._semaphore(server):
+                    return await call(*args, **kwargs)
+            async with self._semaphore(server):
+                return await call(*args, **kwargs)
+
+        tool.coroutine = limited
+        return tool
+
+
+async def load_server_tools(client: Any, local_servers: Optional[Dict[str, str]] = None) -> Dict[str, List[Any]]:
+    """An agent's tools grouped by MCP server.
+
+    Args:
+        client: MCP client from create_mcp_client (or a shared MultiServerMCPClient)
+        local_servers: {server name: tool module} bound in process, as returned by split_mcp_config
+
+    Returns:
+        {server name: [LangChain tools]}
+    """
+    tools: Dict[str, List[Any]] = {}
+    for server in client.connections:
+        tools[server] = await client.get_tools(server_name=server)
+    for server, module_path in (local_servers or {}).items():
+        tools[server] = await load_local_tools({server: module_path})
+    return tools
+
+
+def limit_tool_concurrency(
+    tools_by_server: Dict[str, List[Any]],
+    signature: Optional[str] = None,
+    tool_concurrency: Union[int, Dict[str, int], None] = None,
+) -> List[Any]:
+    """Flatten an agent's tools, wrapped with the per-server caps and the trade lock.
+
+    Args:
+        tools_by_server: {server name: [LangChain tools]}, as returned by load_server_tools
+        signature: Agent signature (None for tools shared by several agents)
+        tool_concurrency: Maximum concurrent calls per server (see ToolCallLimiter)
+
+    Returns:
+        List of tools for create_agent
+    """
+    limiter = ToolCallLimiter(signature, tool_concurrency)
+    return [limiter.wrap(tool, server) for server, tools in tools_by_server.items() for tool in tools]
@@ -0,0 +1,84 @@
+"""
+Sorted trading-calendar index.
+
+A TradingCalendar is an immutable, sorted array of zero-padded timestamp strings
+("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"). Zero-padded timestamps sort chronologically as plain
+strings, so every lookup is a bisect over the array instead of a parse of the whole price file.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Optional
+
+
+class TradingCalendar:
+    """Sorted set of trading days or trading timestamps with O(log n) lookups."""
+
+    def __init__(self, timestamps: Iterable[str]):
+        self._timestamps: List[str] = sorted(set(timestamps))
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._timestamps)
+
+    def __contains__(self, ts: str) -> bool:
+        return self.contains(ts)
+
+    def __repr__(self) -> str:
+        if not self._timestamps:
+            return "TradingCalendar([])"
+        return f"TradingCalendar({self._timestamps[0]} .. {self._timestamps[-1]}, n={len(self._timestamps)})"
+
+    @property
+    def first(self) -> Optional[str]:
+        return self._timestamps[0] if self._timestamps else None
+
+    @property
+    def last(self) -> Optional[str]:
+        return self._timestamps[-1] if self._timestamps else None
+
+    def contains(self, ts: str) -> bool:
+        """Check whether ts is a trading day / trading timestamp."""
+        i = bisect_left(self._timestamps, ts)
+        return i < len(self._timestamps) and self._timestamps[i] == ts
+
+    def prev(self, ts: str) -> Optional[str]:
+        """Latest entry strictly earlier than ts, or None if there is none."""
+        i = bisect_left(self._timestamps, ts)
+        return self._timestamps[i - 1] if i > 0 else None
+
+    def next(self, ts: str) -> Optional[str]:
+        """Earliest entry strictly later than ts, or None if there is none."""
+        i = bisect_right(self._timestamps, ts)
+        return self._timestamps[i] if i < len(self._timestamps) else None
+
+    def range(
+        self, start: Optional[str], end: Optional[str], include_start: bool = True, include_end: bool = True
+    ) -> List[str]:
+        """Entries between start and end.
+
+        Args:
+            start: Lower bound, or None for no lower bound
+            end: Upper bound, or None for no upper bound
+            include_start: Whether an entry equal to start is included
+            include_end: Whether an entry equal to end is included
+
+        Returns:
+            Sorted list of matching entries
+        """
+        if start is None:
+            lo = 0
+        elif include_start:
+            lo = bisect_left(self._timestamps, start)
+        else:
+            lo = bisect_right(self._timestamps, start)
+
+        if end is None:
+            hi = len(self._timestamps)
+        elif include_end:
+            hi = bisect_right(self._timestamps, end)
+        else:
+            hi = bisect_left(self._timestamps, end)
+
+        return self._timestamps[lo:hi] if lo < hi else []